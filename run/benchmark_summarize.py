@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from report import Report
+from wptreport import write_report
+
+"""
+benchmark_summarize.py measures how long `Report.summarize` takes to parse
+"chunks" which have no metadata (e.g. those of a resumed run) with different
+numbers of processes, using generated results.
+
+    ./run/benchmark_summarize.py --tests 40000 --subtests 25 --chunks 16
+"""
+
+
+def generate_chunks(directory, tests, subtests, chunks):
+    for chunk_offset in range(1, chunks + 1):
+        results = (
+            {
+                'test': '/generated/%s/%s.html' % (chunk_offset, index),
+                'status': 'OK',
+                'message': None,
+                'subtests': [
+                    {
+                        'name': 'subtest %s' % subtest,
+                        'status': 'PASS' if subtest % 3 else 'FAIL',
+                        'message': None if subtest % 3 else (
+                            'assert_equals: expected 1 but got 2'
+                        )
+                    }
+                    for subtest in range(subtests)
+                ]
+            }
+            for index in range(tests // chunks)
+        )
+
+        filename = os.path.join(directory,
+                                '%s-of-%s.json' % (chunk_offset, chunks))
+        with open(filename, 'w') as handle:
+            write_report(handle, results)
+
+
+def measure(source, chunks, processes):
+    '''Summarize a copy of the generated "chunks" (so that none has
+    metadata). Returns the summary and the number of seconds taken.'''
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        os.rmdir(directory)
+        shutil.copytree(source, directory)
+
+        start = time.time()
+        summary = Report(chunks, directory).summarize(processes=processes)
+
+        return summary, time.time() - start
+    finally:
+        shutil.rmtree(directory)
+
+
+def main(args):
+    source = tempfile.mkdtemp()
+
+    try:
+        print('Generating %s tests with %s subtests in %s chunks' % (
+            args.tests, args.subtests, args.chunks
+        ))
+        generate_chunks(source, args.tests, args.subtests, args.chunks)
+
+        expected, baseline = measure(source, args.chunks, 1)
+        print('1 process: %.2f seconds' % baseline)
+
+        processes = 2
+        while processes <= args.max_processes:
+            summary, duration = measure(source, args.chunks, processes)
+
+            assert summary == expected, (
+                'Summary with %s processes differs' % processes)
+
+            print('%s processes: %.2f seconds (%.1fx)' % (
+                processes, duration, baseline / duration
+            ))
+            processes *= 2
+    finally:
+        shutil.rmtree(source)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the summarizing of report chunks.'
+    )
+    parser.add_argument(
+        '--tests',
+        help='Number of generated tests.',
+        type=int,
+        default=40000
+    )
+    parser.add_argument(
+        '--subtests',
+        help='Number of subtests of each generated test.',
+        type=int,
+        default=25
+    )
+    parser.add_argument(
+        '--chunks',
+        help='Number of chunks.',
+        type=int,
+        default=16
+    )
+    parser.add_argument(
+        '--max-processes',
+        help='Largest number of processes measured.',
+        type=int,
+        default=multiprocessing.cpu_count()
+    )
+    main(parser.parse_args())
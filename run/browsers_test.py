@@ -17,6 +17,10 @@ REQUIRED_PLATFORM_FIELDS = {
     'os_name': ('linux', 'windows', 'macos'),
     'os_version': None,
 }
+OPTIONAL_PLATFORM_FIELDS = {
+    'sauce': (True, False),
+    'headless': (True, False),
+}
 
 
 class TestBrowsers(unittest.TestCase):
@@ -49,6 +53,24 @@ class TestBrowsers(unittest.TestCase):
                         'Field has invalid value: %s (platform %s)'
                         % (key, platform_id))
 
+    def test_optional_fields_have_valid_values(self):
+        for platform_id, platform_info in self.browsers.items():
+            for key, valid_values in OPTIONAL_PLATFORM_FIELDS.items():
+                if key not in platform_info:
+                    continue
+
+                self.assertTrue(
+                    platform_info[key] in valid_values,
+                    'Field has invalid value: %s (platform %s)'
+                    % (key, platform_id))
+
+    def test_sauce_platforms_are_not_headless(self):
+        for platform_id, platform_info in self.browsers.items():
+            self.assertFalse(
+                platform_info.get('sauce') and platform_info.get('headless'),
+                'Sauce platforms cannot be run headless (platform %s)'
+                % platform_id)
+
     def test_no_two_browser_configs_are_equal(self):
         for first_platform_id, first_platform in self.browsers.items():
             identical_platforms = [
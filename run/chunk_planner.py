@@ -0,0 +1,77 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import heapq
+import json
+
+"""
+chunk_planner.py divides a set of WPT tests into "chunks" of approximately
+equal expected running time, based on the durations of previous runs (see
+durations.py).
+"""
+
+# Test types executed by `wpt run` by default
+TEST_TYPES = ('testharness', 'reftest', 'wdspec')
+
+# Expected duration (in seconds) of tests when no historical data is available
+DEFAULT_DURATION = 1.0
+
+
+def read_manifest_tests(filename, path=''):
+    '''Retrieve the IDs of all tests described by a WPT manifest file,
+    optionally limited to those beneath a given path.'''
+
+    with open(filename) as handle:
+        manifest = json.load(handle)
+
+    prefix = '/' + path.lstrip('/')
+    tests = set()
+
+    for test_type in TEST_TYPES:
+        for items in manifest['items'].get(test_type, {}).values():
+            for item in items:
+                test = item[0]
+
+                if test.startswith(prefix):
+                    tests.add(test)
+
+    return sorted(tests)
+
+
+def estimate_durations(tests, durations):
+    '''Assign an expected duration to every test. Tests which have no
+    historical data are assumed to take the median duration.'''
+
+    known = sorted(durations[test] for test in tests if test in durations)
+
+    if known:
+        default = known[len(known) // 2]
+    else:
+        default = DEFAULT_DURATION
+
+    return dict((test, durations.get(test, default)) for test in tests)
+
+
+def plan_chunks(tests, durations, total_chunks):
+    '''Divide a list of tests into `total_chunks` lists with approximately
+    equal expected running time (using the "longest processing time first"
+    heuristic).
+
+    Returns a list of `(expected_duration, tests)` tuples, one per chunk.'''
+
+    expected = estimate_durations(tests, durations)
+    by_duration = sorted(tests, key=lambda test: (-expected[test], test))
+
+    heap = [(0., chunk_index) for chunk_index in range(total_chunks)]
+    chunks = [[] for _ in range(total_chunks)]
+    totals = [0.] * total_chunks
+
+    for test in by_duration:
+        total, chunk_index = heapq.heappop(heap)
+        chunks[chunk_index].append(test)
+        totals[chunk_index] = total + expected[test]
+        heapq.heappush(heap, (totals[chunk_index], chunk_index))
+
+    return [(totals[index], sorted(chunks[index]))
+            for index in range(total_chunks)]
@@ -0,0 +1,94 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import chunk_planner
+
+
+class TestChunkPlanner(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_manifest_tests(self):
+        name = os.path.join(self.tmp_dir, 'MANIFEST.json')
+        with open(name, 'w') as handle:
+            json.dump({
+                'items': {
+                    'testharness': {
+                        'dom/a.html': [['/dom/a.html', {}]],
+                        'dom/b.any.js': [
+                            ['/dom/b.any.html', {}],
+                            ['/dom/b.any.worker.html', {}]
+                        ]
+                    },
+                    'reftest': {
+                        'css/c.html': [['/css/c.html', [], {}]]
+                    },
+                    'manual': {
+                        'dom/d-manual.html': [['/dom/d-manual.html', {}]]
+                    },
+                    'support': {
+                        'dom/common.js': [[None, {}]]
+                    }
+                },
+                'version': 4
+            }, handle)
+
+        self.assertEqual(chunk_planner.read_manifest_tests(name), [
+            '/css/c.html',
+            '/dom/a.html',
+            '/dom/b.any.html',
+            '/dom/b.any.worker.html'
+        ])
+        self.assertEqual(chunk_planner.read_manifest_tests(name, 'css'), [
+            '/css/c.html'
+        ])
+
+    def test_estimate_durations(self):
+        durations = {'/a.html': 1, '/b.html': 2, '/c.html': 9}
+
+        self.assertEqual(
+            chunk_planner.estimate_durations(
+                ['/a.html', '/b.html', '/c.html', '/d.html'], durations
+            ),
+            {'/a.html': 1, '/b.html': 2, '/c.html': 9, '/d.html': 2}
+        )
+        self.assertEqual(
+            chunk_planner.estimate_durations(['/a.html'], {}),
+            {'/a.html': chunk_planner.DEFAULT_DURATION}
+        )
+
+    def test_plan_chunks(self):
+        durations = {
+            '/html/slow.html': 10,
+            '/html/a.html': 4,
+            '/html/b.html': 3,
+            '/dom/a.html': 2,
+            '/dom/b.html': 1,
+        }
+
+        plan = chunk_planner.plan_chunks(sorted(durations), durations, 2)
+
+        self.assertEqual(plan, [
+            (10, ['/html/slow.html']),
+            (10, ['/dom/a.html', '/dom/b.html', '/html/a.html',
+                  '/html/b.html'])
+        ])
+
+    def test_plan_chunks_more_chunks_than_tests(self):
+        plan = chunk_planner.plan_chunks(['/a.html'], {}, 3)
+
+        self.assertEqual([tests for _, tests in plan], [['/a.html'], [], []])
+
+
+if __name__ == '__main__':
+    unittest.main()
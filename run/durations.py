@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+"""
+durations.py maintains a per-platform database of the duration and status of
+every test, keyed by WPT revision. The data is harvested from the raw
+(mozlog-formatted) logs written by `wpt run`.
+
+To list the slowest tests (or directories) of the most recent run:
+
+    ./run/durations.py $BUILD_PATH/durations/chrome-63.0-linux.sqlite
+    ./run/durations.py $BUILD_PATH/durations/chrome-63.0-linux.sqlite \\
+        --directories --depth 2
+"""
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    sha TEXT PRIMARY KEY,
+    recorded_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    sha TEXT NOT NULL,
+    test TEXT NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    status TEXT,
+    PRIMARY KEY (sha, test)
+) WITHOUT ROWID;
+'''
+
+
+def get_store_path(build_path, platform_id):
+    return os.path.join(build_path, 'durations', '%s.sqlite' % platform_id)
+
+
+def read_raw_log(filename):
+    '''Iterate over the `(test, duration_ms, status)` tuples described by a
+    raw log file, one line at a time.'''
+
+    started = {}
+
+    with open(filename) as handle:
+        for line in handle:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+
+            if not isinstance(data, dict):
+                continue
+
+            action = data.get('action')
+
+            if action == 'test_start':
+                started[data['test']] = data['time']
+            elif action == 'test_end' and data['test'] in started:
+                elapsed = data['time'] - started.pop(data['test'])
+                yield data['test'], elapsed, data.get('status')
+
+
+def get_directory(test, depth):
+    parts = test.split('/')[1:-1]
+
+    return '/%s/' % '/'.join(parts[:depth]) if parts else '/'
+
+
+class DurationStore(object):
+    '''A database of test durations and statuses for a single platform.'''
+
+    def __init__(self, filename):
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def add_raw_log(self, sha, filename):
+        '''Record the results described by a raw log file. Results for tests
+        which have already been recorded for the given revision are replaced.
+
+        Returns the number of results recorded.'''
+
+        rows = ((sha, test, duration_ms, status)
+                for test, duration_ms, status in read_raw_log(filename))
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO runs (sha, recorded_at) VALUES (?, ?)',
+                (sha, time.time())
+            )
+            cursor = self._connection.executemany(
+                'INSERT OR REPLACE INTO results '
+                '(sha, test, duration_ms, status) VALUES (?, ?, ?, ?)',
+                rows
+            )
+
+        return cursor.rowcount
+
+    def shas(self):
+        '''List the recorded revisions, most recently recorded first.'''
+
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT sha FROM runs ORDER BY recorded_at DESC'
+            ).fetchall()
+
+        return [sha for sha, in rows]
+
+    def latest_sha(self, exclude=None):
+        for sha in self.shas():
+            if sha != exclude:
+                return sha
+
+        return None
+
+    def results(self, sha):
+        '''Retrieve a dictionary mapping test IDs to `(duration_ms, status)`
+        tuples for the given revision.'''
+
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT test, duration_ms, status FROM results WHERE sha = ?',
+                (sha,)
+            ).fetchall()
+
+        return dict((test, (duration_ms, status))
+                    for test, duration_ms, status in rows)
+
+    def durations(self, sha):
+        '''Retrieve a dictionary mapping test IDs to durations (in seconds)
+        for the given revision.'''
+
+        return dict((test, duration_ms / 1000.)
+                    for test, (duration_ms, _) in self.results(sha).items())
+
+    def history(self, test):
+        '''List the `(sha, duration_ms, status)` results recorded for a test,
+        most recently recorded first.'''
+
+        with self._lock:
+            return self._connection.execute(
+                'SELECT results.sha, duration_ms, status FROM results '
+                'JOIN runs ON runs.sha = results.sha WHERE test = ? '
+                'ORDER BY recorded_at DESC',
+                (test,)
+            ).fetchall()
+
+    def slowest_tests(self, sha, limit=20):
+        '''List the `(test, duration_ms, status)` results of the slowest tests
+        for the given revision.'''
+
+        with self._lock:
+            return self._connection.execute(
+                'SELECT test, duration_ms, status FROM results '
+                'WHERE sha = ? ORDER BY duration_ms DESC, test LIMIT ?',
+                (sha, limit)
+            ).fetchall()
+
+    def slowest_directories(self, sha, limit=20, depth=1):
+        '''List the `(directory, total_duration_ms, test_count)` totals of the
+        slowest directories for the given revision.'''
+
+        totals = {}
+
+        for test, (duration_ms, _) in self.results(sha).items():
+            directory = get_directory(test, depth)
+            total, count = totals.get(directory, (0, 0))
+            totals[directory] = (total + duration_ms, count + 1)
+
+        ordered = sorted(
+            totals.items(), key=lambda item: (-item[1][0], item[0])
+        )
+
+        return [(directory, total, count)
+                for directory, (total, count) in ordered[:limit]]
+
+
+def format_duration(duration_ms):
+    return '%.1fs' % (duration_ms / 1000.)
+
+
+def main(args):
+    store = DurationStore(args.store)
+    sha = args.sha or store.latest_sha()
+
+    if sha is None:
+        print('No results recorded in %s' % args.store)
+        return
+
+    print('Results for WPT revision %s' % sha)
+
+    if args.directories:
+        for directory, total, count in store.slowest_directories(
+                sha, args.limit, args.depth):
+            print('%10s  %6d tests  %s' % (
+                format_duration(total), count, directory
+            ))
+    else:
+        for test, duration_ms, status in store.slowest_tests(sha, args.limit):
+            print('%10s  %-7s  %s' % (
+                format_duration(duration_ms), status, test
+            ))
+
+    store.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='List the slowest tests (or directories) of a run.'
+    )
+    parser.add_argument(
+        'store',
+        help='Path to the duration database of a platform.'
+    )
+    parser.add_argument(
+        '--sha',
+        help='WPT revision to report on. Defaults to the most recent run.'
+    )
+    parser.add_argument(
+        '--directories',
+        help='Report the total duration of directories instead of tests.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--depth',
+        help='Number of path segments which identify a directory.',
+        type=int,
+        default=1
+    )
+    parser.add_argument(
+        '--limit',
+        help='Maximum number of entries to list.',
+        type=int,
+        default=20
+    )
+    main(parser.parse_args())
@@ -0,0 +1,138 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import durations
+
+
+class TestDurationStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = durations.DurationStore(
+            durations.get_store_path(self.tmp_dir, 'chrome-63.0-linux')
+        )
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def write_raw_log(self, name, tests):
+        '''Write a raw log in which each test starts immediately after its
+        predecessor ends.'''
+
+        lines = ['not json', json.dumps({'action': 'suite_start', 'time': 0})]
+        now = 0
+
+        for test, duration_ms, status in tests:
+            lines.append(json.dumps({
+                'action': 'test_start', 'test': test, 'time': now
+            }))
+            now += duration_ms
+            lines.append(json.dumps({
+                'action': 'test_end', 'test': test, 'time': now,
+                'status': status
+            }))
+
+        full_name = os.path.join(self.tmp_dir, name)
+        with open(full_name, 'w') as handle:
+            handle.write('\n'.join(lines))
+
+        return full_name
+
+    def test_read_raw_log(self):
+        name = self.write_raw_log('a.log', [
+            ('/a.html', 2000, 'OK'),
+            ('/b.html', 250, 'TIMEOUT'),
+        ])
+        with open(name, 'a') as handle:
+            handle.write('\n' + json.dumps({
+                'action': 'test_start', 'test': '/c.html', 'time': 5000
+            }))
+
+        self.assertEqual(list(durations.read_raw_log(name)), [
+            ('/a.html', 2000, 'OK'),
+            ('/b.html', 250, 'TIMEOUT'),
+        ])
+
+    def test_get_directory(self):
+        test = '/html/semantics/forms/a.html'
+
+        self.assertEqual(durations.get_directory(test, 1), '/html/')
+        self.assertEqual(durations.get_directory(test, 2), '/html/semantics/')
+        self.assertEqual(durations.get_directory('/a.html', 1), '/')
+
+    def test_add_raw_log(self):
+        count = self.store.add_raw_log('deadbeef', self.write_raw_log(
+            'a.log', [('/a.html', 2000, 'OK'), ('/b.html', 250, 'TIMEOUT')]
+        ))
+
+        self.assertEqual(count, 2)
+        self.assertEqual(self.store.shas(), ['deadbeef'])
+        self.assertEqual(self.store.results('deadbeef'), {
+            '/a.html': (2000, 'OK'),
+            '/b.html': (250, 'TIMEOUT'),
+        })
+        self.assertEqual(self.store.durations('deadbeef'), {
+            '/a.html': 2.0,
+            '/b.html': 0.25,
+        })
+
+    def test_add_raw_log_replaces_results(self):
+        self.store.add_raw_log('deadbeef', self.write_raw_log(
+            'a.log', [('/a.html', 2000, 'CRASH'), ('/b.html', 250, 'OK')]
+        ))
+        self.store.add_raw_log('deadbeef', self.write_raw_log(
+            'b.log', [('/a.html', 1000, 'OK')]
+        ))
+
+        self.assertEqual(self.store.results('deadbeef'), {
+            '/a.html': (1000, 'OK'),
+            '/b.html': (250, 'OK'),
+        })
+
+    def test_latest_sha_and_history(self):
+        self.store.add_raw_log('deadbeef', self.write_raw_log(
+            'a.log', [('/a.html', 2000, 'OK')]
+        ))
+        self.store.add_raw_log('c0ffee', self.write_raw_log(
+            'b.log', [('/a.html', 3000, 'TIMEOUT')]
+        ))
+
+        self.assertEqual(self.store.latest_sha(), 'c0ffee')
+        self.assertEqual(self.store.latest_sha(exclude='c0ffee'), 'deadbeef')
+        self.assertEqual(self.store.history('/a.html'), [
+            ('c0ffee', 3000, 'TIMEOUT'),
+            ('deadbeef', 2000, 'OK'),
+        ])
+
+    def test_latest_sha_empty(self):
+        self.assertIsNone(self.store.latest_sha())
+
+    def test_slowest(self):
+        self.store.add_raw_log('deadbeef', self.write_raw_log('a.log', [
+            ('/dom/a.html', 100, 'OK'),
+            ('/html/a.html', 300, 'OK'),
+            ('/html/b.html', 200, 'OK'),
+            ('/dom/b.html', 400, 'OK'),
+            ('/css/a.html', 50, 'OK'),
+        ]))
+
+        self.assertEqual(self.store.slowest_tests('deadbeef', 2), [
+            ('/dom/b.html', 400, 'OK'),
+            ('/html/a.html', 300, 'OK'),
+        ])
+        self.assertEqual(self.store.slowest_directories('deadbeef'), [
+            ('/dom/', 500, 2),
+            ('/html/', 500, 2),
+            ('/css/', 50, 1),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+headless.py describes how to run local browsers without an X server.
+"""
+
+
+def get_headless_arguments(browser_name):
+    '''Retrieve the `wpt run` command-line arguments which launch the given
+    browser in headless mode.'''
+
+    if browser_name == 'chrome':
+        return ['--binary-arg=--headless']
+
+    # Firefox is configured via the environment (see
+    # `get_headless_environment`)
+    return []
+
+
+def get_headless_environment(browser_name, env):
+    '''Create a copy of the given environment which launches the given browser
+    in headless mode.'''
+
+    env = dict(env)
+
+    if browser_name == 'firefox':
+        env['MOZ_HEADLESS'] = '1'
+
+    return env
@@ -0,0 +1,28 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import unittest
+
+from headless import get_headless_arguments, get_headless_environment
+
+
+class TestHeadless(unittest.TestCase):
+    def test_chrome(self):
+        self.assertEqual(
+            get_headless_arguments('chrome'), ['--binary-arg=--headless']
+        )
+        self.assertEqual(get_headless_environment('chrome', {'A': 'b'}),
+                         {'A': 'b'})
+
+    def test_firefox(self):
+        env = {'A': 'b'}
+
+        self.assertEqual(get_headless_arguments('firefox'), [])
+        self.assertEqual(get_headless_environment('firefox', env),
+                         {'A': 'b', 'MOZ_HEADLESS': '1'})
+        self.assertEqual(env, {'A': 'b'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import os
+import subprocess
+
+from chunk_planner import TEST_TYPES
+
+"""
+incremental.py determines which WPT tests may produce different results
+between two revisions of WPT, so that the results of all other tests can be
+carried over from a previous run.
+"""
+
+# Changes to files beneath these directories (or to any file in the root of
+# the repository) may affect any test, so they require a full run.
+SHARED_DIRECTORIES = (
+    'common/', 'fonts/', 'images/', 'media/', 'resources/', 'tools/',
+)
+
+# Directories which hold support files for the tests of their parent
+# directory
+SUPPORT_DIRECTORY_NAMES = ('resources', 'support', 'common')
+
+
+def get_changed_files(wpt_path, baseline_sha, sha):
+    '''List the files which differ between two revisions of WPT. Renamed
+    files are listed under both their old and new names.'''
+
+    output = subprocess.check_output(
+        ['git', 'diff', '--name-only', '--no-renames', baseline_sha, sha],
+        cwd=wpt_path
+    )
+
+    return [name for name in output.decode('UTF-8').splitlines() if name]
+
+
+def read_manifest_test_files(filename):
+    '''Retrieve a dictionary mapping the path of each test file described by a
+    WPT manifest file to the IDs of the tests it defines.'''
+
+    with open(filename) as handle:
+        manifest = json.load(handle)
+
+    test_files = {}
+
+    for test_type in TEST_TYPES:
+        for path, items in manifest['items'].get(test_type, {}).items():
+            test_files.setdefault(path, []).extend(item[0] for item in items)
+
+    return test_files
+
+
+def get_affected_directory(path):
+    '''Determine the directory whose tests may be affected by a change to the
+    given (non-test) file, or `None` if any test may be affected.'''
+
+    if '/' not in path or path.startswith(SHARED_DIRECTORIES):
+        return None
+
+    directory = os.path.dirname(path)
+
+    while os.path.basename(directory) in SUPPORT_DIRECTORY_NAMES:
+        directory = os.path.dirname(directory)
+
+    if not directory:
+        return None
+
+    return directory + '/'
+
+
+def get_affected_tests(test_files, changed_files):
+    '''Determine the IDs of the tests which may be affected by changes to the
+    given files. A change to a test file affects the tests it defines, and a
+    change to any other file affects every test in its directory.
+
+    Returns `None` if the changes may affect any test.'''
+
+    affected = set()
+    directories = set()
+
+    for path in changed_files:
+        if path in test_files:
+            affected.update(test_files[path])
+            continue
+
+        directory = get_affected_directory(path)
+
+        if directory is None:
+            return None
+
+        directories.add(directory)
+
+    for path, tests in test_files.items():
+        if path.startswith(tuple(directories)):
+            affected.update(tests)
+
+    return affected
@@ -0,0 +1,111 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import incremental
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.test_files = {
+            'dom/a.html': ['/dom/a.html'],
+            'dom/b.any.js': ['/dom/b.any.html', '/dom/b.any.worker.html'],
+            'dom/events/c.html': ['/dom/events/c.html'],
+            'css/d.html': ['/css/d.html']
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_manifest_test_files(self):
+        name = os.path.join(self.tmp_dir, 'MANIFEST.json')
+        with open(name, 'w') as handle:
+            json.dump({
+                'items': {
+                    'testharness': {
+                        'dom/a.html': [['/dom/a.html', {}]],
+                        'dom/b.any.js': [
+                            ['/dom/b.any.html', {}],
+                            ['/dom/b.any.worker.html', {}]
+                        ]
+                    },
+                    'reftest': {
+                        'css/d.html': [['/css/d.html', [], {}]]
+                    },
+                    'support': {
+                        'dom/common.js': [[None, {}]]
+                    }
+                },
+                'version': 4
+            }, handle)
+
+        self.assertEqual(incremental.read_manifest_test_files(name), {
+            'dom/a.html': ['/dom/a.html'],
+            'dom/b.any.js': ['/dom/b.any.html', '/dom/b.any.worker.html'],
+            'css/d.html': ['/css/d.html']
+        })
+
+    def test_get_affected_directory(self):
+        self.assertEqual(
+            incremental.get_affected_directory('dom/events/helper.js'),
+            'dom/events/'
+        )
+        self.assertEqual(
+            incremental.get_affected_directory('dom/events/support/x.html'),
+            'dom/events/'
+        )
+        self.assertEqual(
+            incremental.get_affected_directory('dom/resources/common/x.js'),
+            'dom/'
+        )
+        self.assertIsNone(incremental.get_affected_directory('lint.whitelist'))
+        self.assertIsNone(
+            incremental.get_affected_directory('resources/testharness.js')
+        )
+        self.assertIsNone(incremental.get_affected_directory('support/x.js'))
+
+    def test_get_affected_tests_test_files(self):
+        self.assertEqual(
+            incremental.get_affected_tests(
+                self.test_files, ['dom/b.any.js', 'css/d.html']
+            ),
+            set(['/dom/b.any.html', '/dom/b.any.worker.html', '/css/d.html'])
+        )
+
+    def test_get_affected_tests_support_files(self):
+        self.assertEqual(
+            incremental.get_affected_tests(
+                self.test_files, ['dom/events/resources/helper.js']
+            ),
+            set(['/dom/events/c.html'])
+        )
+        self.assertEqual(
+            incremental.get_affected_tests(
+                self.test_files, ['dom/helper.js']
+            ),
+            set([
+                '/dom/a.html', '/dom/b.any.html', '/dom/b.any.worker.html',
+                '/dom/events/c.html'
+            ])
+        )
+
+    def test_get_affected_tests_shared_files(self):
+        self.assertIsNone(incremental.get_affected_tests(
+            self.test_files, ['css/d.html', 'resources/testharness.js']
+        ))
+
+    def test_get_affected_tests_no_changes(self):
+        self.assertEqual(
+            incremental.get_affected_tests(self.test_files, []), set()
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,4 +33,6 @@ if __name__ == '__main__':
         output_path=(os.environ.get('WPTD_OUT_PATH') or
                      '%s/wptdout' % (os.environ.get('HOME'))),
         run_path=os.environ.get('RUN_PATH', ''),
+        stall_timeout=int(os.environ.get('STALL_TIMEOUT', 0)) or None,
+        telemetry_filepath=os.environ.get('TELEMETRY_PATH'),
     ))
@@ -0,0 +1,67 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import errno
+import fcntl
+import os
+
+"""
+lock_files.py locks files (with `flock`) which guard a resource shared by
+concurrent processes, such as a cached manifest or a worktree.
+
+A lock file may only be removed by a process holding an exclusive lock on
+it. A process which opened the file before it was removed would otherwise
+lock a file which no other process can open any more, so the path is
+checked once the lock is taken, and the file opened again if it has been
+replaced.
+
+Lock files are opened for appending, so that locking them does not modify
+them (their modification time may record the use of the resource).
+"""
+
+
+def is_locked_file(handle, path):
+    '''Determine whether the given open file is (still) the file at `path`.
+    '''
+
+    try:
+        return os.path.samestat(os.fstat(handle.fileno()), os.stat(path))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return False
+
+
+def open_locked(path, operation=fcntl.LOCK_EX):
+    '''Open (creating it if necessary) and lock the file at `path` with the
+    given `flock` operation. Returns the open file, which is unlocked when
+    closed. Raises an `IOError` if the lock is not available and `operation`
+    includes `LOCK_NB`.'''
+
+    while True:
+        handle = open(path, 'a')
+
+        try:
+            fcntl.flock(handle, operation)
+
+            if is_locked_file(handle, path):
+                return handle
+        except Exception:
+            handle.close()
+            raise
+
+        # The file was removed while waiting for the lock
+        handle.close()
+
+
+def try_open_locked(path, operation=fcntl.LOCK_EX):
+    '''Like `open_locked`, but returns `None` instead of waiting if the lock
+    is held by another process.'''
+
+    try:
+        return open_locked(path, operation | fcntl.LOCK_NB)
+    except IOError as e:
+        if e.errno not in (errno.EACCES, errno.EAGAIN):
+            raise
+        return None
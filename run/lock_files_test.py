@@ -0,0 +1,62 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import fcntl
+import os
+import shutil
+import tempfile
+import unittest
+
+from lock_files import is_locked_file, open_locked, try_open_locked
+
+
+class TestLockFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'a.lock')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_exclusive(self):
+        with open_locked(self.path):
+            self.assertIsNone(try_open_locked(self.path))
+            self.assertIsNone(try_open_locked(self.path, fcntl.LOCK_SH))
+
+        handle = try_open_locked(self.path)
+        self.assertIsNotNone(handle)
+        handle.close()
+
+    def test_shared(self):
+        with open_locked(self.path, fcntl.LOCK_SH):
+            handle = try_open_locked(self.path, fcntl.LOCK_SH)
+            self.assertIsNotNone(handle)
+            self.assertIsNone(try_open_locked(self.path))
+            handle.close()
+
+    def test_unmodified(self):
+        with open(self.path, 'w') as handle:
+            handle.write('contents')
+        os.utime(self.path, (1, 1))
+
+        with open_locked(self.path):
+            pass
+
+        self.assertEqual(os.path.getmtime(self.path), 1)
+        with open(self.path) as handle:
+            self.assertEqual(handle.read(), 'contents')
+
+    def test_removed(self):
+        with open_locked(self.path) as handle:
+            self.assertTrue(is_locked_file(handle, self.path))
+            os.remove(self.path)
+            self.assertFalse(is_locked_file(handle, self.path))
+
+            # The lock is taken on a new file
+            with open_locked(self.path) as other:
+                self.assertTrue(is_locked_file(other, self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
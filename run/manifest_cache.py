@@ -0,0 +1,196 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import errno
+import fcntl
+import glob
+import os
+import shutil
+import subprocess
+import tempfile
+
+from contextlib import contextmanager
+from lock_files import open_locked, try_open_locked
+
+"""
+manifest_cache.py stores the WPT manifest (`MANIFEST.json`) generated for
+each WPT revision so that it is generated only once per host, no matter how
+many platforms are run against that revision.
+
+A manifest which is not yet cached is generated incrementally: the manifest
+of the nearest cached revision (preferably an ancestor) is placed in the WPT
+checkout before `wpt manifest` is run, so that only the files which have
+changed since that revision are parsed.
+"""
+
+# Maximum number of ancestors of a revision to consider when searching for
+# the nearest cached manifest
+MAX_ANCESTORS = 1000
+
+
+class ManifestCache(object):
+    '''A directory of WPT manifest files, one per WPT revision. The directory
+    may be shared by concurrent processes.'''
+
+    def __init__(self, directory, size=10):
+        self.directory = directory
+        self.size = size
+
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _path(self, sha):
+        return os.path.join(self.directory, '%s.json' % sha[:10])
+
+    def _lock_path(self, sha):
+        return os.path.join(self.directory, '%s.lock' % sha[:10])
+
+    @contextmanager
+    def _lock(self, sha):
+        '''Prevent concurrent processes from generating (or pruning) the
+        manifest of the same revision.'''
+
+        with open_locked(self._lock_path(sha)) as handle:
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def shas(self):
+        '''List the (abbreviated) revisions whose manifest is cached, most
+        recently used first.'''
+
+        filenames = sorted(
+            glob.glob(os.path.join(self.directory, '*.json')),
+            key=os.path.getmtime,
+            reverse=True
+        )
+
+        return [os.path.basename(name)[:-len('.json')] for name in filenames]
+
+    def get(self, sha):
+        '''Retrieve the path to the cached manifest of the given revision, or
+        `None` if it is not cached.'''
+
+        path = self._path(sha)
+
+        return path if os.path.isfile(path) else None
+
+    def nearest_sha(self, wpt_path, sha):
+        '''Find the cached revision which is expected to differ least from
+        the given revision: its nearest cached ancestor if there is one, and
+        otherwise the most recently used cached revision.'''
+
+        cached = self.shas()
+
+        if not cached:
+            return None
+
+        try:
+            output = subprocess.check_output(
+                ['git', 'rev-list', '--max-count=%s' % MAX_ANCESTORS, sha],
+                cwd=wpt_path
+            )
+        except subprocess.CalledProcessError:
+            output = ''
+
+        cached_set = set(cached)
+
+        for ancestor in output.decode('UTF-8').split():
+            if ancestor[:10] in cached_set:
+                return ancestor[:10]
+
+        return cached[0]
+
+    def put(self, sha, filename):
+        '''Store a copy of the given manifest file as the manifest of the
+        given revision.'''
+
+        copy_atomically(filename, self._path(sha))
+
+    def _copy(self, sha, filename):
+        '''Copy the cached manifest of the given revision to `filename`.
+        Returns `False` if it is not cached (e.g. because another process
+        pruned it).'''
+
+        path = self.get(sha)
+
+        if path is None:
+            return False
+
+        try:
+            shutil.copyfile(path, filename)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+
+        return True
+
+    def prune(self):
+        '''Remove the least recently used manifests in excess of the size of
+        the cache, skipping those which another process is generating or
+        using.'''
+
+        for sha in self.shas()[self.size:]:
+            handle = try_open_locked(self._lock_path(sha))
+
+            if handle is None:
+                continue
+
+            # The lock file is only removed while it is locked
+            with handle:
+                for name in (self._path(sha), self._lock_path(sha)):
+                    try:
+                        os.remove(name)
+                    except OSError as e:
+                        if e.errno != errno.ENOENT:
+                            raise
+
+    def update(self, wpt_path, sha):
+        '''Place the manifest of the given revision in the WPT checkout,
+        generating (and caching) it if necessary. The checkout is expected to
+        be at the given revision.'''
+
+        manifest_path = os.path.join(wpt_path, 'MANIFEST.json')
+
+        with self._lock(sha):
+            cached_path = self.get(sha)
+
+            if cached_path is not None:
+                print('Using cached WPT manifest for %s' % sha)
+                copy_atomically(cached_path, manifest_path)
+                # Record the use of the manifest for `prune`
+                os.utime(cached_path, None)
+                return
+
+            nearest_sha = self.nearest_sha(wpt_path, sha)
+
+            # The nearest manifest may be pruned concurrently, in which case
+            # the manifest is generated without it
+            if (nearest_sha is not None and
+                    self._copy(nearest_sha, manifest_path)):
+                print('Updating cached WPT manifest for %s' % nearest_sha)
+            else:
+                print('Generating WPT manifest')
+
+            subprocess.check_call(
+                ['./wpt', 'manifest', '--work'], cwd=wpt_path
+            )
+            self.put(sha, manifest_path)
+
+        self.prune()
+
+
+def copy_atomically(source, destination):
+    '''Copy a file such that concurrent readers of the destination see
+    either its previous or its new contents.'''
+
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination))
+    os.close(handle)
+    shutil.copyfile(source, temp_path)
+    os.rename(temp_path, destination)
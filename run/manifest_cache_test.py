@@ -0,0 +1,169 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+from lock_files import open_locked
+from manifest_cache import ManifestCache
+
+# A stand-in for the `wpt` CLI which records the manifest it was given (if
+# any) in the manifest it generates
+WPT_SCRIPT = '''#!/usr/bin/env python
+import json
+try:
+    with open('MANIFEST.json') as handle:
+        seed = json.load(handle)['rev']
+except IOError:
+    seed = None
+with open('rev') as handle:
+    rev = handle.read()
+with open('MANIFEST.json', 'w') as handle:
+    json.dump({'rev': rev, 'seed': seed}, handle)
+'''
+
+
+class TestManifestCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.wpt_path = os.path.join(self.tmp_dir, 'wpt')
+        self.cache = ManifestCache(
+            os.path.join(self.tmp_dir, 'manifests'), size=2
+        )
+
+        self.revision = 0
+
+        os.mkdir(self.wpt_path)
+        wpt = os.path.join(self.wpt_path, 'wpt')
+        with open(wpt, 'w') as handle:
+            handle.write(WPT_SCRIPT)
+        os.chmod(wpt, 0o755)
+
+        self.git('init', '-q')
+        self.git('config', 'user.email', 'wpt@example.com')
+        self.git('config', 'user.name', 'wpt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def git(self, *args):
+        return subprocess.check_output(
+            ['git'] + list(args), cwd=self.wpt_path
+        ).strip()
+
+    def commit(self):
+        self.revision += 1
+        with open(os.path.join(self.wpt_path, 'rev'), 'w') as handle:
+            handle.write(str(self.revision))
+        self.git('add', 'rev')
+        self.git('commit', '-q', '-m', 'commit %s' % self.revision)
+
+        return self.git('rev-parse', 'HEAD')
+
+    def read_manifest(self):
+        with open(os.path.join(self.wpt_path, 'MANIFEST.json')) as handle:
+            return json.load(handle)
+
+    def test_update_generates_and_caches(self):
+        sha = self.commit()
+
+        self.cache.update(self.wpt_path, sha)
+
+        manifest = self.read_manifest()
+        self.assertIsNone(manifest['seed'])
+        self.assertEqual(self.cache.shas(), [sha[:10]])
+
+        with open(self.cache.get(sha)) as handle:
+            self.assertEqual(json.load(handle), manifest)
+
+    def test_update_uses_cache(self):
+        sha = self.commit()
+        self.cache.put(sha, os.path.join(self.wpt_path, 'rev'))
+
+        self.cache.update(self.wpt_path, sha)
+
+        with open(os.path.join(self.wpt_path, 'MANIFEST.json')) as handle:
+            self.assertEqual(handle.read(), '1')
+
+    def test_update_from_nearest_ancestor(self):
+        first_sha = self.commit()
+        self.cache.update(self.wpt_path, first_sha)
+        first_rev = self.read_manifest()['rev']
+
+        os.remove(os.path.join(self.wpt_path, 'MANIFEST.json'))
+        second_sha = self.commit()
+        self.cache.update(self.wpt_path, second_sha)
+
+        self.assertEqual(self.read_manifest()['seed'], first_rev)
+        self.assertEqual(
+            self.cache.nearest_sha(self.wpt_path, second_sha),
+            second_sha[:10]
+        )
+
+    def test_update_nearest_pruned(self):
+        first_sha = self.commit()
+        self.cache.update(self.wpt_path, first_sha)
+        os.remove(os.path.join(self.wpt_path, 'MANIFEST.json'))
+
+        # Another process prunes the nearest manifest once it is found
+        def nearest_sha(wpt_path, sha):
+            os.remove(self.cache.get(first_sha))
+            return first_sha[:10]
+
+        self.cache.nearest_sha = nearest_sha
+        second_sha = self.commit()
+        self.cache.update(self.wpt_path, second_sha)
+
+        self.assertIsNone(self.read_manifest()['seed'])
+        self.assertEqual(self.cache.shas(), [second_sha[:10]])
+
+    def test_nearest_sha_unrelated(self):
+        self.assertIsNone(self.cache.nearest_sha(self.wpt_path, 'HEAD'))
+
+        self.cache.put('a' * 40, os.path.join(self.wpt_path, 'wpt'))
+
+        self.assertEqual(
+            self.cache.nearest_sha(self.wpt_path, self.commit()), 'a' * 10
+        )
+
+    def test_prune(self):
+        for index, sha in enumerate(('a' * 40, 'b' * 40, 'c' * 40)):
+            self.cache.put(sha, os.path.join(self.wpt_path, 'wpt'))
+            os.utime(self.cache.get(sha), (index, index))
+
+        # Using a manifest makes it the most recently used
+        os.utime(self.cache.get('a' * 40), (time.time(), time.time()))
+        self.cache.prune()
+
+        self.assertEqual(self.cache.shas(), ['a' * 10, 'c' * 10])
+
+    def test_prune_locked(self):
+        for index, sha in enumerate(('a' * 40, 'b' * 40, 'c' * 40)):
+            self.cache.put(sha, os.path.join(self.wpt_path, 'wpt'))
+            os.utime(self.cache.get(sha), (index, index))
+
+        lock_path = os.path.join(self.tmp_dir, 'manifests', 'a' * 10 + '.lock')
+
+        # The manifest is in use by another process
+        with open_locked(lock_path, fcntl.LOCK_SH):
+            self.cache.prune()
+
+            self.assertEqual(self.cache.shas(),
+                             ['c' * 10, 'b' * 10, 'a' * 10])
+            self.assertTrue(os.path.exists(lock_path))
+
+        self.cache.prune()
+
+        self.assertEqual(self.cache.shas(), ['c' * 10, 'b' * 10])
+        self.assertFalse(os.path.exists(lock_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
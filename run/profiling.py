@@ -0,0 +1,131 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import contextlib
+import cProfile
+import os
+import pstats
+import resource
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+"""
+profiling.py profiles the stages of the processing of results by `run.py
+--profile` (e.g. loading each chunk's report, summarizing and writing the
+individual results), so that the time and memory they take can be compared
+before and after a change.
+
+The calls of each stage are profiled with `cProfile` and combined into
+`{output_path}/{stage}.pstats`, which may be inspected with `pstats`:
+
+    python -m pstats \
+        $BUILD_PATH/profiles/c0ffee1234/chrome-63.0-linux/summarize.pstats
+
+Peak memory is measured with `tracemalloc` where it is available (Python
+3). Otherwise, the peak resident memory of the process at the end of the
+stage is reported. Both are process-wide, so the figure for a stage which
+runs alongside others (e.g. the chunks of parallel runs) is approximate.
+"""
+
+
+def get_peak_memory():
+    '''The peak memory (in bytes) allocated since `reset_peak_memory` was
+    last called, or the peak resident memory of the process.'''
+
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1]
+
+    # Measured in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def reset_peak_memory():
+    if (tracemalloc is not None and tracemalloc.is_tracing() and
+            hasattr(tracemalloc, 'reset_peak')):
+        tracemalloc.reset_peak()
+
+
+class StageProfiler(object):
+    '''Profiles named stages, writing the results to `output_path` (or
+    doing nothing if it is `None`). Stages may run in any thread; only the
+    thread which runs a stage is profiled.'''
+
+    def __init__(self, output_path=None):
+        self.output_path = output_path
+
+        self._lock = threading.Lock()
+        self._stages = {}
+
+        if (output_path is not None and tracemalloc is not None and
+                not tracemalloc.is_tracing()):
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.output_path is None:
+            yield
+            return
+
+        profile = cProfile.Profile()
+        reset_peak_memory()
+        start = time.time()
+
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            duration = time.time() - start
+            peak_memory = get_peak_memory()
+
+            with self._lock:
+                if name in self._stages:
+                    stage = self._stages[name]
+                    stage['stats'].add(profile)
+                else:
+                    stage = self._stages[name] = {
+                        'stats': pstats.Stats(profile),
+                        'calls': 0,
+                        'duration': 0,
+                        'peak_memory': 0
+                    }
+
+                stage['calls'] += 1
+                stage['duration'] += duration
+                stage['peak_memory'] = max(stage['peak_memory'],
+                                           peak_memory)
+
+    def report(self, limit=10):
+        '''Write the profile of each stage and print its peak memory and
+        the functions which took the most time.'''
+
+        if self.output_path is None or not self._stages:
+            return
+
+        if not os.path.isdir(self.output_path):
+            os.makedirs(self.output_path)
+
+        lines = []
+        for name, stage in sorted(self._stages.items()):
+            stage['stats'].dump_stats(
+                os.path.join(self.output_path, '%s.pstats' % name)
+            )
+            lines.append('%s: %s calls, %.1f seconds, peak memory %.1f MB' % (
+                name, stage['calls'], stage['duration'],
+                stage['peak_memory'] / (1024.0 * 1024)
+            ))
+
+        with open(os.path.join(self.output_path, 'memory.txt'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        print('Profiles written to %s' % self.output_path)
+        for line, (name, stage) in zip(lines, sorted(self._stages.items())):
+            print('==================================================')
+            print(line)
+            stage['stats'].sort_stats('tottime').print_stats(limit)
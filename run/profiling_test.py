@@ -0,0 +1,88 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import unittest
+
+from profiling import StageProfiler
+
+
+def build_list(size):
+    return [str(number) for number in range(size)]
+
+
+class TestStageProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.tmp_dir, 'profiles', 'chrome')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def function_calls(self, stage, name):
+        stats = pstats.Stats(
+            os.path.join(self.output_path, '%s.pstats' % stage)
+        )
+
+        return sum(
+            calls for (_, _, function), (calls, _, _, _, _)
+            in stats.stats.items() if function == name
+        )
+
+    def test_stages(self):
+        profiler = StageProfiler(self.output_path)
+
+        with profiler.stage('summarize'):
+            build_list(100000)
+
+        # Calls of a stage from different threads are combined
+        def load_chunk():
+            with profiler.stage('load_chunk'):
+                build_list(10)
+
+        threads = [threading.Thread(target=load_chunk) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with self.assertRaises(ValueError):
+            with profiler.stage('load_chunk'):
+                build_list(10)
+                raise ValueError()
+
+        profiler.report()
+
+        self.assertEqual(
+            sorted(os.listdir(self.output_path)),
+            ['load_chunk.pstats', 'memory.txt', 'summarize.pstats']
+        )
+        self.assertEqual(self.function_calls('summarize', 'build_list'), 1)
+        self.assertEqual(self.function_calls('load_chunk', 'build_list'), 4)
+
+        with open(os.path.join(self.output_path, 'memory.txt')) as handle:
+            lines = handle.read().splitlines()
+
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('load_chunk: 4 calls, '))
+        self.assertTrue(lines[1].startswith('summarize: 1 calls, '))
+        self.assertIn('peak memory', lines[1])
+
+    def test_disabled(self):
+        profiler = StageProfiler()
+
+        with profiler.stage('summarize'):
+            build_list(10)
+
+        profiler.report()
+
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
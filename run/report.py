@@ -2,20 +2,107 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import bisect
 import gzip
+import hashlib
 import json
+import mmap
+import multiprocessing
 import os
 import tempfile
+import threading
+
+from wptreport import ReportReader, write_report
+
+
+# Incremented whenever the format of "chunk" metadata changes
+METADATA_VERSION = 2
 
 
 class InsufficientData(Exception):
     pass
 
 
+def summarize_result(result):
+    '''Count the passing and total subtests of a result (where the test
+    itself counts as one subtest).'''
+
+    passes = 1 if result['status'] in ('OK', 'PASS') else 0
+    total = 1
+
+    for subtest in result['subtests']:
+        if subtest['status'] == 'PASS':
+            passes += 1
+
+        total += 1
+
+    return [passes, total]
+
+
+def scan_chunk(chunk_name):
+    '''Parse a "chunk", returning its size, its SHA-1 hash and the metadata
+    entries of its results. (A function, so that it may be run in another
+    process.)'''
+
+    entries = []
+
+    with open(chunk_name) as handle:
+        chunk_file = HashingFile(handle)
+
+        try:
+            for result, span in ReportReader(chunk_file).with_spans():
+                entries.append(
+                    [result['test']] + summarize_result(result) + list(span)
+                )
+        except ValueError:
+            entries = []
+
+    return chunk_file.size, chunk_file.hexdigest(), entries
+
+
+class HashingFile(object):
+    '''Wraps a file object, computing the SHA-1 hash and size of the data
+    which is read from or written to it.'''
+
+    def __init__(self, handle):
+        self.size = 0
+
+        self._handle = handle
+        self._hash = hashlib.sha1()
+
+    def _update(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def read(self, size=-1):
+        data = self._handle.read(size)
+        self._update(data)
+
+        return data
+
+    def write(self, data):
+        self._update(data)
+        self._handle.write(data)
+
+
 class Report(object):
     '''A utility for storing WPT results data spread across multiple segments
     (i.e. "chunks"). Segment data is persisted on disk in order to limit memory
-    consumption and support forensics in the case of process failure.'''
+    consumption and support forensics in the case of process failure. Results
+    are read from disk one at a time (see wptreport.py).
+
+    Next to each "chunk", a small metadata file records the size and SHA-1
+    hash of the "chunk" and the test and summary counts of each of its
+    results, so that the "chunk" need not be parsed merely to determine
+    which tests it contains or to summarize it. The metadata also locates
+    each result in the "chunk", so that individual results can be read
+    without parsing the rest of the "chunk" (`get_result`, `iter_prefix`).
+
+    A running summary of all "chunks" (`summary.json`) is updated as each
+    "chunk" is loaded, so that it is available at any time during a run.'''
 
     def __init__(self, total_chunks, backing_dir=None):
         if backing_dir is not None:
@@ -25,6 +112,11 @@ class Report(object):
 
         self._total_chunks = total_chunks
 
+        # "Chunks" may be loaded concurrently
+        self._summary_lock = threading.Lock()
+        self._summary_state = None
+        self._index = None
+
     def _chunk_name(self, chunk_offset):
         if chunk_offset < 1 or chunk_offset > self._total_chunks:
             raise IndexError()
@@ -33,92 +125,441 @@ class Report(object):
 
         return os.path.join(self._dir, file_name)
 
-    def _get_chunk(self, chunk_offset):
+    def _expected_tests_name(self, chunk_offset):
+        return '%s-expected.json' % self._chunk_name(chunk_offset)[:-5]
+
+    def _metadata_name(self, chunk_offset):
+        return '%s-metadata.json' % self._chunk_name(chunk_offset)[:-5]
+
+    def _summary_name(self):
+        return os.path.join(self._dir, 'summary.json')
+
+    def _chunk_sizes(self):
+        sizes = {}
+
+        for chunk_offset in range(1, self._total_chunks + 1):
+            try:
+                sizes[str(chunk_offset)] = os.stat(
+                    self._chunk_name(chunk_offset)
+                ).st_size
+            except OSError:
+                pass
+
+        return sizes
+
+    def _add_to_summary(self, state, test_file, passes, total):
+        if test_file in state['summary']:
+            state['duplicates'].append(test_file)
+        else:
+            state['summary'][test_file] = [passes, total]
+
+    def _read_summary(self):
+        '''Read the running summary, re-creating it from the metadata of
+        every "chunk" if it does not describe the current "chunks".'''
+
+        sizes = self._chunk_sizes()
+
         try:
-            with open(self._chunk_name(chunk_offset)) as handle:
-                contents = handle.read()
-        except IOError:
-            return {'results': []}
+            with open(self._summary_name()) as handle:
+                state = json.loads(handle.read())
+
+            if state['chunks'] == sizes:
+                return state
+        except (IOError, ValueError, KeyError):
+            pass
+
+        state = {'chunks': sizes, 'summary': {}, 'duplicates': []}
+
+        for chunk_offset in range(1, self._total_chunks + 1):
+            for entry in self._metadata_results(chunk_offset):
+                self._add_to_summary(state, *entry[:3])
+
+        self._write_atomically(self._summary_name(), json.dumps(state))
+
+        return state
+
+    def _summary(self):
+        '''Retrieve the running summary. Must be called with
+        `_summary_lock` held.'''
+
+        if self._summary_state is None:
+            self._summary_state = self._read_summary()
+
+        return self._summary_state
 
+    def _write_atomically(self, name, contents):
+        handle, temp_name = tempfile.mkstemp(dir=self._dir)
+
+        with os.fdopen(handle, 'w') as output:
+            output.write(contents)
+
+        os.rename(temp_name, name)
+
+    def _write_metadata(self, chunk_offset, size, digest, entries):
+        metadata = {
+            'version': METADATA_VERSION,
+            'count': len(entries),
+            'size': size,
+            'sha1': digest,
+            # `[test, passes, total, offset, length]` for each result, in
+            # order
+            'results': entries
+        }
+
+        self._write_atomically(
+            self._metadata_name(chunk_offset), json.dumps(metadata)
+        )
+
+        return metadata
+
+    def _chunk_size(self, chunk_offset):
         try:
-            return json.loads(contents)
-        except ValueError:
-            return {'results': []}
+            return os.stat(self._chunk_name(chunk_offset)).st_size
+        except OSError:
+            return None
+
+    def _stored_metadata(self, chunk_offset, size):
+        '''Retrieve the stored metadata of a "chunk" of the given size, or
+        `None` if it is missing or out of date.'''
+
+        try:
+            with open(self._metadata_name(chunk_offset)) as handle:
+                metadata = json.loads(handle.read())
+
+            if (metadata['size'] == size and
+                    metadata.get('version') == METADATA_VERSION):
+                return metadata
+        except (IOError, ValueError, KeyError):
+            pass
+
+        return None
+
+    def _metadata(self, chunk_offset):
+        '''Retrieve the metadata of a "chunk", re-creating it from the
+        "chunk" itself if it is missing or out of date, or `None` if the
+        "chunk" has no results.'''
+
+        size = self._chunk_size(chunk_offset)
+
+        if size is None:
+            return None
+
+        metadata = self._stored_metadata(chunk_offset, size)
+
+        if metadata is not None:
+            return metadata
+
+        # The "chunk" was written without metadata (e.g. by an earlier
+        # version of this module, before a run was resumed)
+        return self._write_metadata(
+            chunk_offset, *scan_chunk(self._chunk_name(chunk_offset))
+        )
+
+    def index_chunks(self, processes=None):
+        '''Create the metadata of every "chunk" whose metadata is missing or
+        out of date, parsing the "chunks" in a pool of `processes` processes
+        (if more than one).
+
+        Returns the number of "chunks" parsed.'''
+
+        stale = []
+
+        for chunk_offset in range(1, self._total_chunks + 1):
+            size = self._chunk_size(chunk_offset)
+
+            if (size is not None and
+                    self._stored_metadata(chunk_offset, size) is None):
+                stale.append(chunk_offset)
+
+        chunk_names = [
+            self._chunk_name(chunk_offset) for chunk_offset in stale
+        ]
+
+        if processes > 1 and len(stale) > 1:
+            pool = multiprocessing.Pool(min(processes, len(stale)))
+
+            try:
+                scans = pool.map(scan_chunk, chunk_names)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            scans = [scan_chunk(chunk_name) for chunk_name in chunk_names]
+
+        for chunk_offset, scan in zip(stale, scans):
+            self._write_metadata(chunk_offset, *scan)
+
+        return len(stale)
+
+    def _metadata_results(self, chunk_offset):
+        metadata = self._metadata(chunk_offset)
+
+        return metadata['results'] if metadata else []
+
+    def _each_chunk_result(self, chunk_offset):
+        try:
+            handle = open(self._chunk_name(chunk_offset))
+        except IOError:
+            return
+
+        with handle:
+            try:
+                for result in ReportReader(handle):
+                    yield result
+            except ValueError:
+                # Chunks are replaced atomically, so they are only invalid
+                # if modified by another process
+                return
 
     def load_chunk(self, chunk_offset, file_name):
         '''Open a JSON-formatted file representing the results of a given
-        "chunk" of tests.
+        "chunk" of tests and merge them with any previously-loaded results for
+        that "chunk". Results for tests which have already been loaded are
+        ignored, so that re-running only the missing tests of a "chunk"
+        completes the dataset.
+
+        Raises an `InsufficientData` exception if this dataset does not
+        contain results for any test which is not already present in the
+        specified "chunk".
 
-        Raises an `InsufficientData` exception if this dataset does not have
-        more results than any previously-loaded dataset for the specified
-        "chunk".
+        Returns the number of results in the merged data.'''
 
-        Returns the parsed data.'''
+        chunk_name = self._chunk_name(chunk_offset)
+        known_tests = self.chunk_tests(chunk_offset)
 
-        current = self._get_chunk(chunk_offset)
+        # The running summary must not already include the new results
+        with self._summary_lock:
+            self._summary()
 
-        with open(file_name) as handle:
-            contents = handle.read()
+        entries = []
+        added = []
+        spans = []
+
+        handle, temp_name = tempfile.mkstemp(dir=self._dir)
 
-        # The WPT CLI is known to produce invalid JSON files in some
-        # circumstances. These cases represent test executions with zero
-        # results. Tolerate this condition and interpret accordingly.
-        #
-        # https://github.com/w3c/web-platform-tests/issues/9481
         try:
-            data = json.loads(contents)
+            with os.fdopen(handle, 'w') as output, open(file_name) as source:
+                chunk_file = HashingFile(output)
+                reader = ReportReader(source)
+
+                def merge():
+                    if known_tests:
+                        for result in self._each_chunk_result(chunk_offset):
+                            entries.append(
+                                [result['test']] + summarize_result(result)
+                            )
+                            yield result
+
+                    for result in reader:
+                        if result['test'] not in known_tests:
+                            entries.append(
+                                [result['test']] + summarize_result(result)
+                            )
+                            added.append(result['test'])
+                            yield result
+
+                write_report(chunk_file, merge(), reader.properties, spans)
         except ValueError:
-            data = {'results': []}
-
-        if len(data['results']) <= len(current['results']):
+            # The WPT CLI is known to produce invalid JSON files in some
+            # circumstances. These cases represent test executions with zero
+            # results. Tolerate this condition and interpret accordingly.
+            #
+            # https://github.com/w3c/web-platform-tests/issues/9481
+            del added[:]
+        except Exception:
+            os.remove(temp_name)
+            raise
+
+        if len(added) == 0:
+            os.remove(temp_name)
             raise InsufficientData()
 
-        with open(self._chunk_name(chunk_offset), 'w') as handle:
-            handle.write(json.dumps(data))
+        entries = [entry + list(span) for entry, span in zip(entries, spans)]
 
-        return data
+        os.rename(temp_name, chunk_name)
+        self._write_metadata(
+            chunk_offset, chunk_file.size, chunk_file.hexdigest(), entries
+        )
+
+        with self._summary_lock:
+            state = self._summary()
+
+            for entry in entries[len(entries) - len(added):]:
+                self._add_to_summary(state, *entry[:3])
+
+            state['chunks'][str(chunk_offset)] = chunk_file.size
+            self._write_atomically(self._summary_name(), json.dumps(state))
+
+            self._index = None
+
+        return len(entries)
+
+    def chunk_tests(self, chunk_offset):
+        '''Retrieve the set of tests which have results in a given
+        "chunk".'''
+
+        return set(
+            entry[0] for entry in self._metadata_results(chunk_offset)
+        )
+
+    def set_expected_tests(self, chunk_offset, tests):
+        '''Record the tests which are defined in a given "chunk".'''
+
+        with open(self._expected_tests_name(chunk_offset), 'w') as handle:
+            handle.write(json.dumps(tests))
 
-    def summarize(self):
+    def expected_tests(self, chunk_offset):
+        '''Retrieve the tests which are defined in a given "chunk", or `None`
+        if they have not been recorded.'''
+
+        try:
+            with open(self._expected_tests_name(chunk_offset)) as handle:
+                return json.loads(handle.read())
+        except (IOError, ValueError):
+            return None
+
+    def missing_tests(self, chunk_offset):
+        '''Retrieve a sorted list of the tests defined in a given "chunk" which
+        do not have results, or `None` if the tests defined in the "chunk"
+        have not been recorded.'''
+
+        expected = self.expected_tests(chunk_offset)
+
+        if expected is None:
+            return None
+
+        return sorted(set(expected) - self.chunk_tests(chunk_offset))
+
+    def reset(self):
+        '''Remove all data for every "chunk" from the backing directory.'''
+
+        for chunk_offset in range(1, self._total_chunks + 1):
+            for name in (self._chunk_name(chunk_offset),
+                         self._metadata_name(chunk_offset),
+                         self._expected_tests_name(chunk_offset)):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+
+        with self._summary_lock:
+            try:
+                os.remove(self._summary_name())
+            except OSError:
+                pass
+
+            self._summary_state = None
+            self._index = None
+
+    def summarize(self, processes=None):
         '''Create a data structure summarizing the results of all available
-        "chunks".
+        "chunks" (from the running summary). If `processes` is specified,
+        any "chunks" without up-to-date metadata are first parsed
+        concurrently (see `index_chunks`).
 
         Raises an `InsufficientData` exception if the dataset contains zero
         test results.'''
 
-        summary = {}
-        has_results = False
+        if processes:
+            self.index_chunks(processes)
 
-        for chunk_offset in range(1, self._total_chunks + 1):
-            chunk = self._get_chunk(chunk_offset)
-            for result in chunk['results']:
-                test_file = result['test']
-                has_results = True
+        with self._summary_lock:
+            state = self._summary()
 
-                assert test_file not in summary, (
-                    'test_file "%s" is not already present in summary')
+            assert not state['duplicates'], (
+                'test_file "%s" has more than one result' %
+                state['duplicates'][0])
 
-                if result['status'] in ('OK', 'PASS'):
-                    summary[test_file] = [1, 1]
-                else:
-                    summary[test_file] = [0, 1]
+            if not state['summary']:
+                raise InsufficientData('Zero results available')
 
-                for subtest in result['subtests']:
-                    if subtest['status'] == 'PASS':
-                        summary[test_file][0] += 1
+            return dict(
+                (test_file, list(counts))
+                for test_file, counts in state['summary'].items()
+            )
 
-                    summary[test_file][1] += 1
+    def summary_size(self):
+        '''Retrieve the number of tests in the running summary.'''
 
-        if not has_results:
-            raise InsufficientData('Zero results available')
+        with self._summary_lock:
+            return len(self._summary()['summary'])
 
-        return summary
+    def chunk_results(self, chunk_offset):
+        '''Iterate over the individual test results of a given "chunk".'''
+
+        return self._each_chunk_result(chunk_offset)
 
     def each_result(self):
         '''Iterate over the individual test results described by all available
         "chunks".'''
 
         for chunk_offset in range(1, self._total_chunks + 1):
-            chunk = self._get_chunk(chunk_offset)
-
-            for result in chunk['results']:
+            for result in self._each_chunk_result(chunk_offset):
                 yield result
+
+    def _get_index(self):
+        '''Retrieve a list of the `(test, chunk_offset, offset, length)` of
+        every result, sorted by test.'''
+
+        with self._summary_lock:
+            if self._index is None:
+                index = []
+
+                for chunk_offset in range(1, self._total_chunks + 1):
+                    for entry in self._metadata_results(chunk_offset):
+                        test_file, _, _, offset, length = entry
+                        index.append((test_file, chunk_offset, offset, length))
+
+                index.sort()
+                self._index = index
+
+            return self._index
+
+    def _read_results(self, locations):
+        '''Read the results at the given `(chunk_offset, offset, length)`
+        locations, mapping each "chunk" into memory only once.'''
+
+        maps = {}
+
+        try:
+            for chunk_offset, offset, length in locations:
+                if chunk_offset not in maps:
+                    with open(self._chunk_name(chunk_offset), 'rb') as handle:
+                        maps[chunk_offset] = mmap.mmap(
+                            handle.fileno(), 0, access=mmap.ACCESS_READ
+                        )
+
+                yield json.loads(maps[chunk_offset][offset:offset + length])
+        finally:
+            for chunk_map in maps.values():
+                chunk_map.close()
+
+    def get_result(self, test_file):
+        '''Retrieve the result of a single test, reading only that result from
+        its "chunk".
+
+        Raises a `KeyError` if no "chunk" has a result for the test.'''
+
+        index = self._get_index()
+        position = bisect.bisect_left(index, (test_file,))
+
+        if position == len(index) or index[position][0] != test_file:
+            raise KeyError(test_file)
+
+        return list(self._read_results([index[position][1:]]))[0]
+
+    def iter_prefix(self, prefix):
+        '''Iterate over the results of the tests whose paths begin with the
+        given prefix (e.g. `/html/semantics/`), in order of their paths.'''
+
+        index = self._get_index()
+
+        def locations():
+            position = bisect.bisect_left(index, (prefix,))
+
+            while (position < len(index) and
+                   index[position][0].startswith(prefix)):
+                yield index[position][1:]
+                position += 1
+
+        return self._read_results(locations())
@@ -2,7 +2,9 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import hashlib
 import json
+import mock
 import os
 import shutil
 import tempfile
@@ -22,15 +24,23 @@ class TestReport(unittest.TestCase):
         with open(name, 'w') as handle:
             handle.write(json.dumps(data))
 
+    def results(self, *tests):
+        return [
+            {'test': test, 'status': 'OK', 'subtests': []} for test in tests
+        ]
+
     def test_chunk_load(self):
         r = report.Report(3, self.tmp_dir)
         name = os.path.join(self.tmp_dir, 'foo.json')
 
-        self.write_json(name, {'results': [1, 2, 3]})
+        self.write_json(name, {'results': self.results('a', 'b', 'c')})
 
         result = r.load_chunk(1, name)
 
-        self.assertEquals({'results': [1, 2, 3]}, result)
+        self.assertEquals(3, result)
+        self.assertEquals(
+            list(r.each_result()), self.results('a', 'b', 'c')
+        )
 
     def test_chunk_load_empty_file(self):
         r = report.Report(3, self.tmp_dir)
@@ -42,6 +52,21 @@ class TestReport(unittest.TestCase):
         with self.assertRaises(report.InsufficientData):
             r.load_chunk(1, name)
 
+    def test_chunk_load_truncated_file(self):
+        r = report.Report(3, self.tmp_dir)
+        name = os.path.join(self.tmp_dir, 'foo.json')
+
+        self.write_json(name, {'results': self.results('a')})
+        r.load_chunk(1, name)
+
+        with open(name, 'w') as handle:
+            handle.write(json.dumps({'results': self.results('b', 'c')})[:-5])
+
+        with self.assertRaises(report.InsufficientData):
+            r.load_chunk(1, name)
+
+        self.assertEquals(r.chunk_tests(1), set(['a']))
+
     def test_chunk_load_no_results(self):
         r = report.Report(3, self.tmp_dir)
         name = os.path.join(self.tmp_dir, 'foo.json')
@@ -55,11 +80,11 @@ class TestReport(unittest.TestCase):
         r = report.Report(3, self.tmp_dir)
         name = os.path.join(self.tmp_dir, 'foo.json')
 
-        self.write_json(name, {'results': [1, 2, 3]})
+        self.write_json(name, {'results': self.results('a', 'b', 'c')})
 
         r.load_chunk(1, name)
 
-        self.write_json(name, {'results': [1, 2]})
+        self.write_json(name, {'results': self.results('a', 'b')})
 
         with self.assertRaises(report.InsufficientData):
             r.load_chunk(1, name)
@@ -68,21 +93,262 @@ class TestReport(unittest.TestCase):
         r = report.Report(3, self.tmp_dir)
         name = os.path.join(self.tmp_dir, 'foo.json')
 
-        self.write_json(name, {'results': [1, 2, 3]})
+        self.write_json(name, {'results': self.results('a', 'b', 'c')})
 
         r.load_chunk(1, name)
 
-        self.write_json(name, {'results': [1, 2, 3, 4]})
+        self.write_json(name, {
+            'results': self.results('a', 'b', 'c', 'd')
+        })
 
         result = r.load_chunk(1, name)
 
-        self.assertEquals(result, {'results': [1, 2, 3, 4]})
+        self.assertEquals(result, 4)
+        self.assertEquals(
+            list(r.each_result()), self.results('a', 'b', 'c', 'd')
+        )
+
+    def test_chunk_load_merges_results(self):
+        r = report.Report(3, self.tmp_dir)
+        name = os.path.join(self.tmp_dir, 'foo.json')
+
+        self.write_json(name, {'results': self.results('a', 'b', 'c')})
+
+        r.load_chunk(1, name)
+
+        self.write_json(name, {'results': self.results('c', 'd')})
+
+        result = r.load_chunk(1, name)
+
+        self.assertEquals(result, 4)
+        self.assertEquals(
+            list(r.each_result()), self.results('a', 'b', 'c', 'd')
+        )
+        self.assertEquals(r.chunk_tests(1), set(['a', 'b', 'c', 'd']))
+        self.assertEquals(r.chunk_tests(2), set())
+
+    def test_expected_tests(self):
+        r = report.Report(3, self.tmp_dir)
+        name = os.path.join(self.tmp_dir, 'foo.json')
+
+        self.assertIsNone(r.expected_tests(1))
+        self.assertIsNone(r.missing_tests(1))
+
+        r.set_expected_tests(1, ['a', 'b', 'c'])
+
+        self.assertEquals(r.expected_tests(1), ['a', 'b', 'c'])
+        self.assertEquals(r.missing_tests(1), ['a', 'b', 'c'])
+
+        self.write_json(name, {'results': self.results('c', 'a')})
+        r.load_chunk(1, name)
+
+        self.assertEquals(r.missing_tests(1), ['b'])
+
+        self.write_json(name, {'results': self.results('b')})
+        r.load_chunk(1, name)
+
+        self.assertEquals(r.missing_tests(1), [])
+
+    def test_reset(self):
+        r = report.Report(3, self.tmp_dir)
+        name = os.path.join(self.tmp_dir, 'foo.json')
+
+        self.write_json(name, {'results': self.results('a')})
+        r.load_chunk(2, name)
+        r.set_expected_tests(2, ['a'])
+
+        r = report.Report(3, self.tmp_dir)
+
+        self.assertEquals(r.missing_tests(2), [])
+
+        r.reset()
+
+        self.assertIsNone(r.expected_tests(2))
+        self.assertEquals(r.chunk_tests(2), set())
+        self.assertEquals(os.listdir(self.tmp_dir), ['foo.json'])
+
+    def test_chunk_metadata(self):
+        r = report.Report(3, self.tmp_dir)
+        name = os.path.join(self.tmp_dir, 'foo.json')
+
+        self.write_json(name, {'results': self.results('a', 'b')})
+        r.load_chunk(1, name)
+
+        with open(os.path.join(self.tmp_dir, '1-of-3.json')) as handle:
+            contents = handle.read()
+        with open(os.path.join(self.tmp_dir, '1-of-3-metadata.json')) \
+                as handle:
+            metadata = json.loads(handle.read())
+
+        self.assertEquals(metadata, {
+            'count': 2,
+            'size': len(contents),
+            'version': report.METADATA_VERSION,
+            'sha1': hashlib.sha1(contents).hexdigest(),
+            'results': [['a', 1, 1, 13, 45], ['b', 1, 1, 60, 45]]
+        })
+        self.assertEquals(
+            json.loads(contents[60:60 + 45]), self.results('b')[0]
+        )
+
+        # Only the new results are parsed; neither the tests nor the summary
+        # of a "chunk" require it to be parsed
+        with mock.patch.object(report, 'ReportReader',
+                               wraps=report.ReportReader) as ReportReader:
+            self.assertEquals(r.chunk_tests(1), set(['a', 'b']))
+            self.assertEquals(r.summarize(), {'a': [1, 1], 'b': [1, 1]})
+
+            self.write_json(name, {'results': self.results('c')})
+            r.load_chunk(2, name)
+
+        self.assertEquals(ReportReader.call_count, 1)
+
+    def test_chunk_metadata_rebuilt(self):
+        r = report.Report(3, self.tmp_dir)
+
+        # A "chunk" without metadata, as written by previous versions
+        self.write_json(os.path.join(self.tmp_dir, '1-of-3.json'), {
+            'results': self.results('a', 'b')
+        })
+
+        self.assertEquals(r.chunk_tests(1), set(['a', 'b']))
+        self.assertTrue(
+            os.path.exists(os.path.join(self.tmp_dir, '1-of-3-metadata.json'))
+        )
+
+        # A "chunk" which was replaced after its metadata was written
+        self.write_json(os.path.join(self.tmp_dir, '1-of-3.json'), {
+            'results': self.results('a', 'b', 'c')
+        })
+
+        self.assertEquals(r.summarize(), {
+            'a': [1, 1], 'b': [1, 1], 'c': [1, 1]
+        })
+
+    def test_running_summary(self):
+        r = report.Report(3, self.tmp_dir)
+        name = os.path.join(self.tmp_dir, 'foo.json')
+        summary_name = os.path.join(self.tmp_dir, 'summary.json')
+
+        self.assertEquals(r.summary_size(), 0)
+
+        self.write_json(name, {'results': self.results('a', 'b')})
+        r.load_chunk(1, name)
+        self.write_json(name, {'results': self.results('b', 'c')})
+        r.load_chunk(1, name)
+
+        self.assertEquals(r.summary_size(), 3)
+
+        with open(summary_name) as handle:
+            self.assertEquals(json.loads(handle.read())['summary'], {
+                'a': [1, 1], 'b': [1, 1], 'c': [1, 1]
+            })
+
+        # The summary is read from disk by other instances, and re-created
+        # if it does not describe the current "chunks"
+        self.write_json(name, {'results': self.results('d')})
+        r.load_chunk(3, name)
+        os.remove(summary_name)
+
+        with mock.patch.object(report, 'ReportReader') as ReportReader:
+            self.assertEquals(report.Report(3, self.tmp_dir).summarize(), {
+                'a': [1, 1], 'b': [1, 1], 'c': [1, 1], 'd': [1, 1]
+            })
+
+        self.assertFalse(ReportReader.called)
+
+        r.reset()
+
+        self.assertFalse(os.path.exists(summary_name))
+        self.assertEquals(r.summary_size(), 0)
+
+    def test_get_result(self):
+        r = report.Report(3, self.tmp_dir)
+        name = os.path.join(self.tmp_dir, 'foo.json')
+        results = [
+            {'test': '/html/semantics/a.html', 'status': 'OK',
+             'message': u'\u00e9', 'subtests': []},
+            {'test': '/html/b.html', 'status': 'ERROR', 'subtests': []},
+            {'test': '/html/semantics/forms/c.html', 'status': 'OK',
+             'subtests': [{'status': 'PASS', 'name': 'first'}]},
+            {'test': '/dom/d.html', 'status': 'OK', 'subtests': []}
+        ]
+
+        self.write_json(name, {'results': results[:2]})
+        r.load_chunk(1, name)
+        self.write_json(name, {'results': results[2:3]})
+        r.load_chunk(1, name)
+        self.write_json(name, {'results': results[3:]})
+        r.load_chunk(3, name)
+
+        with mock.patch.object(report, 'ReportReader') as ReportReader:
+            for result in results:
+                self.assertEquals(r.get_result(result['test']), result)
+
+            self.assertEquals(
+                list(r.iter_prefix('/html/semantics/')),
+                [results[0], results[2]]
+            )
+            self.assertEquals(list(r.iter_prefix('/html/')),
+                              [results[1], results[0], results[2]])
+            self.assertEquals(list(r.iter_prefix('/css/')), [])
+
+        self.assertFalse(ReportReader.called)
+
+        with self.assertRaises(KeyError):
+            r.get_result('/html/semantics')
+
+        # Results are located in "chunks" without up-to-date metadata
+        os.remove(os.path.join(self.tmp_dir, '1-of-3-metadata.json'))
+
+        self.assertEquals(
+            report.Report(3, self.tmp_dir).get_result('/html/b.html'),
+            results[1]
+        )
+
+    def test_summarize_processes(self):
+        chunks = [
+            self.results('a', 'b'),
+            [{'test': 'c', 'status': 'OK',
+              'subtests': [{'status': 'PASS'}, {'status': 'FAIL'}]}],
+            self.results('d')
+        ]
+
+        def write_chunks(directory):
+            os.mkdir(directory)
+
+            # "Chunks" without metadata
+            for chunk_offset, results in enumerate(chunks, 1):
+                self.write_json(
+                    os.path.join(directory, '%s-of-3.json' % chunk_offset),
+                    {'results': results}
+                )
+
+            return report.Report(3, directory)
+
+        serial = write_chunks(os.path.join(self.tmp_dir, 'serial'))
+        parallel = write_chunks(os.path.join(self.tmp_dir, 'parallel'))
+
+        expected = serial.summarize()
+
+        self.assertEquals(expected, {
+            'a': [1, 1], 'b': [1, 1], 'c': [2, 3], 'd': [1, 1]
+        })
+        self.assertEquals(parallel.summarize(processes=2), expected)
+        self.assertEquals(parallel.index_chunks(2), 0)
+
+        chunks[2] = self.results('a')
+        repeated = write_chunks(os.path.join(self.tmp_dir, 'repeated'))
+
+        self.assertEquals(repeated.index_chunks(2), 3)
+        with self.assertRaises(AssertionError):
+            repeated.summarize(processes=2)
 
     def test_chunk_load_oob(self):
         r = report.Report(3, self.tmp_dir)
         name = os.path.join(self.tmp_dir, 'foo.json')
 
-        self.write_json(name, {'results': [1, 2, 3]})
+        self.write_json(name, {'results': self.results('a', 'b', 'c')})
 
         with self.assertRaises(IndexError):
             r.load_chunk(0, name)
@@ -0,0 +1,202 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import errno
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+from result_writer import ResultWriter, write_gzip_json
+
+"""
+result_objects.py stores the individual results of runs by content, so that
+a result which is identical to one written by a previous run is neither
+written nor uploaded again.
+
+Each distinct result is stored once (as the same gzipped JSON that would be
+written to its per-test file) in `{build_path}/objects/{platform_id}/`, and
+uploaded as `objects/{hash}`. Each run writes a mapping from test to hash
+(`{sha[0:10]}/{platform_id}-results-map.json.gz`), with which readers
+resolve individual results. A per-platform manifest
+(`{build_path}/objects/{platform_id}-manifest.json.gz`) records every stored
+hash, the run which first produced it, and whether it has been uploaded.
+"""
+
+MAP_SUFFIX = '-results-map.json.gz'
+
+
+def get_map_path(results_base_path):
+    return results_base_path + MAP_SUFFIX
+
+
+def get_objects_path(build_path, platform_id):
+    return os.path.join(build_path, 'objects', platform_id)
+
+
+def get_object_name(digest):
+    '''Determine the name of the uploaded copy of an object.'''
+
+    return 'objects/%s' % digest
+
+
+def hash_result(result):
+    '''Compute the content hash of a result, independent of the order of its
+    keys.'''
+
+    return hashlib.sha1(json.dumps(result, sort_keys=True)).hexdigest()
+
+
+class ObjectStore(object):
+    '''The content-addressed results of a single platform.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = '%s-manifest.json.gz' % path
+
+        try:
+            with gzip.open(self.manifest_path) as handle:
+                self.manifest = json.loads(handle.read())
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self.manifest = {}
+
+    def object_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest)
+
+    def has(self, digest):
+        return digest in self.manifest
+
+    def add(self, digest, sha):
+        self.manifest[digest] = [sha, False]
+
+    def pending_uploads(self):
+        return sorted(digest for digest, (_, uploaded)
+                      in self.manifest.items() if not uploaded)
+
+    def mark_uploaded(self, digests):
+        for digest in digests:
+            self.manifest[digest][1] = True
+
+    def save(self):
+        directory = os.path.dirname(self.manifest_path)
+
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        handle, temp_path = tempfile.mkstemp(dir=directory)
+        os.close(handle)
+        write_gzip_json(temp_path, self.manifest)
+        os.rename(temp_path, self.manifest_path)
+
+
+class ObjectWriter(ResultWriter):
+    '''Writes the results of a run to an `ObjectStore`, skipping those whose
+    content is already stored, and records the mapping from test to hash.'''
+
+    def __init__(self, store, sha, **kwargs):
+        super(ObjectWriter, self).__init__(store.path, **kwargs)
+
+        self.store = store
+        self.sha = sha
+        self.mapping = {}
+        self.written = 0
+
+    def _claim(self, test, digest):
+        '''Record the hash of a test's result. Returns `True` if the object
+        must be written.'''
+
+        with self._lock:
+            self.mapping[test] = digest
+
+            if self.store.has(digest):
+                return False
+
+            self.store.add(digest, self.sha)
+            self.written += 1
+
+            return True
+
+    def _store(self, digest, write):
+        filepath = self.store.object_path(digest)
+        directory = os.path.dirname(filepath)
+        self._makedirs(directory)
+
+        # Identical objects may be written concurrently by other platforms'
+        # runs sharing the directory
+        handle, temp_path = tempfile.mkstemp(dir=directory)
+        os.close(handle)
+        write(temp_path)
+        size = os.path.getsize(temp_path)
+        os.rename(temp_path, filepath)
+
+        with self._lock:
+            self.bytes_written += size
+
+        if self.uploader is not None:
+            self.uploader.put(filepath, get_object_name(digest),
+                              content_type='application/json')
+
+    def _write(self, result):
+        digest = hash_result(result)
+
+        if self._claim(result['test'], digest):
+            self._store(digest, lambda path: write_gzip_json(
+                path, result, self.compression_level
+            ))
+
+        with self._lock:
+            self._count += 1
+            count = self._count
+
+        if count % self.progress_interval == 0:
+            print('Stored %s results' % count)
+
+    def add(self, test, data):
+        '''Record the (gzip-compressed) result file of a test.'''
+
+        with gzip.GzipFile(fileobj=io.BytesIO(data)) as f:
+            digest = hash_result(json.loads(f.read()))
+
+        if self._claim(test, digest):
+            def write(path):
+                with open(path, 'wb') as handle:
+                    handle.write(data)
+
+            self._store(digest, write)
+
+    def write_map(self, map_path):
+        write_gzip_json(map_path, self.mapping)
+
+
+class ObjectResults(object):
+    '''Reads individual results via the mapping of a run, using the
+    interface of `results_archive.ArchiveReader`.'''
+
+    def __init__(self, map_path, objects_path):
+        self.store = ObjectStore(objects_path)
+
+        with gzip.open(map_path) as handle:
+            self.mapping = json.loads(handle.read())
+
+    def tests(self):
+        return sorted(self.mapping.keys())
+
+    def has(self, test):
+        return test in self.mapping
+
+    def get_member(self, test):
+        with open(self.store.object_path(self.mapping[test]), 'rb') \
+                as handle:
+            return handle.read()
+
+    def get_result(self, test):
+        with gzip.open(self.store.object_path(self.mapping[test])) as handle:
+            return json.loads(handle.read())
@@ -0,0 +1,126 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from result_objects import (get_map_path, get_objects_path, hash_result,
+                            ObjectResults, ObjectStore, ObjectWriter)
+from results_archive import compress_result, open_results
+
+
+def result(test, status='PASS'):
+    return {
+        'test': test,
+        'status': 'OK',
+        'message': None,
+        'subtests': [{'status': status, 'message': None, 'name': 'first'}]
+    }
+
+
+class TestResultObjects(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.objects_path = get_objects_path(self.tmp_dir, 'chrome')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_run(self, sha, results):
+        store = ObjectStore(self.objects_path)
+        writer = ObjectWriter(store, sha, workers=2)
+        writer.write(results)
+        writer.write_map(get_map_path(
+            os.path.join(self.tmp_dir, sha, 'chrome')
+        ))
+        store.save()
+
+        return writer
+
+    def test_hash_result(self):
+        self.assertEqual(
+            hash_result({'a': 1, 'b': [1, 2]}),
+            hash_result({'b': [1, 2], 'a': 1})
+        )
+        self.assertNotEqual(
+            hash_result(result('/a.html')),
+            hash_result(result('/a.html', 'FAIL'))
+        )
+
+    def test_dedup_across_runs(self):
+        os.mkdir(os.path.join(self.tmp_dir, 'abc'))
+        os.mkdir(os.path.join(self.tmp_dir, 'def'))
+
+        first = self.write_run('abc', [
+            result('/a.html'), result('/b.html'), result('/c.html')
+        ])
+
+        self.assertEqual(first.written, 3)
+
+        second = self.write_run('def', [
+            result('/a.html'), result('/b.html', 'FAIL'), result('/c.html')
+        ])
+
+        self.assertEqual(second.written, 1)
+        self.assertEqual(second.mapping['/a.html'], first.mapping['/a.html'])
+        self.assertNotEqual(
+            second.mapping['/b.html'], first.mapping['/b.html']
+        )
+
+        store = ObjectStore(self.objects_path)
+
+        self.assertEqual(len(store.manifest), 4)
+        self.assertEqual(
+            store.manifest[second.mapping['/b.html']], ['def', False]
+        )
+
+        reader = open_results(os.path.join(self.tmp_dir, 'def', 'chrome'))
+
+        self.assertIsInstance(reader, ObjectResults)
+        self.assertEqual(reader.tests(), ['/a.html', '/b.html', '/c.html'])
+        self.assertEqual(
+            reader.get_result('/b.html'), result('/b.html', 'FAIL')
+        )
+        with gzip.open(store.object_path(second.mapping['/a.html'])) \
+                as handle:
+            self.assertEqual(json.loads(handle.read()), result('/a.html'))
+
+    def test_uploads(self):
+        os.mkdir(os.path.join(self.tmp_dir, 'abc'))
+        writer = self.write_run('abc', [result('/a.html'), result('/b.html')])
+
+        store = ObjectStore(self.objects_path)
+
+        self.assertEqual(
+            store.pending_uploads(), sorted(writer.mapping.values())
+        )
+
+        store.mark_uploaded([writer.mapping['/a.html']])
+        store.save()
+
+        self.assertEqual(
+            ObjectStore(self.objects_path).pending_uploads(),
+            [writer.mapping['/b.html']]
+        )
+
+    def test_add(self):
+        store = ObjectStore(self.objects_path)
+        os.makedirs(self.objects_path)
+        writer = ObjectWriter(store, 'abc')
+
+        writer.add('/a.html', compress_result(result('/a.html')))
+        writer.add('/a.html', compress_result(result('/a.html')))
+
+        self.assertEqual(writer.written, 1)
+        self.assertEqual(
+            writer.mapping, {'/a.html': hash_result(result('/a.html'))}
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import errno
+import gzip
+import json
+import os
+import Queue
+import threading
+
+from profiling import StageProfiler
+
+"""
+result_writer.py writes the individual (gzipped JSON) result files of a run
+concurrently. Compression releases the GIL, so a pool of threads makes use
+of multiple CPUs.
+"""
+
+# Default level used by the `gzip` module
+DEFAULT_COMPRESSION_LEVEL = 9
+
+
+def write_gzip_json(filepath, payload, compression_level=None):
+    if compression_level is None:
+        compression_level = DEFAULT_COMPRESSION_LEVEL
+
+    with gzip.open(filepath, 'wb', compression_level) as f:
+        payload_str = json.dumps(payload)
+        f.write(payload_str)
+
+
+class ResultWriter(object):
+    '''Writes each test result to `{base_path}{test}` using a pool of worker
+    threads. At most `queue_size` results are held in memory at once.
+
+    A progress message is printed every `progress_interval` files. Each file
+    is queued with the given `uploader.Uploader` (if any) once written. The
+    total size of the files written is counted in `bytes_written`. The
+    writing of each file is profiled as the `write_result` stage of the
+    given `profiling.StageProfiler` (if any).'''
+
+    def __init__(self, base_path, workers=4, compression_level=None,
+                 queue_size=None, progress_interval=1000, uploader=None,
+                 profiler=None):
+        self.base_path = base_path
+        self.workers = workers
+        self.compression_level = compression_level
+        self.queue_size = queue_size or workers * 16
+        self.progress_interval = progress_interval
+        self.uploader = uploader
+        self.profiler = profiler or StageProfiler()
+
+        self._lock = threading.Lock()
+        self._directories = set()
+        self._count = 0
+        self._error = None
+        self.bytes_written = 0
+
+    def _makedirs(self, directory):
+        with self._lock:
+            if directory in self._directories:
+                return
+            self._directories.add(directory)
+
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _write(self, result):
+        filepath = '%s%s' % (self.base_path, result['test'])
+        self._makedirs(os.path.dirname(filepath))
+        write_gzip_json(filepath, result, self.compression_level)
+        size = os.path.getsize(filepath)
+
+        if self.uploader is not None:
+            self.uploader.put(filepath, content_type='application/json')
+
+        with self._lock:
+            self._count += 1
+            self.bytes_written += size
+            count = self._count
+
+        if count % self.progress_interval == 0:
+            print('Wrote %s result files' % count)
+
+    def _work(self, queue):
+        while True:
+            result = queue.get()
+
+            if result is None:
+                return
+
+            # Drain the queue without writing once a write has failed
+            if self._error is not None:
+                continue
+
+            try:
+                # Each worker thread must be profiled separately
+                with self.profiler.stage('write_result'):
+                    self._write(result)
+            except Exception as e:
+                self._error = e
+
+    def write(self, results):
+        '''Write every result from the given iterable.
+
+        Returns the number of files written (by this call).'''
+
+        initial_count = self._count
+        queue = Queue.Queue(self.queue_size)
+        threads = [
+            threading.Thread(target=self._work, args=(queue,))
+            for _ in range(self.workers)
+        ]
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for result in results:
+                if self._error is not None:
+                    break
+                queue.put(result)
+        finally:
+            for _ in threads:
+                queue.put(None)
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+        print('Wrote %s result files to %s' % (self._count, self.base_path))
+
+        return self._count - initial_count
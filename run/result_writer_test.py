@@ -0,0 +1,118 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import gzip
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from profiling import StageProfiler
+from result_writer import ResultWriter
+
+
+def result(test):
+    return {
+        'test': test,
+        'status': 'OK',
+        'message': None,
+        'subtests': [{'status': 'PASS', 'message': None, 'name': 'first'}]
+    }
+
+
+class TestResultWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_bytes(self, filepath):
+        with open(filepath, 'rb') as handle:
+            return handle.read()
+
+    def test_write(self):
+        base_path = os.path.join(self.tmp_dir, 'chrome')
+        results = [
+            result('/dom/a.html'),
+            result('/dom/events/b.html'),
+            result('/css/c.html')
+        ]
+
+        writer = ResultWriter(base_path, workers=2, progress_interval=2)
+
+        self.assertEqual(writer.write(iter(results)), 3)
+
+        for expected in results:
+            with gzip.open(base_path + expected['test']) as handle:
+                self.assertEqual(json.loads(handle.read()), expected)
+
+    def test_profiler(self):
+        base_path = os.path.join(self.tmp_dir, 'chrome')
+        profiles_path = os.path.join(self.tmp_dir, 'profiles')
+        profiler = StageProfiler(profiles_path)
+
+        writer = ResultWriter(base_path, workers=2, profiler=profiler)
+        writer.write(result('/dom/%s.html' % i) for i in range(5))
+        profiler.report()
+
+        # The worker threads are profiled
+        stats = pstats.Stats(
+            os.path.join(profiles_path, 'write_result.pstats')
+        )
+        self.assertEqual(sum(
+            calls for (_, _, function), (calls, _, _, _, _)
+            in stats.stats.items() if function == 'write_gzip_json'
+        ), 5)
+
+    def test_byte_compatible(self):
+        base_path = os.path.join(self.tmp_dir, 'chrome')
+        legacy_path = os.path.join(self.tmp_dir, 'legacy.html')
+        data = result('/legacy.html')
+
+        ResultWriter(base_path).write([data])
+
+        with gzip.open(legacy_path, 'wb') as f:
+            f.write(json.dumps(data))
+
+        actual = self.read_bytes(base_path + '/legacy.html')
+        expected = self.read_bytes(legacy_path)
+
+        # Only the modification time in the gzip header (bytes 4-7) may
+        # differ
+        self.assertEqual(actual[:4], expected[:4])
+        self.assertEqual(actual[8:], expected[8:])
+
+    def test_compression_level(self):
+        base_path = os.path.join(self.tmp_dir, 'chrome')
+        data = result('/a.html')
+        data['message'] = 'repeated ' * 1000
+
+        ResultWriter(base_path + '-1', compression_level=1).write([data])
+        ResultWriter(base_path + '-9', compression_level=9).write([data])
+
+        fast = self.read_bytes(base_path + '-1/a.html')
+        small = self.read_bytes(base_path + '-9/a.html')
+
+        self.assertNotEqual(fast, small)
+
+        with gzip.open(base_path + '-1/a.html') as handle:
+            self.assertEqual(json.loads(handle.read()), data)
+
+    def test_error(self):
+        # A file prevents the creation of the result directory
+        base_path = os.path.join(self.tmp_dir, 'chrome')
+        with open(os.path.join(self.tmp_dir, 'chrome'), 'w'):
+            pass
+
+        writer = ResultWriter(base_path, workers=2)
+
+        with self.assertRaises(OSError):
+            writer.write(result('/dom/%s.html' % i) for i in range(100))
+
+
+if __name__ == '__main__':
+    unittest.main()
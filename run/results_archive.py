@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import errno
+import gzip
+import io
+import itertools
+import json
+import os
+import requests
+import sys
+
+from multiprocessing.pool import ThreadPool
+from profiling import StageProfiler
+from result_objects import get_map_path, get_objects_path, ObjectResults
+from result_writer import DEFAULT_COMPRESSION_LEVEL
+
+"""
+results_archive.py stores the individual results of a run in a single
+archive instead of one file per test.
+
+The archive (`{platform_id}-results.archive`) is a concatenation of gzip
+members, each of which is byte-for-byte the file that would otherwise be
+written for one test. An index (`{platform_id}-results-index.json.gz`) maps
+each test to the `[offset, length]` of its member, so that a single result
+may be read by seeking (or with an HTTP Range request).
+
+To read a result, or to recreate the per-test files:
+
+    ./run/results_archive.py get $BUILD_PATH/c0ffee/chrome-63.0-linux \\
+        /dom/historical.html
+    ./run/results_archive.py explode $BUILD_PATH/c0ffee/chrome-63.0-linux
+"""
+
+ARCHIVE_SUFFIX = '-results.archive'
+INDEX_SUFFIX = '-results-index.json.gz'
+
+# Number of results compressed concurrently by `ArchiveWriter.write`
+BATCH_SIZE = 256
+
+
+def get_archive_paths(results_base_path):
+    '''Determine the locations of the archive and index of the results whose
+    per-test files would be written to `{results_base_path}{test}`.'''
+
+    return (results_base_path + ARCHIVE_SUFFIX,
+            results_base_path + INDEX_SUFFIX)
+
+
+def compress_result(result, compression_level=None):
+    '''Produce the contents of the gzipped JSON file of a single result.'''
+
+    if compression_level is None:
+        compression_level = DEFAULT_COMPRESSION_LEVEL
+
+    stream = io.BytesIO()
+    f = gzip.GzipFile(os.path.basename(result['test']), 'wb',
+                      compression_level, stream)
+    with f:
+        f.write(json.dumps(result))
+
+    return stream.getvalue()
+
+
+def decompress_json(data):
+    with gzip.GzipFile(fileobj=io.BytesIO(data)) as f:
+        return json.loads(f.read())
+
+
+class ArchiveWriter(object):
+    '''Writes results to an archive and its index. The compression of each
+    result is profiled as the `write_result` stage of the given
+    `profiling.StageProfiler` (if any).'''
+
+    def __init__(self, archive_path, index_path, compression_level=None,
+                 profiler=None):
+        self.archive_path = archive_path
+        self.index_path = index_path
+        self.compression_level = compression_level
+        self.profiler = profiler or StageProfiler()
+
+        self._handle = open(archive_path, 'wb')
+        self._offset = 0
+        self._index = {}
+
+    @property
+    def bytes_written(self):
+        return self._offset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, test, data):
+        '''Append the (gzip-compressed) result file of a test.'''
+
+        self._handle.write(data)
+        self._index[test] = [self._offset, len(data)]
+        self._offset += len(data)
+
+    def write(self, results, workers=4):
+        '''Compress and append every result from the given iterable, using a
+        pool of threads. At most `BATCH_SIZE` results are held in memory.
+
+        Returns the number of results written.'''
+
+        pool = ThreadPool(workers)
+        count = 0
+
+        def compress(result):
+            # Each thread of the pool must be profiled separately
+            with self.profiler.stage('write_result'):
+                return result['test'], compress_result(
+                    result, self.compression_level
+                )
+
+        try:
+            results = iter(results)
+            while True:
+                batch = list(itertools.islice(results, BATCH_SIZE))
+
+                if not batch:
+                    break
+
+                for test, data in pool.map(compress, batch):
+                    self.add(test, data)
+
+                count += len(batch)
+                print('Archived %s results' % count)
+        finally:
+            pool.close()
+            pool.join()
+
+        return count
+
+    def close(self):
+        '''Finish the archive and write its index.'''
+
+        if self._handle.closed:
+            return
+
+        self._handle.close()
+
+        with gzip.open(self.index_path, 'wb') as f:
+            f.write(json.dumps(self._index))
+
+
+class LocalSource(object):
+    def __init__(self, path):
+        self.path = path
+
+    def read(self, offset=None, length=None):
+        with open(self.path, 'rb') as handle:
+            if offset is None:
+                return handle.read()
+
+            handle.seek(offset)
+            return handle.read(length)
+
+
+class HTTPSource(object):
+    def __init__(self, url, session=None):
+        self.url = url
+        self.session = session or requests.Session()
+
+    def read(self, offset=None, length=None):
+        headers = {}
+
+        if offset is not None:
+            headers['Range'] = 'bytes=%s-%s' % (offset, offset + length - 1)
+
+        response = self.session.get(self.url, headers=headers)
+        response.raise_for_status()
+
+        if offset is not None and response.status_code != 206:
+            raise IOError('Range requests are not supported by %s' % self.url)
+
+        return response.content
+
+
+def open_source(location):
+    if location.startswith(('http://', 'https://')):
+        return HTTPSource(location)
+
+    return LocalSource(location)
+
+
+class ArchiveReader(object):
+    '''Reads individual results from an archive, which may be a local file or
+    a URL. `location` is the common prefix of the archive and its index (i.e.
+    `results_base_path`).'''
+
+    def __init__(self, location):
+        archive_location, index_location = get_archive_paths(location)
+
+        self._archive = open_source(archive_location)
+        self._index_source = open_source(index_location)
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            data = self._index_source.read()
+
+            # HTTP clients transparently decode `Content-Encoding: gzip`
+            if data[:2] == b'\x1f\x8b':
+                self._index = decompress_json(data)
+            else:
+                self._index = json.loads(data)
+
+        return self._index
+
+    def tests(self):
+        return sorted(self.index.keys())
+
+    def has(self, test):
+        return test in self.index
+
+    def get_member(self, test):
+        '''Retrieve the (gzip-compressed) result file of a test.
+
+        Raises a `KeyError` if the archive has no result for the test.'''
+
+        offset, length = self.index[test]
+
+        return self._archive.read(offset, length)
+
+    def get_result(self, test):
+        return decompress_json(self.get_member(test))
+
+
+class ResultDirectory(object):
+    '''Reads individual results from a tree of per-test files, using the
+    interface of `ArchiveReader`.'''
+
+    def __init__(self, results_base_path):
+        self.results_base_path = results_base_path
+
+    def has(self, test):
+        return os.path.isfile(self.results_base_path + test)
+
+    def get_member(self, test):
+        try:
+            with open(self.results_base_path + test, 'rb') as handle:
+                return handle.read()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                raise KeyError(test)
+            raise
+
+    def get_result(self, test):
+        return decompress_json(self.get_member(test))
+
+
+def open_results(results_base_path):
+    '''Open the individual results of a run, in whichever format they were
+    written.'''
+
+    if os.path.exists(get_archive_paths(results_base_path)[1]):
+        return ArchiveReader(results_base_path)
+
+    map_path = get_map_path(results_base_path)
+
+    if os.path.exists(map_path):
+        build_path = os.path.dirname(os.path.dirname(results_base_path))
+        platform_id = os.path.basename(results_base_path)
+
+        return ObjectResults(
+            map_path, get_objects_path(build_path, platform_id)
+        )
+
+    return ResultDirectory(results_base_path)
+
+
+def explode(reader, results_base_path):
+    '''Write the per-test files of every result in an archive.
+
+    Returns the number of files written.'''
+
+    count = 0
+
+    for test in reader.tests():
+        filepath = results_base_path + test
+
+        try:
+            os.makedirs(os.path.dirname(filepath))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        with open(filepath, 'wb') as handle:
+            handle.write(reader.get_member(test))
+
+        count += 1
+
+    return count
+
+
+def main(args):
+    reader = ArchiveReader(args.location)
+
+    if args.command == 'get':
+        json.dump(reader.get_result(args.test), sys.stdout, indent=2)
+        print('')
+    elif args.command == 'list':
+        for test in reader.tests():
+            print(test)
+    else:
+        count = explode(reader, args.output or args.location)
+        print('Wrote %s result files' % count)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Read results from a results archive.'
+    )
+    parser.add_argument(
+        'command',
+        choices=('get', 'list', 'explode'),
+        help='Action to take.'
+    )
+    parser.add_argument(
+        'location',
+        help=('Path or URL of the archive, without the `%s` suffix.' %
+              ARCHIVE_SUFFIX)
+    )
+    parser.add_argument(
+        'test',
+        nargs='?',
+        help='Test whose result should be retrieved (`get`).'
+    )
+    parser.add_argument(
+        '--output',
+        help=('Prefix of the per-test files written by `explode`. Defaults '
+              'to the location of the archive.')
+    )
+    main(parser.parse_args())
@@ -0,0 +1,181 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import BaseHTTPServer
+import gzip
+import json
+import os
+import pstats
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+
+from profiling import StageProfiler
+from result_writer import ResultWriter
+from results_archive import (ArchiveReader, ArchiveWriter, explode,
+                             get_archive_paths, open_results,
+                             ResultDirectory)
+
+
+def result(test):
+    return {
+        'test': test,
+        'status': 'OK',
+        'message': None,
+        'subtests': [{'status': 'PASS', 'message': None, 'name': 'first'}]
+    }
+
+
+class RangeRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''Serves files from the current directory, honoring Range headers.'''
+
+    root = None
+
+    def do_GET(self):
+        try:
+            with open(os.path.join(self.root, self.path.lstrip('/')),
+                      'rb') as handle:
+                data = handle.read()
+        except IOError:
+            self.send_error(404)
+            return
+
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+
+        if match:
+            start, end = int(match.group(1)), int(match.group(2))
+            data = data[start:end + 1]
+            self.send_response(206)
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestResultsArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.base_path = os.path.join(self.tmp_dir, 'chrome')
+        self.results = [
+            result('/dom/a.html'),
+            result('/dom/events/b.html'),
+            result('/css/c.html?query')
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_archive(self):
+        with ArchiveWriter(*get_archive_paths(self.base_path)) as archive:
+            archive.write(iter(self.results), workers=2)
+
+    def test_read_local(self):
+        self.write_archive()
+
+        reader = open_results(self.base_path)
+
+        self.assertIsInstance(reader, ArchiveReader)
+        self.assertEqual(reader.tests(), [
+            '/css/c.html?query', '/dom/a.html', '/dom/events/b.html'
+        ])
+        for expected in self.results:
+            self.assertTrue(reader.has(expected['test']))
+            self.assertEqual(reader.get_result(expected['test']), expected)
+
+        self.assertFalse(reader.has('/missing.html'))
+        with self.assertRaises(KeyError):
+            reader.get_result('/missing.html')
+
+    def test_profiler(self):
+        profiles_path = os.path.join(self.tmp_dir, 'profiles')
+        profiler = StageProfiler(profiles_path)
+
+        with ArchiveWriter(*get_archive_paths(self.base_path),
+                           profiler=profiler) as archive:
+            archive.write(iter(self.results), workers=2)
+        profiler.report()
+
+        # The threads of the pool are profiled
+        stats = pstats.Stats(
+            os.path.join(profiles_path, 'write_result.pstats')
+        )
+        self.assertEqual(sum(
+            calls for (_, _, function), (calls, _, _, _, _)
+            in stats.stats.items() if function == 'compress_result'
+        ), 3)
+
+    def test_concatenated_members(self):
+        self.write_archive()
+
+        # The archive as a whole is a valid gzip file
+        with gzip.open(get_archive_paths(self.base_path)[0]) as handle:
+            self.assertEqual(
+                handle.read(),
+                ''.join(json.dumps(item) for item in self.results)
+            )
+
+    def test_read_http(self):
+        self.write_archive()
+
+        RangeRequestHandler.root = self.tmp_dir
+        server = BaseHTTPServer.HTTPServer(
+            ('127.0.0.1', 0), RangeRequestHandler
+        )
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        reader = ArchiveReader(
+            'http://127.0.0.1:%s/chrome' % server.server_port
+        )
+
+        self.assertEqual(
+            reader.get_result('/dom/events/b.html'), self.results[1]
+        )
+
+    def test_explode(self):
+        self.write_archive()
+
+        legacy_path = os.path.join(self.tmp_dir, 'legacy')
+        ResultWriter(legacy_path).write(self.results)
+
+        exploded_path = os.path.join(self.tmp_dir, 'exploded')
+        count = explode(ArchiveReader(self.base_path), exploded_path)
+
+        self.assertEqual(count, 3)
+
+        for item in self.results:
+            with open(legacy_path + item['test'], 'rb') as handle:
+                expected = handle.read()
+            with open(exploded_path + item['test'], 'rb') as handle:
+                actual = handle.read()
+
+            # Only the modification time in the gzip header may differ
+            self.assertEqual(actual[:4], expected[:4])
+            self.assertEqual(actual[8:], expected[8:])
+
+    def test_open_results_directory(self):
+        ResultWriter(self.base_path).write(self.results)
+
+        reader = open_results(self.base_path)
+
+        self.assertIsInstance(reader, ResultDirectory)
+        self.assertTrue(reader.has('/dom/a.html'))
+        self.assertFalse(reader.has('/missing.html'))
+        self.assertEqual(reader.get_result('/dom/a.html'), self.results[0])
+        with self.assertRaises(KeyError):
+            reader.get_member('/missing.html')
+
+
+if __name__ == '__main__':
+    unittest.main()
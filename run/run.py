@@ -7,21 +7,43 @@
 from __future__ import division
 
 import argparse
+import chunk_planner
 import ConfigParser as configparser
 import glob
 import gzip
+import incremental
 import json
 import logging
+import multiprocessing
 import platform as host_platform
 import re
 import requests
 import shas
+import signal
 import subprocess
-import tempfile
+import sys
+import time
 import traceback
 import os
 
+from durations import DurationStore, get_store_path
+from headless import get_headless_arguments, get_headless_environment
+from manifest_cache import ManifestCache
+from multiprocessing.pool import ThreadPool
 from report import Report, InsufficientData
+from result_objects import (get_map_path, get_object_name, get_objects_path,
+                            ObjectStore, ObjectWriter)
+from profiling import StageProfiler
+from result_writer import ResultWriter, write_gzip_json
+from sampler import ProcessSampler
+from server_slots import ServerSlots
+from results_archive import ArchiveWriter, get_archive_paths, open_results
+from telemetry import get_telemetry_path, Telemetry
+from uploader import get_authorized_session, Uploader
+from watchdog import start_process, Watchdog
+from worktrees import WorktreePool
+from wptreport import results_from_raw_log, write_report
+from xvfb import DisplayError, XvfbPool, XvfbRunDisplays
 
 """
 run.py runs WPT and uploads results to Google Cloud Storage.
@@ -39,8 +61,8 @@ Before you run the script, you need to:
    (this may also involve installing browsers)
 3. Make sure you have the correct secret in run/running.ini
 4. Install dependencies with `pip3 install -r requirements.txt`
-5. Make sure you have gsutil installed
-   (see https://cloud.google.com/storage/docs/gsutil)
+5. To upload, make sure application default credentials are available
+   (see `gcloud auth application-default login`)
 
 The script will only accept platform IDs listed in browsers.json.
 
@@ -48,157 +70,907 @@ By default this script will not upload anything! To run for production:
 
     ./run/run.py firefox-56.0-linux --upload --create-testrun
 
+Several platforms may be run by a single invocation, which sets up WPT once
+and schedules the chunks of all platforms together:
+
+    ./run/run.py --all-currently-run --parallel-chunks 8 --chunk-cpus 2 \
+        --chunk-memory 2048 --upload --create-testrun
+
 # Filesystem and network output
 
 - This script will only write files under config['build_path']
 - One run will write approximately 111MB to the filesystem
-- If --upload is specified, it will upload that 111MB of results
+- The duration and status of every test is recorded in a per-platform
+  database (`{build_path}/durations/{platform_id}.sqlite`, see durations.py)
+  so that `--balance-chunks` can plan future runs
+- With `--baseline-sha`, only the tests affected by changes to WPT since the
+  baseline run are executed; all other results are copied from the baseline
+  run's files and marked as carried over in the summary file
+- The WPT manifest of each revision is generated once and cached in
+  `{build_path}/manifests` for use by all platforms
+- With `--worktrees`, WPT is run in a per-revision git worktree in
+  `{build_path}/worktrees`; the least recently used worktrees are removed
+- With `--parallel-chunks`, each concurrently-running chunk serves the tests
+  on its own ports from a tests root in `{build_path}/server-slots` (see
+  server_slots.py), which is removed at the end of the run
+- If --upload is specified, it will upload that 111MB of results, starting
+  while the individual result files are written (see uploader.py); uploads
+  are recorded in `{build_path}/uploads` so that an interrupted upload
+  resumes where it stopped
+- With `--pipeline`, the individual results of each chunk are written (and
+  uploaded) as soon as the chunk is complete, while later chunks run
+- The duration of each phase of the run (with counts, sizes and return
+  codes) is recorded in `{build_path}/telemetry`; `run/telemetry.py`
+  reports the median and 95th percentile of each phase across runs
+- With `--sample-resources`, the resource usage of each chunk is sampled
+  from `/proc` (see sampler.py) and summarized in the telemetry
+- With `--profile`, the stages of the processing of results are profiled
+  in `{build_path}/profiles` (see profiling.py)
 - To upload results, you must be logged in with `gcloud` and authorized
 """
 
+# The length (in bytes) of the `--include` arguments of an explicit list of
+# tests above which the list is passed to `wpt run` in a file. Commands are
+# limited to `ARG_MAX` bytes (2 MB on Linux), including the environment.
+MAX_INCLUDE_LENGTH = 128 * 1024
+
 
-def main(platform_id, platform, args, config):
+def main(platforms, args, config):
     loggingLevel = getattr(logging, args.log.upper(), None)
     logging.basicConfig(level=loggingLevel)
     logger = logging.getLogger()
 
-    print('PLATFORM_ID:', platform_id)
-    print('PLATFORM INFO:', platform)
+    for platform_id, platform in platforms:
+        print('PLATFORM_ID:', platform_id)
+        print('PLATFORM INFO:', platform)
 
     if args.path:
         print('Running tests in path: %s' % args.path)
     else:
         print('Running all tests!')
 
+    telemetry = Telemetry(get_telemetry_path(config['build_path']))
+    print('Recording telemetry in %s' % telemetry.filename)
+    telemetry.event(
+        'run_start', platforms=[platform_id for platform_id, _ in platforms],
+        path=args.path, total_chunks=args.total_chunks,
+        parallel_chunks=args.parallel_chunks,
+        results_format=args.results_format
+    )
+
+    upload_session = None
     if args.upload:
         print('Setting up storage client')
-        from google.cloud import storage
-        storage_client = storage.Client(project='wptdashboard')
-        bucket = storage_client.get_bucket(config['gs_results_bucket'])
-        verify_gsutil_installed(config)
+        upload_session = get_authorized_session()
 
     if args.create_testrun:
         assert len(config['secret']) == 64, (
             'Valid secret required to create TestRun')
 
-    if not platform.get('sauce'):
-        if platform['browser_name'] == 'chrome':
-            browser_binary = config['chrome_binary']
-        elif platform['browser_name'] == 'firefox':
-            browser_binary = config['firefox_binary']
+    browser_binaries = {}
 
-        if platform['browser_name'] == 'chrome':
-            verify_browser_binary_version(platform, browser_binary)
-        verify_os_name(platform)
-        verify_or_set_os_version(platform)
+    for platform_id, platform in platforms:
+        browser_binaries[platform_id] = verify_platform(platform, config)
 
-    print('Platform information:')
-    print('Browser version: %s' % platform['browser_version'])
-    print('OS name: %s' % platform['os_name'])
-    print('OS version: %s' % platform['os_version'])
+        print('Platform information (%s):' % platform_id)
+        print('Browser version: %s' % platform['browser_version'])
+        print('OS name: %s' % platform['os_name'])
+        print('OS version: %s' % platform['os_version'])
 
     print('==================================================')
     print('Setting up WPT checkout')
 
-    setup_wpt(config)
+    if args.worktrees:
+        with telemetry.phase('setup_wpt'):
+            fetch_wpt(config)
 
-    print('Getting WPT commit SHA and Date')
-    wpt_sha, wpt_commit_date = get_commit_details(args, config, logger)
+        print('Getting WPT commit SHA and Date')
+        with telemetry.phase('resolve_sha'):
+            wpt_sha = get_wpt_sha(args, config, logger, ref='origin/master')
+
+        with telemetry.phase('setup_worktree'):
+            worktree_pool = WorktreePool(
+                config['wpt_path'],
+                os.path.join(config['build_path'], 'worktrees')
+            )
+            # The worktree remains reserved until this process exits
+            config = dict(config, wpt_path=worktree_pool.acquire(wpt_sha))
+            worktree_pool.prune()
+            print('Using WPT worktree %s' % config['wpt_path'])
+            wpt_commit_date = get_commit_date(config['wpt_path'])
+    else:
+        with telemetry.phase('setup_wpt'):
+            setup_wpt(config)
+
+        print('Getting WPT commit SHA and Date')
+        with telemetry.phase('resolve_sha'):
+            wpt_sha, wpt_commit_date = get_commit_details(args, config,
+                                                          logger)
 
     print('WPT SHA: %s' % wpt_sha)
     print('WPT Commit Date: %s' % wpt_commit_date)
+    telemetry = telemetry.bind(wpt_sha=wpt_sha[0:10])
+
+    print('Updating WPT manifest')
+    with telemetry.phase('update_manifest'):
+        manifest_cache = ManifestCache(
+            os.path.join(config['build_path'], 'manifests')
+        )
+        manifest_cache.update(config['wpt_path'], wpt_sha)
+
+    # Firefox is installed once rather than by each `wpt run`, so that chunks
+    # run in parallel do not install it into the same directory at once
+    if any(needs_firefox_install(platform) for _, platform in platforms):
+        print('Installing Firefox')
+        with telemetry.phase('install_browser', browser='firefox'):
+            firefox_binary = install_firefox(config)
+
+        for platform_id, platform in platforms:
+            if needs_firefox_install(platform):
+                browser_binaries[platform_id] = firefox_binary
 
-    short_wpt_sha = wpt_sha[0:10]
+    print('==================================================')
+    print('Running WPT')
 
-    abs_report_log_path = "%s/wptd-%s-%s-report.log" % (
-        config['build_path'], short_wpt_sha, platform_id
-    )
-    abs_report_chunks_path = "%s/%s/%s-report-chunks" % (
-        config['build_path'], short_wpt_sha, platform_id
-    )
-    abs_current_chunk_path = os.path.join(
-        abs_report_chunks_path, 'current.json'
-    )
-    mkdirp(abs_report_chunks_path)
+    slots = get_chunk_slots(args)
 
-    sha_summary_gz_path = '%s/%s-summary.json.gz' % (
-        short_wpt_sha, platform_id
-    )
-    abs_sha_summary_gz_path = "%s/%s" % (
-        config['build_path'], sha_summary_gz_path
+    displays = None
+    server_slots = ServerSlots(
+        config['wpt_path'], os.path.join(config['build_path'], 'server-slots'),
+        slots
     )
+    run_start = time.time()
 
-    gs_results_base_path = "%s/%s/%s" % (
-        config['build_path'], short_wpt_sha, platform_id
-    )
-    gs_results_url = 'https://storage.googleapis.com/%s/%s' % (
-        config['gs_results_bucket'], sha_summary_gz_path
-    )
+    try:
+        # Each concurrently-running chunk serves the tests on its own ports
+        server_slots.start()
+
+        # X servers are shared by the chunks of all platforms which need
+        # them. Any servers started before a failure are stopped below.
+        if any(needs_display(platform, args) for _, platform in platforms):
+            if args.xvfb_pool:
+                print('Starting %s X servers' % slots)
+                displays = XvfbPool(slots)
+                displays.start()
+            else:
+                displays = XvfbRunDisplays(slots)
+
+        runs = [
+            PlatformRun(
+                platform_id, platform, browser_binaries[platform_id], args,
+                config, wpt_sha, wpt_commit_date,
+                displays if needs_display(platform, args) else None,
+                upload_session, telemetry, server_slots
+            )
+            for platform_id, platform in platforms
+        ]
+
+        # Interleave the chunks of different platforms so that slow chunks
+        # of one browser overlap with the chunks of the others
+        tasks = [
+            (run, this_chunk)
+            for this_chunk in range(1, args.total_chunks + 1)
+            for run in runs
+        ]
+
+        if slots > 1:
+            print('Running up to %s chunks in parallel' % slots)
+            pool = ThreadPool(min(slots, len(tasks)))
+            results = pool.imap_unordered(run_task, tasks)
+            pool.close()
+            try:
+                # Waiting with a timeout allows signals to be handled
+                while True:
+                    try:
+                        results.next(1)
+                    except StopIteration:
+                        break
+                    except multiprocessing.TimeoutError:
+                        pass
+            except Exception:
+                pool.join()
+                raise
+            # (When the process is terminated, the chunks' daemon threads are
+            # abandoned rather than waited for)
+            pool.join()
+        else:
+            for task in tasks:
+                run_task(task)
+    finally:
+        server_slots.close()
+        if displays is not None:
+            displays.close()
 
-    print('==================================================')
-    print('Running WPT')
+    telemetry.event('chunks_complete', duration=time.time() - run_start)
+
+    failed = [run.platform_id for run in runs if not run.finish()]
+
+    for run in runs:
+        run.profiler.report()
+
+    telemetry.event('run_end', failed=failed)
+
+    if failed:
+        logging.fatal('Failed to complete runs of %s.', ', '.join(failed))
+        exit(1)
+
+
+def exit_on_signal(signum, frame):
+    '''Exit on SIGTERM (e.g. from cron or Jenkins) as on any other error, so
+    that the X servers and other resources of the run are released.'''
+
+    sys.exit(128 + signum)
+
+
+def run_task(task):
+    run, this_chunk = task
+
+    return run.run_chunk(this_chunk)
+
+
+class PlatformRun(object):
+    '''The state of the run of a single platform, whose chunks may be
+    scheduled alongside those of other platforms.'''
+
+    def __init__(self, platform_id, platform, browser_binary, args, config,
+                 wpt_sha, wpt_commit_date, displays=None,
+                 upload_session=None, telemetry=None, server_slots=None):
+        self.platform_id = platform_id
+        self.platform = platform
+        self.args = args
+        self.config = config
+        self.wpt_sha = wpt_sha
+        self.wpt_commit_date = wpt_commit_date
+        self.displays = displays
+        self.server_slots = server_slots
+        self.upload_session = upload_session
+        self.telemetry = (telemetry or Telemetry()).bind(platform=platform_id)
+        self.chunk_test_counts = []
+
+        self.uploader = None
+        self.writer = None
+        self.object_store = None
 
-    report = Report(args.total_chunks, abs_report_chunks_path)
-    expected_test_count = 0
+        short_wpt_sha = self.short_wpt_sha = wpt_sha[0:10]
+
+        self.report_chunks_path = "%s/%s/%s-report-chunks" % (
+            config['build_path'], short_wpt_sha, platform_id
+        )
+        mkdirp(self.report_chunks_path)
+        self.raw_logs_path = "%s/%s/%s-raw-logs" % (
+            config['build_path'], short_wpt_sha, platform_id
+        )
+        mkdirp(self.raw_logs_path)
+
+        self.profiler = StageProfiler(
+            '%s/profiles/%s/%s' % (config['build_path'], short_wpt_sha,
+                                   platform_id)
+            if args.profile else None
+        )
+
+        self.resources_path = None
+        if args.sample_resources:
+            self.resources_path = '%s/telemetry/resources/%s/%s' % (
+                config['build_path'], short_wpt_sha, platform_id
+            )
+
+        sha_summary_gz_path = '%s/%s-summary.json.gz' % (
+            short_wpt_sha, platform_id
+        )
+        self.summary_gz_path = "%s/%s" % (
+            config['build_path'], sha_summary_gz_path
+        )
+
+        self.results_base_path = "%s/%s/%s" % (
+            config['build_path'], short_wpt_sha, platform_id
+        )
+        self.results_url = 'https://storage.googleapis.com/%s/%s' % (
+            config['gs_results_bucket'], sha_summary_gz_path
+        )
+
+        self.report = Report(args.total_chunks, self.report_chunks_path)
+        if args.resume:
+            print('Resuming from chunks in %s' % self.report_chunks_path)
+            # Chunks written without metadata are parsed concurrently
+            self.report.index_chunks(multiprocessing.cpu_count())
+        else:
+            self.report.reset()
+        self.env = dict(os.environ)
 
-    for this_chunk in range(1, args.total_chunks + 1):
         if platform.get('sauce'):
-            if platform['browser_name'] == 'edge':
-                sauce_browser_name = 'MicrosoftEdge'
+            self.command = get_sauce_command(platform, args, config)
+        elif is_headless(platform, args):
+            print('Running %s headless' % platform['browser_name'])
+            self.command = get_local_command(platform, args, browser_binary)
+            self.command.extend(
+                get_headless_arguments(platform['browser_name'])
+            )
+            self.env = get_headless_environment(
+                platform['browser_name'], self.env
+            )
+        else:
+            self.command = get_local_command(platform, args, browser_binary)
+
+        self.duration_store = DurationStore(
+            get_store_path(config['build_path'], platform_id)
+        )
+
+        self.incremental_plan = None
+        if args.baseline_sha:
+            self.incremental_plan = plan_incremental_run(
+                config, args, wpt_sha, platform_id
+            )
+
+            if self.incremental_plan is None:
+                print('Falling back to a full run.')
+
+        self.chunk_plan = None
+        if self.incremental_plan is not None or args.balance_chunks:
+            previous_sha = self.duration_store.latest_sha(
+                exclude=short_wpt_sha
+            )
+            if previous_sha:
+                print('Planning chunks using test durations from %s' %
+                      previous_sha)
+                durations = self.duration_store.durations(previous_sha)
             else:
-                sauce_browser_name = platform['browser_name']
-
-            command = [
-                './wpt', 'run', 'sauce:%s:%s' % (
-                    sauce_browser_name, platform['browser_version']),
-                '--sauce-platform=%s %s' % (
-                    platform['os_name'], platform['os_version']),
-                '--sauce-key=%s' % config['sauce_key'],
-                '--sauce-user=%s' % config['sauce_user'],
-                '--sauce-connect-binary=%s' % config['sauce_connect_binary'],
-                '--sauce-tunnel-id=%s' % config['sauce_tunnel_id'],
-                '--no-restart-on-unexpected',
-                '--processes=2',
-                '--run-by-dir=3',
+                print('No previous test durations available')
+                durations = {}
+
+        if self.incremental_plan is not None:
+            incremental_tests, carried_summary = self.incremental_plan
+            print('Running %s tests affected by changes since %s (carrying '
+                  'over %s results)' % (len(incremental_tests),
+                                        args.baseline_sha,
+                                        len(carried_summary)))
+            self.chunk_plan = [
+                chunk_tests for _, chunk_tests in chunk_planner.plan_chunks(
+                    incremental_tests, durations, args.total_chunks
+                )
             ]
-            if args.path:
-                command.insert(3, args.path)
+        elif args.balance_chunks:
+            self.chunk_plan = plan_balanced_chunks(config, args, durations)
+
+            if self.chunk_plan is None:
+                print('Unable to read tests from WPT manifest. Falling back '
+                      'to default chunking.')
+
+        # With --pipeline, the results of each chunk are written (and
+        # uploaded) by a separate thread while later chunks run
+        self.post_processing = None
+        self.pending_writes = []
+        if args.pipeline:
+            self.open_writer()
+            self.post_processing = ThreadPool(1)
+
+    def open_writer(self):
+        '''Create the writer of individual results and (with --upload) the
+        uploader to which it queues the files it writes.'''
+
+        args = self.args
+        config = self.config
+
+        if args.upload:
+            self.uploader = Uploader(
+                config['build_path'], config['gs_results_bucket'],
+                '%s/uploads/%s.log' % (config['build_path'],
+                                       self.short_wpt_sha),
+                workers=args.upload_threads, session=self.upload_session
+            )
+
+        if args.results_format == 'archive':
+            self.writer = ArchiveWriter(
+                *get_archive_paths(self.results_base_path),
+                compression_level=args.compression_level,
+                profiler=self.profiler
+            )
+        elif args.results_format == 'objects':
+            self.object_store = ObjectStore(
+                get_objects_path(config['build_path'], self.platform_id)
+            )
+            self.writer = ObjectWriter(
+                self.object_store, self.short_wpt_sha,
+                workers=args.writer_threads,
+                compression_level=args.compression_level,
+                uploader=self.uploader,
+                profiler=self.profiler
+            )
         else:
-            command = [
-                'xvfb-run', '--auto-servernum',
-                './wpt', 'run',
-                platform['browser_name'],
-            ]
+            self.writer = ResultWriter(
+                self.results_base_path,
+                workers=args.writer_threads,
+                compression_level=args.compression_level,
+                uploader=self.uploader,
+                profiler=self.profiler
+            )
+
+    def write_results(self, results):
+        '''Write the given results. Returns the number written.'''
+
+        # Results are read from the report by this thread, and compressed
+        # and written by the writer's (profiled as `write_result`)
+        with self.profiler.stage('each_result'):
+            if self.args.results_format == 'archive':
+                return self.writer.write(results, self.args.writer_threads)
+
+            return self.writer.write(results)
+
+    def write_chunk(self, this_chunk):
+        print('Writing results of chunk %s of %s' % (
+            this_chunk, self.platform_id
+        ))
+        initial_bytes = self.writer.bytes_written
+        with self.telemetry.phase('write_chunk', chunk=this_chunk) as details:
+            details['results'] = self.write_results(
+                self.report.chunk_results(this_chunk)
+            )
+            details['bytes'] = self.writer.bytes_written - initial_bytes
+
+    def wait_for_post_processing(self):
+        '''Wait for the results of every chunk to be written (with
+        --pipeline), raising the first error.'''
+
+        if self.post_processing is None:
+            return
+
+        try:
+            for pending in self.pending_writes:
+                pending.get()
+        finally:
+            self.post_processing.close()
+            self.post_processing.join()
+            self.post_processing = None
+
+    def run_chunk(self, this_chunk):
+        count = run_chunk(
+            this_chunk, self.command, self.report, self.args, self.config,
+            self.report_chunks_path, self.raw_logs_path, self.displays,
+            self.env,
+            self.chunk_plan[this_chunk - 1] if self.chunk_plan else None,
+            self.telemetry, self.resources_path, self.profiler,
+            self.server_slots
+        )
+        self.chunk_test_counts.append(count)
+
+        # The chunk is complete (including any retries)
+        if self.post_processing is not None:
+            self.pending_writes.append(self.post_processing.apply_async(
+                self.write_chunk, (this_chunk,)
+            ))
+
+        # The running summary makes the threshold cheap to check as chunks
+        # complete
+        expected_test_count = sum(self.chunk_test_counts)
+        actual_test_count = self.report.summary_size()
+        print('%s: %s of %s tests of completed chunks have results' % (
+            self.platform_id, actual_test_count, expected_test_count
+        ))
+        if is_below_threshold(actual_test_count, expected_test_count,
+                              self.args.partial_threshold):
+            print('%s: results are below threshold of %s%% so far' % (
+                self.platform_id, self.args.partial_threshold
+            ))
+
+        return count
+
+    def finish(self):
+        '''Summarize, store and (optionally) upload the results of the run.
+
+        Returns `False` if the results are insufficient.'''
 
-            if args.path:
-                command.insert(5, args.path)
-            if platform['browser_name'] == 'chrome':
-                command.extend(['--binary', browser_binary])
-            if platform['browser_name'] == 'firefox':
-                command.extend(['--install-browser', '--yes'])
-                command.append('--certutil-binary=certutil')
-                # temporary fix to allow WebRTC tests to call getUserMedia
-                command.extend([
-                    '--setpref', 'media.navigator.streams.fake=true'
-                ])
-
-        command.append('--log-mach=-')
-        raw_log_filename = tempfile.mkstemp('-wptdashboard')[1]
-        command.extend(['--log-raw', raw_log_filename])
-
-        command.extend(['--log-wptreport', abs_current_chunk_path])
-        command.append('--install-fonts')
+        args = self.args
+        config = self.config
+        platform = self.platform
+        short_wpt_sha = self.short_wpt_sha
+
+        telemetry = self.telemetry
+        expected_test_count = sum(self.chunk_test_counts)
+
+        if self.post_processing is not None:
+            print('Waiting for the results of every chunk to be written')
+            with telemetry.phase('wait_for_writes'):
+                self.wait_for_post_processing()
+
+        print('Recording test durations')
+        with telemetry.phase('record_durations'):
+            record_durations(self.duration_store, short_wpt_sha,
+                             self.raw_logs_path)
+            self.duration_store.close()
+
+        print('==================================================')
+        print('Finished WPT run of %s' % self.platform_id)
+
+        if platform['browser_name'] == 'firefox':
+            print('Verifying installed firefox matches platform ID')
+            firefox_path = '%s/_venv/firefox/firefox' % config['wpt_path']
+            verify_browser_binary_version(platform, firefox_path)
+
+        print('Creating summary of results')
+        try:
+            with telemetry.phase('summarize') as details:
+                # An incremental run may consist entirely of carried-over
+                # results
+                if (self.incremental_plan is not None and
+                        not self.incremental_plan[0]):
+                    summary = {}
+                else:
+                    with self.profiler.stage('summarize'):
+                        summary = self.report.summarize()
+
+                actual_test_count = len(summary.keys())
+                details.update(results=actual_test_count,
+                               expected_tests=expected_test_count)
+
+            if is_below_threshold(actual_test_count, expected_test_count,
+                                  args.partial_threshold):
+                raise InsufficientData(
+                    '%s of %s is below threshold of %s%%' % (
+                        actual_test_count, expected_test_count,
+                        args.partial_threshold
+                    )
+                )
+        except InsufficientData as exc:
+            logging.fatal('Insufficient report data for %s (%s).',
+                          self.platform_id, exc)
+            return False
+
+        # Result files are uploaded as they are written
+        pipelined = self.writer is not None
+        if not pipelined:
+            self.open_writer()
+
+        uploader = self.uploader
+        writer = self.writer
+        object_store = self.object_store
+
+        if self.incremental_plan is not None:
+            carried_summary = self.incremental_plan[1]
+            print('==================================================')
+            print('Carrying over results from %s' % args.baseline_sha)
+            with telemetry.phase('carry_over') as details:
+                carry_over_results(
+                    config, args, self.platform_id, self.results_base_path,
+                    carried_summary,
+                    None if args.results_format == 'files' else writer
+                )
+                summary.update(carried_summary)
+                details['results'] = len(carried_summary)
+
+        print('==================================================')
+        print('Writing summary.json.gz to local filesystem')
+        with telemetry.phase('write_summary') as details:
+            with self.profiler.stage('write_gzip_json'):
+                mkdirp(os.path.dirname(self.summary_gz_path))
+                write_gzip_json(self.summary_gz_path, summary)
+            details['bytes'] = os.path.getsize(self.summary_gz_path)
+        print('Wrote file %s' % self.summary_gz_path)
+
+        print('==================================================')
+        # With --pipeline, this only completes the files written for every
+        # chunk (e.g. the index of an archive)
+        initial_bytes = writer.bytes_written
+        with telemetry.phase('write_results', format=args.results_format,
+                             pipelined=pipelined) as details:
+            count = None
+            if args.results_format == 'archive':
+                print('Writing results archive to local filesystem')
+                if not pipelined:
+                    count = self.write_results(self.report.each_result())
+                writer.close()
+                print('Wrote file %s' % writer.archive_path)
+            elif args.results_format == 'objects':
+                print('Writing new result objects to local filesystem')
+                if not pipelined:
+                    count = self.write_results(self.report.each_result())
+                writer.write_map(get_map_path(self.results_base_path))
+                object_store.save()
+                print('Stored %s new result objects for %s results' % (
+                    writer.written, len(writer.mapping)
+                ))
+            elif not pipelined:
+                print('Writing individual result files to local filesystem')
+                count = self.write_results(self.report.each_result())
+
+            details.update(results=count,
+                           bytes=writer.bytes_written - initial_bytes)
+
+        if not args.upload:
+            print('==================================================')
+            print('Stopping here (pass --upload to upload results to WPTD).')
+            return True
+
+        print('==================================================')
+        print('Uploading results to gs://%s' % config['gs_results_bucket'])
+        with telemetry.phase('upload') as details:
+            with uploader:
+                if args.results_format == 'objects':
+                    # Objects are uploaded before the mapping which refers to
+                    # them
+                    upload_objects(object_store, uploader)
+                # Only this platform's files are uploaded: the directory of
+                # the revision is shared with the runs of other platforms,
+                # which may still be writing theirs.
+                uploader.put_tree(self.results_base_path,
+                                  content_type='application/json')
+                # The report chunks hold every result of the run, which
+                # objects are uploaded to avoid storing again
+                if args.results_format != 'objects':
+                    # The chunks are not compressed
+                    uploader.put_tree(self.report_chunks_path,
+                                      content_encoding=None)
+                uploader.put(self.summary_gz_path,
+                             content_type='application/json')
+                if args.results_format == 'archive':
+                    # Results archives are uploaded without
+                    # `Content-Encoding` so that they can be read with Range
+                    # requests
+                    uploader.put(writer.archive_path, content_encoding=None)
+                    uploader.put(writer.index_path)
+                elif args.results_format == 'objects':
+                    uploader.put(get_map_path(self.results_base_path))
+
+            # Including the files uploaded while results were written
+            details.update(uploaded=uploader.uploaded,
+                           skipped=uploader.skipped)
+        print('Successfully uploaded!')
+        print('HTTP summary URL: %s' % self.results_url)
+
+        if not args.create_testrun:
+            print('==================================================')
+            print('Stopping here')
+            print('pass --create-testrun to create and promote this TestRun).')
+            return True
+
+        print('==================================================')
+        print('Creating new TestRun in the dashboard...')
+        url = '%s/api/run' % config['wptd_prod_host']
+        with telemetry.phase('create_testrun') as details:
+            response = requests.post(url, params={
+                    'secret': config['secret']
+                },
+                data=json.dumps({
+                    'browser_name': platform['browser_name'],
+                    'browser_version': platform['browser_version'],
+                    'commit_date': self.wpt_commit_date,
+                    'os_name': platform['os_name'],
+                    'os_version': platform['os_version'],
+                    'revision': short_wpt_sha,
+                    'results_url': self.results_url
+                }
+            ))
+            details['status_code'] = response.status_code
+        if response.status_code == 201:
+            print('Run created!')
+        else:
+            print('There was an issue creating the TestRun.')
+
+        print('Response status code:', response.status_code)
+        print('Response text:', response.text)
+
+        return True
+
+
+def verify_platform(platform, config):
+    '''Verify that the given platform can be run on this host.
+
+    Returns the path to the browser binary (`None` for remote browsers).'''
+
+    if platform.get('sauce'):
+        return None
+
+    browser_binary = None
+    if platform['browser_name'] == 'chrome':
+        browser_binary = config['chrome_binary']
+    elif platform['browser_name'] == 'firefox':
+        browser_binary = config['firefox_binary']
+
+    if platform['browser_name'] == 'chrome':
+        verify_browser_binary_version(platform, browser_binary)
+    verify_os_name(platform)
+    verify_or_set_os_version(platform)
+
+    return browser_binary
+
+
+def needs_firefox_install(platform):
+    return (platform['browser_name'] == 'firefox' and
+            not platform.get('sauce'))
+
+
+def install_firefox(config):
+    '''Install Firefox into the virtualenv of the WPT checkout (where `wpt run
+    --install-browser` would). Returns the path to the browser binary.'''
+
+    return_code = subprocess.check_call(
+        ['./wpt', 'install', 'firefox', 'browser', '--destination', '_venv'],
+        cwd=config['wpt_path']
+    )
+    assert return_code == 0
+
+    return '%s/_venv/firefox/firefox' % config['wpt_path']
+
+
+def get_available_memory():
+    '''Determine the amount of memory (in megabytes) available to new
+    processes, or `None` if it cannot be determined.'''
+
+    try:
+        with open('/proc/meminfo') as handle:
+            for line in handle:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (IOError, ValueError):
+        pass
+
+    return None
+
+
+def get_chunk_slots(args):
+    '''Determine the number of chunks (of all platforms) which may run
+    concurrently: at most `--parallel-chunks`, limited by the number of
+    chunks the host's CPUs and memory can accommodate given `--chunk-cpus`
+    and `--chunk-memory`.'''
+
+    slots = args.parallel_chunks
+
+    if args.chunk_cpus:
+        slots = min(slots, int(multiprocessing.cpu_count() / args.chunk_cpus))
+
+    if args.chunk_memory:
+        memory = get_available_memory()
+        if memory is not None:
+            slots = min(slots, memory // args.chunk_memory)
+
+    return max(slots, 1)
+
+
+def get_sauce_command(platform, args, config):
+    if platform['browser_name'] == 'edge':
+        sauce_browser_name = 'MicrosoftEdge'
+    else:
+        sauce_browser_name = platform['browser_name']
+
+    command = [
+        './wpt', 'run', 'sauce:%s:%s' % (
+            sauce_browser_name, platform['browser_version']),
+        '--sauce-platform=%s %s' % (
+            platform['os_name'], platform['os_version']),
+        '--sauce-key=%s' % config['sauce_key'],
+        '--sauce-user=%s' % config['sauce_user'],
+        '--sauce-connect-binary=%s' % config['sauce_connect_binary'],
+        '--sauce-tunnel-id=%s' % config['sauce_tunnel_id'],
+        '--no-restart-on-unexpected',
+        '--processes=2',
+        '--run-by-dir=3',
+        '--no-manifest-update',
+        # Never wait for confirmation (e.g. of the installation of a driver)
+        '--yes',
+    ]
+
+    return command
+
+
+def get_local_command(platform, args, browser_binary):
+    command = [
+        './wpt', 'run',
+        platform['browser_name'],
+        '--no-manifest-update',
+        # Never wait for confirmation (e.g. of the installation of a driver)
+        '--yes',
+    ]
+
+    if platform['browser_name'] in ('chrome', 'firefox'):
+        command.extend(['--binary', browser_binary])
+    if platform['browser_name'] == 'firefox':
+        command.append('--certutil-binary=certutil')
+        # temporary fix to allow WebRTC tests to call getUserMedia
         command.extend([
-            '--this-chunk', str(this_chunk),
-            '--total-chunks', str(args.total_chunks)
+            '--setpref', 'media.navigator.streams.fake=true'
         ])
 
+    return command
+
+
+def run_chunk(this_chunk, base_command, report, args, config,
+              report_chunks_path, raw_logs_path, displays=None, env=None,
+              chunk_tests=None, telemetry=None, resources_path=None,
+              profiler=None, server_slots=None):
+    '''Run a single chunk of WPT and load the results into `report`. The
+    chunk is made up of the tests in `chunk_tests` if specified; otherwise,
+    the division of tests is left to the `wpt` CLI. If an attempt fails to
+    produce results for every test in the chunk, subsequent attempts run only
+    the missing tests (except those which stalled an attempt).
+
+    Returns the number of tests defined in the chunk.'''
+
+    if chunk_tests is not None and len(chunk_tests) == 0:
+        print('No tests planned for chunk %s' % this_chunk)
+        return 0
+
+    telemetry = telemetry or Telemetry()
+    profiler = profiler or StageProfiler()
+
+    # The tests defined in the chunk are only known once an attempt has
+    # reported them (possibly in an earlier, interrupted invocation)
+    missing_tests = report.missing_tests(this_chunk)
+
+    if missing_tests == []:
+        print('Chunk %s is already complete' % this_chunk)
+        return len(report.expected_tests(this_chunk))
+
+    abs_current_chunk_path = os.path.join(
+        report_chunks_path, 'current-%s.json' % this_chunk
+    )
+
+    command = list(base_command)
+    command.append('--log-mach=-')
+    command.extend(['--log-wptreport', abs_current_chunk_path])
+    command.append('--install-fonts')
+
+    env = dict(env or os.environ)
+
+    # Tests which were running when an attempt stalled are not run again
+    stalled_tests = set()
+
+    # Sauce Labs runs and headless browsers do not require a local X server.
+    # The display is acquired by the first attempt which is able to.
+    display = None
+    display_acquired = False
+
+    if server_slots is not None:
+        server_slot = server_slots.acquire()
+        command = server_slots.prepare(server_slot, command)
+
+    try:
         for attempt_number in range(1, args.max_attempts + 1):
             print('Running chunk %s of %s (attempt %s of %s)' % (
                 this_chunk, args.total_chunks, attempt_number,
                 args.max_attempts
             ))
 
+            if displays is not None and not display_acquired:
+                try:
+                    display = displays.acquire()
+                    display_acquired = True
+                except DisplayError as e:
+                    print('Unable to provide an X server for chunk %s: %s' % (
+                        this_chunk, e
+                    ))
+                    telemetry.event('display_error', chunk=this_chunk,
+                                    attempt=attempt_number, error=str(e))
+                    continue
+
+            # Raw logs are retained until the end of the run, when the test
+            # durations they describe are recorded.
+            raw_log_filename = os.path.join(
+                raw_logs_path, '%s-of-%s-attempt-%s.log' % (
+                    this_chunk, args.total_chunks, attempt_number
+                )
+            )
+            include_filename = os.path.join(
+                raw_logs_path, '%s-of-%s-attempt-%s-tests.txt' % (
+                    this_chunk, args.total_chunks, attempt_number
+                )
+            )
+
+            if missing_tests is not None:
+                print('Retrying %s tests missing from chunk %s' % (
+                    len(missing_tests), this_chunk
+                ))
+                command_line = get_chunk_command(command, this_chunk, args,
+                                                 missing_tests,
+                                                 include_filename)
+            else:
+                command_line = get_chunk_command(command, this_chunk, args,
+                                                 chunk_tests,
+                                                 include_filename)
+
+            command_env = env
+            if displays is not None:
+                command_line, command_env = displays.prepare(
+                    display, command_line, env
+                )
+
             # In the event of a failed attempt, previously-created files will
             # still be available on disk. Remove these to guard against errors
             # where the next attempt fails to write new results.
@@ -208,118 +980,390 @@ def main(platform_id, platform, args, config):
                 except OSError:
                     pass
 
-            return_code = subprocess.call(command, cwd=config['wpt_path'])
+            attempt = telemetry.phase(
+                'chunk_attempt', chunk=this_chunk, attempt=attempt_number,
+                retried_tests=(len(missing_tests)
+                               if missing_tests is not None else None)
+            )
+            with attempt as details:
+                command_line = command_line + ['--log-raw', raw_log_filename]
+
+                # The watchdog stops the process group of a stalled run
+                if args.stall_timeout:
+                    process = start_process(
+                        command_line, cwd=config['wpt_path'], env=command_env
+                    )
+                else:
+                    process = subprocess.Popen(
+                        command_line, cwd=config['wpt_path'], env=command_env
+                    )
+
+                sampler = None
+                if resources_path is not None:
+                    sampler = ProcessSampler(
+                        process.pid, args.sample_resources,
+                        os.path.join(resources_path,
+                                     '%s-of-%s-attempt-%s.jsonl' % (
+                                         this_chunk, args.total_chunks,
+                                         attempt_number
+                                     ))
+                    )
+                    sampler.start()
+
+                if args.stall_timeout:
+                    watchdog = Watchdog(raw_log_filename, args.stall_timeout)
+                    return_code = watchdog.wait(process)
+                    details['stalled_test'] = watchdog.stalled_test
+
+                    if watchdog.stalled:
+                        print(
+                            'Chunk %s made no progress for %s seconds (while '
+                            'running %s). Stopped after %s tests.' % (
+                                this_chunk, args.stall_timeout,
+                                watchdog.stalled_test,
+                                watchdog.completed_tests
+                            )
+                        )
+
+                        if watchdog.stalled_test is not None:
+                            stalled_tests.add(watchdog.stalled_test)
+
+                        # The wptreport file is only written once every test
+                        # has run, so the results of the tests which did end
+                        # are recovered from the raw log instead
+                        details['recovered_results'] = recover_report(
+                            raw_log_filename, abs_current_chunk_path
+                        )
+                else:
+                    return_code = process.wait()
+
+                details['return_code'] = return_code
+
+                if server_slots is not None:
+                    unexpected_ports = server_slots.unexpected_ports(
+                        server_slot, raw_log_filename
+                    )
+                    details['unexpected_ports'] = unexpected_ports
+
+                    if unexpected_ports:
+                        print(
+                            'WARNING: wptserve did not use the ports of the '
+                            'server slot of chunk %s (%s), so chunks run in '
+                            'parallel may interfere with one another. Is '
+                            '`config.json` read from the --tests root?' % (
+                                this_chunk, ', '.join(
+                                    '%s:%s' % port
+                                    for port in unexpected_ports
+                                )
+                            )
+                        )
+
+                if os.path.exists(include_filename):
+                    os.remove(include_filename)
+
+                if sampler is not None:
+                    resources = details['resources'] = sampler.stop()
+
+                    if resources['samples']:
+                        print('Chunk %s used at most %.1f CPUs and %.0f MB '
+                              'of memory' % (
+                                  this_chunk, resources['peak_cpu'],
+                                  resources['peak_rss'] / (1024 * 1024)
+                              ))
+
+            print('Return code from wptrunner for chunk %s: %s' % (
+                this_chunk, return_code
+            ))
+            print('Chunk %s attempt %s took %.1f seconds' % (
+                this_chunk, attempt_number, details['duration']
+            ))
+
+            with telemetry.phase('load_chunk', chunk=this_chunk,
+                                 attempt=attempt_number) as details:
+                if missing_tests is None:
+                    with profiler.stage('get_expected_tests'):
+                        expected_tests = get_expected_tests(raw_log_filename)
 
-            print('Return code from wptrunner: %s' % return_code)
+                    if expected_tests is not None:
+                        print('%s tests defined in chunk %s' % (
+                            len(expected_tests), this_chunk
+                        ))
+                        report.set_expected_tests(this_chunk, expected_tests)
+                        details['expected_tests'] = len(expected_tests)
 
-            chunk_test_count = len(get_expected_tests(raw_log_filename))
+                if os.path.exists(abs_current_chunk_path):
+                    details['bytes'] = os.path.getsize(abs_current_chunk_path)
 
-            print('%s tests defined in chunk' % chunk_test_count)
+                try:
+                    with profiler.stage('load_chunk'):
+                        count = report.load_chunk(this_chunk,
+                                                  abs_current_chunk_path)
+                    details['results'] = count
 
-            expected_test_count += chunk_test_count
+                    print('Report for chunk %s contains %s results' % (
+                        this_chunk, count
+                    ))
+                except InsufficientData:
+                    details['results'] = 0
 
-            try:
-                data = report.load_chunk(this_chunk, abs_current_chunk_path)
+            missing_tests = report.missing_tests(this_chunk)
 
-                print 'Report contains %s results' % len(data['results'])
+            if missing_tests is not None and stalled_tests:
+                missing_tests = [
+                    test for test in missing_tests if test not in stalled_tests
+                ]
 
+            if missing_tests is None:
+                if report.chunk_tests(this_chunk):
+                    break
+
+                continue
+
+            if not missing_tests:
                 break
-            except InsufficientData:
-                pass
         else:
-            print (
-                'No results found after %s attempts. Giving up.' %
-                args.max_attempts
-            )
+            if not report.chunk_tests(this_chunk):
+                print(
+                    'No results found for chunk %s after %s attempts. '
+                    'Giving up.' % (this_chunk, args.max_attempts)
+                )
+            else:
+                print(
+                    '%s tests still missing from chunk %s after %s attempts. '
+                    'Giving up.' % (
+                        len(missing_tests), this_chunk, args.max_attempts
+                    )
+                )
+    finally:
+        if server_slots is not None:
+            server_slots.release(server_slot)
+        if display_acquired:
+            displays.release(display)
+
+    return len(report.expected_tests(this_chunk) or [])
+
+
+def get_chunk_command(command, this_chunk, args, tests=None,
+                      include_filename=None):
+    '''Add the arguments which select the tests of a chunk to a `wpt run`
+    command: either an explicit list of tests or the `wpt` CLI's own
+    chunking of the tests beneath `--path`.
+
+    A list of tests whose arguments would be longer than
+    `MAX_INCLUDE_LENGTH` is written to `include_filename` instead, so that
+    the command does not exceed the operating system's limit.'''
+
+    if tests is None:
+        command = list(command)
+        if args.path:
+            # Paths follow the product
+            command.insert(3, args.path)
+
+        return command + [
+            '--this-chunk', str(this_chunk),
+            '--total-chunks', str(args.total_chunks)
+        ]
+
+    # The explicit tests are all beneath `--path`. The path itself is
+    # omitted because the `wpt` CLI would include every test beneath it.
+    includes = ['--include=%s' % test for test in tests]
+
+    if (include_filename is not None and
+            sum(len(include) + 1 for include in includes) >
+            MAX_INCLUDE_LENGTH):
+        with open(include_filename, 'w') as handle:
+            for test in tests:
+                handle.write('%s\n' % test)
 
+        return command + ['--include-file=%s' % include_filename]
+
+    return command + includes
+
+
+def is_below_threshold(actual_test_count, expected_test_count,
+                       partial_threshold):
+    '''Determine whether the proportion of expected tests which have results
+    is below the given percentage.'''
+
+    return bool(expected_test_count and
+                actual_test_count / expected_test_count <
+                partial_threshold / 100)
+
+
+def record_durations(duration_store, short_wpt_sha, raw_logs_path):
+    '''Move the results described by the raw logs of the current run into
+    the duration store. Later attempts take precedence over earlier ones.'''
+
+    raw_log_filenames = sorted(
+        glob.glob(os.path.join(raw_logs_path, '*.log')), key=os.path.getmtime
+    )
+
+    for raw_log_filename in raw_log_filenames:
+        duration_store.add_raw_log(short_wpt_sha, raw_log_filename)
         os.remove(raw_log_filename)
 
-    print('==================================================')
-    print('Finished WPT run')
 
-    if platform['browser_name'] == 'firefox':
-        print('Verifying installed firefox matches platform ID')
-        firefox_path = '%s/_venv/firefox/firefox' % config['wpt_path']
-        verify_browser_binary_version(platform, firefox_path)
+def plan_balanced_chunks(config, args, durations):
+    '''Divide the tests described by the WPT manifest into chunks with
+    approximately equal expected running time.
+
+    Returns a list of test lists (one per chunk), or `None` if the tests
+    cannot be enumerated.'''
+
+    manifest_path = os.path.join(config['wpt_path'], 'MANIFEST.json')
 
-    print('Creating summary of results')
     try:
-        summary = report.summarize()
+        tests = chunk_planner.read_manifest_tests(manifest_path, args.path)
+    except (IOError, ValueError, KeyError):
+        return None
 
-        actual_test_count = len(summary.keys())
-        actual_percentage = actual_test_count / expected_test_count
+    if not tests:
+        return None
 
-        if actual_percentage < args.partial_threshold / 100:
-            raise InsufficientData('%s of %s is below threshold of %s%%' % (
-                actual_test_count, expected_test_count, args.partial_threshold)
-            )
-    except InsufficientData as exc:
-        logging.fatal('Insufficient report data (%s). Stopping.', exc)
-        exit(1)
+    plan = chunk_planner.plan_chunks(tests, durations, args.total_chunks)
 
-    print('==================================================')
-    print('Writing summary.json.gz to local filesystem')
-    write_gzip_json(abs_sha_summary_gz_path, summary)
-    print('Wrote file %s' % abs_sha_summary_gz_path)
+    for index, (expected_duration, chunk_tests) in enumerate(plan):
+        print('Chunk %s: %s tests (expected duration %.1f seconds)' % (
+            index + 1, len(chunk_tests), expected_duration
+        ))
 
-    print('==================================================')
-    print('Writing individual result files to local filesystem')
-    for result in report.each_result():
-        test_file = result['test']
-        filepath = '%s%s' % (gs_results_base_path, test_file)
-        write_gzip_json(filepath, result)
-        print('Wrote file %s' % filepath)
-
-    if not args.upload:
-        print('==================================================')
-        print('Stopping here (pass --upload to upload results to WPTD).')
-        return
+    return [chunk_tests for _, chunk_tests in plan]
 
-    print('==================================================')
-    print('Uploading results to gs://%s' % config['gs_results_bucket'])
-    command = ['gsutil', '-m', '-h', 'Content-Encoding:gzip',
-               'rsync', '-r', short_wpt_sha, 'gs://wptd/%s' % short_wpt_sha]
-    return_code = subprocess.check_call(command, cwd=config['build_path'])
-    assert return_code == 0
-    print('Successfully uploaded!')
-    print('HTTP summary URL: %s' % gs_results_url)
 
-    if not args.create_testrun:
-        print('==================================================')
-        print('Stopping here')
-        print('pass --create-testrun to create and promote this TestRun).')
-        return
+def get_baseline_results_path(config, args, platform_id):
+    return "%s/%s/%s" % (
+        config['build_path'], args.baseline_sha[:10],
+        args.baseline_platform or platform_id
+    )
 
-    print('==================================================')
-    print('Creating new TestRun in the dashboard...')
-    url = '%s/api/run' % config['wptd_prod_host']
-    response = requests.post(url, params={
-            'secret': config['secret']
-        },
-        data=json.dumps({
-            'browser_name': platform['browser_name'],
-            'browser_version': platform['browser_version'],
-            'commit_date': wpt_commit_date,
-            'os_name': platform['os_name'],
-            'os_version': platform['os_version'],
-            'revision': short_wpt_sha,
-            'results_url': gs_results_url
-        }
-    ))
-    if response.status_code == 201:
-        print('Run created!')
-    else:
-        print('There was an issue creating the TestRun.')
 
-    print('Response status code:', response.status_code)
-    print('Response text:', response.text)
+def plan_incremental_run(config, args, wpt_sha, platform_id):
+    '''Determine which tests must be run in order to update the results of
+    the baseline run (specified by `--baseline-sha` and
+    `--baseline-platform`) to the current WPT revision. Tests are run if they
+    may be affected by changes to WPT, if they are new, or if the baseline run
+    has no result file for them.
+
+    Returns a `(tests, carried_summary)` tuple, where `carried_summary` is
+    the part of the baseline summary which remains valid, or `None` if a full
+    run is required.'''
+
+    baseline_results_path = get_baseline_results_path(
+        config, args, platform_id
+    )
+    baseline_summary_path = '%s-summary.json.gz' % baseline_results_path
+    baseline_results = open_results(baseline_results_path)
+    manifest_path = os.path.join(config['wpt_path'], 'MANIFEST.json')
+
+    try:
+        baseline_summary = read_gzip_json(baseline_summary_path)
+    except (IOError, ValueError):
+        print('Unable to read baseline summary %s' % baseline_summary_path)
+        return None
+
+    try:
+        test_files = incremental.read_manifest_test_files(manifest_path)
+    except (IOError, ValueError, KeyError):
+        print('Unable to read tests from WPT manifest')
+        return None
+
+    try:
+        changed_files = incremental.get_changed_files(
+            config['wpt_path'], args.baseline_sha, wpt_sha
+        )
+    except subprocess.CalledProcessError:
+        print('Unable to compare WPT revisions %s and %s' % (
+            args.baseline_sha, wpt_sha
+        ))
+        return None
+
+    affected_tests = incremental.get_affected_tests(test_files, changed_files)
+
+    if affected_tests is None:
+        print('Changes since %s may affect any test' % args.baseline_sha)
+        return None
+
+    prefix = '/' + args.path.lstrip('/')
+    tests = []
+    carried_summary = {}
+
+    for test_ids in test_files.values():
+        for test in test_ids:
+            if not test.startswith(prefix):
+                continue
+
+            if (test not in affected_tests and test in baseline_summary and
+                    baseline_results.has(test)):
+                carried_summary[test] = baseline_summary[test][:2] + [1]
+            else:
+                tests.append(test)
+
+    return sorted(tests), carried_summary
+
+
+def carry_over_results(config, args, platform_id, results_base_path,
+                       tests, writer=None):
+    '''Copy the individual results of the given tests from the baseline run,
+    either to per-test files or to the given `ArchiveWriter` or
+    `ObjectWriter`.'''
+
+    baseline_results = open_results(
+        get_baseline_results_path(config, args, platform_id)
+    )
+
+    for test in tests:
+        data = baseline_results.get_member(test)
+
+        if writer is not None:
+            writer.add(test, data)
+            continue
+
+        filepath = '%s%s' % (results_base_path, test)
+        mkdirp(os.path.dirname(filepath))
+        with open(filepath, 'wb') as handle:
+            handle.write(data)
+
+
+def upload_objects(object_store, uploader):
+    '''Upload the result objects which have not yet been uploaded (including
+    those queued by `ObjectWriter` as they were written).'''
+
+    # Objects written by this run are queued as they are stored
+    uploader.flush()
+
+    digests = object_store.pending_uploads()
+
+    print('Uploading %s new result objects' % len(digests))
+
+    for digest in digests:
+        uploader.put(object_store.object_path(digest),
+                     get_object_name(digest),
+                     content_type='application/json')
+    uploader.flush()
+
+    object_store.mark_uploaded(digests)
+    object_store.save()
+
+
+def is_headless(platform, args):
+    '''Determine whether the browser should be run without an X server. The
+    `--headless`/`--no-headless` flags take precedence over the `headless`
+    option in browsers.json.'''
+
+    if args.headless is not None:
+        return args.headless
+
+    return bool(platform.get('headless'))
+
+
+def needs_display(platform, args):
+    return not platform.get('sauce') and not is_headless(platform, args)
 
 
 def setup_wpt(config):
     wpt_setup_commands = [
         ['git', 'checkout', 'master'],
         ['git', 'pull'],
-        ['./wpt', 'manifest', '--work'],
     ]
     for command in wpt_setup_commands:
         return_code = subprocess.check_call(command, cwd=config['wpt_path'])
@@ -330,6 +1374,18 @@ def setup_wpt(config):
     return 0
 
 
+def recover_report(raw_log_filename, report_filename):
+    '''Write a wptreport file containing the results of the tests which ended
+    in a raw log. Returns the number of results.'''
+
+    if not os.path.exists(raw_log_filename):
+        return 0
+
+    with open(raw_log_filename) as source:
+        with open(report_filename, 'w') as output:
+            return write_report(output, results_from_raw_log(source))
+
+
 def get_expected_tests(filename):
     '''Retrieve a list of strings which define all tests available in a given
     Web Platform Test repository. This number is distinct from the number of
@@ -348,25 +1404,40 @@ def get_expected_tests(filename):
             return data.get('tests').get('default')
 
 
-def get_commit_details(mainargs, config, logger):
-    wpt_sha = ''
-    wpt_date = ''
+def fetch_wpt(config):
+    '''Update the WPT clone without changing its checked-out revision.'''
+
+    return_code = subprocess.check_call(
+        ['git', 'fetch', 'origin'], cwd=config['wpt_path']
+    )
+    assert return_code == 0
+
 
+def get_wpt_sha(mainargs, config, logger, ref=None):
     if mainargs.wpt_sha:
-        wpt_sha = mainargs.wpt_sha
-    else:
-        sha_finder = shas.SHAFinder(logger)
-        wpt_sha = (sha_finder.get_todays_sha(config['wpt_path'])
-                   or sha_finder.get_head_sha(config['wpt_path']))
+        return mainargs.wpt_sha
 
-    subprocess.call(['git', 'checkout', wpt_sha], cwd=config['wpt_path'])
+    sha_finder = shas.SHAFinder(logger)
+
+    return (sha_finder.get_todays_sha(config['wpt_path'], ref)
+            or sha_finder.get_head_sha(config['wpt_path']))
+
+
+def get_commit_date(wpt_path):
     output = subprocess.check_output(
         ['git', 'log', '-1', '--format=%cd', '--date=iso-strict'],
-        cwd=config['wpt_path']
+        cwd=wpt_path
     )
-    wpt_date = output.decode('UTF-8').strip()
 
-    return wpt_sha, wpt_date
+    return output.decode('UTF-8').strip()
+
+
+def get_commit_details(mainargs, config, logger):
+    wpt_sha = get_wpt_sha(mainargs, config, logger)
+
+    subprocess.call(['git', 'checkout', wpt_sha], cwd=config['wpt_path'])
+
+    return wpt_sha, get_commit_date(config['wpt_path'])
 
 
 def get_and_validate_platform(platform_id):
@@ -377,6 +1448,22 @@ def get_and_validate_platform(platform_id):
     return browsers[platform_id]
 
 
+def get_platforms(args):
+    '''Retrieve the `(platform_id, platform)` tuples of the platforms to run,
+    as specified on the command line.'''
+
+    if args.all_currently_run:
+        with open('webapp/browsers.json') as f:
+            browsers = json.load(f)
+
+        return [(platform_id, browsers[platform_id])
+                for platform_id in sorted(browsers)
+                if browsers[platform_id].get('currently_run')]
+
+    return [(platform_id, get_and_validate_platform(platform_id))
+            for platform_id in args.platform_ids]
+
+
 def version_string_to_major_minor(version):
     assert version
     return re.search("[0-9]{1,3}.[0-9]{1,3}", str(version)).group(0)
@@ -425,17 +1512,9 @@ def mkdirp(path):
         pass
 
 
-def write_gzip_json(filepath, payload):
-    mkdirp(os.path.dirname(filepath))
-
-    with gzip.open(filepath, 'wb') as f:
-        payload_str = json.dumps(payload)
-        f.write(payload_str)
-
-
-def verify_gsutil_installed(config):
-    assert subprocess.check_output(['which', 'gsutil']), (
-        'gsutil required for upload')
+def read_gzip_json(filepath):
+    with gzip.open(filepath, 'rb') as f:
+        return json.loads(f.read())
 
 
 def get_config():
@@ -475,8 +1554,17 @@ def parse_percent(string):
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        'platform_id',
-        help='A platform ID, specified as keys in browsers.json.'
+        'platform_ids',
+        help=('Platform IDs, specified as keys in browsers.json. The chunks '
+              'of all platforms are scheduled together.'),
+        metavar='platform_id',
+        nargs='*'
+    )
+    parser.add_argument(
+        '--all-currently-run',
+        help=('Run every platform whose `currently_run` option is true in '
+              'browsers.json.'),
+        action='store_true'
     )
     parser.add_argument(
         '--path',
@@ -512,6 +1600,117 @@ def parse_args():
         type=int,
         default=1
     )
+    parser.add_argument(
+        '--balance-chunks',
+        help=('Divide tests between chunks according to their durations in '
+              'the most recent previous run of this platform (instead of the '
+              '`wpt` CLI\'s default chunking).'),
+        action='store_true'
+    )
+    parser.add_argument(
+        '--parallel-chunks',
+        help=('Maximum number of chunks (of all platforms) to run '
+              'concurrently. Each chunk is given its own X server, wptserve '
+              'ports and output files.'),
+        type=int,
+        default=1
+    )
+    parser.add_argument(
+        '--chunk-cpus',
+        help=('Number of CPUs reserved for each concurrently-running chunk. '
+              'Limits --parallel-chunks to the CPUs of the host.'),
+        type=float
+    )
+    parser.add_argument(
+        '--chunk-memory',
+        help=('Memory (in megabytes) reserved for each concurrently-running '
+              'chunk. Limits --parallel-chunks to the available memory of '
+              'the host.'),
+        type=int
+    )
+    parser.add_argument(
+        '--xvfb-pool',
+        help=('Start one long-lived Xvfb server per parallel chunk and reuse '
+              'it across chunks (instead of one `xvfb-run` per attempt).'),
+        action='store_true'
+    )
+    parser.add_argument(
+        '--headless',
+        help=('Run the browser without an X server, regardless of the '
+              '`headless` option in browsers.json.'),
+        action='store_true',
+        default=None
+    )
+    parser.add_argument(
+        '--no-headless',
+        help=('Run the browser with an X server, regardless of the '
+              '`headless` option in browsers.json.'),
+        dest='headless',
+        action='store_false'
+    )
+    parser.add_argument(
+        '--resume',
+        help=('Continue an interrupted run of the same WPT revision, platform '
+              'and --total-chunks, skipping chunks which are already '
+              'complete.'),
+        action='store_true'
+    )
+    parser.add_argument(
+        '--worktrees',
+        help=('Run in a git worktree of the WPT revision (created in '
+              '`{build_path}/worktrees` from the clone at `wpt_path`) '
+              'instead of checking the revision out in `wpt_path`, so that '
+              'several platforms may be run on the same host concurrently.'),
+        action='store_true'
+    )
+    parser.add_argument(
+        '--writer-threads',
+        help='Number of threads which write individual result files.',
+        type=int,
+        default=multiprocessing.cpu_count()
+    )
+    parser.add_argument(
+        '--pipeline',
+        help=('Write (and with --upload, upload) the individual results of '
+              'each chunk as soon as it is complete, while later chunks '
+              'run. Only the summary and TestRun wait for the last chunk.'),
+        action='store_true'
+    )
+    parser.add_argument(
+        '--upload-threads',
+        help='Number of threads which upload result files (with --upload).',
+        type=int,
+        default=8
+    )
+    parser.add_argument(
+        '--compression-level',
+        help=('gzip compression level (1-9) of individual result files. '
+              'Defaults to 9.'),
+        type=int,
+        choices=range(1, 10)
+    )
+    parser.add_argument(
+        '--results-format',
+        help=('Write individual results as one gzip file per test '
+              '(`files`), as a single indexed archive per platform '
+              '(`archive`, see results_archive.py), or as objects which are '
+              'shared by runs with identical results (`objects`, see '
+              'result_objects.py). Only `files` may be used with '
+              '--create-testrun.'),
+        choices=('files', 'archive', 'objects'),
+        default='files'
+    )
+    parser.add_argument(
+        '--baseline-sha',
+        help=('Only run the tests affected by changes to WPT since this '
+              'previously-run revision, and carry over the results of all '
+              'other tests from that run.')
+    )
+    parser.add_argument(
+        '--baseline-platform',
+        help=('Platform ID of the run specified by --baseline-sha. Defaults '
+              'to the platform being run.')
+    )
     parser.add_argument(
         '--max_attempts',
         help=('Maximum number of times to re-try running any given failing '
@@ -520,6 +1719,33 @@ def parse_args():
         default=3
     )
 
+    parser.add_argument(
+        '--stall-timeout',
+        help=('Stop an attempt to run a chunk if no test completes within '
+              'this many seconds. The results of the tests which completed '
+              'are kept, and the remaining tests (except the one which '
+              'stalled) are re-tried. Disabled by default.'),
+        type=int
+    )
+
+    parser.add_argument(
+        '--sample-resources',
+        help=('Record the CPU, memory, open files and number of processes '
+              'used by each `wpt run` (including the browser) every this '
+              'many seconds, in {build_path}/telemetry/resources. Disabled '
+              'by default.'),
+        type=float
+    )
+
+    parser.add_argument(
+        '--profile',
+        help=('Profile the processing of results (e.g. loading reports and '
+              'writing results), writing the profile and peak memory of each '
+              'stage to {build_path}/profiles and printing the functions '
+              'which took the most time.'),
+        action='store_true'
+    )
+
     parser.add_argument(
         '--partial-threshold',
         help=('Save reports for datasets that omit results for some tests. '
@@ -532,11 +1758,21 @@ def parse_args():
     )
     args = parser.parse_args()
 
+    if not args.platform_ids and not args.all_currently_run:
+        parser.error('Specify platform IDs or --all-currently-run')
+
+    # The dashboard links to the result file of each test, which the other
+    # formats do not write
+    if args.create_testrun and args.results_format != 'files':
+        parser.error('--create-testrun requires --results-format files')
+
     return args
 
 
 if __name__ == '__main__':
+    signal.signal(signal.SIGTERM, exit_on_signal)
+
     args = parse_args()
-    platform = get_and_validate_platform(args.platform_id)
+    platforms = get_platforms(args)
     config = get_config()
-    main(args.platform_id, platform, args, config)
+    main(platforms, args, config)
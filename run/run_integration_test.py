@@ -11,6 +11,10 @@ import shutil
 import subprocess
 import unittest
 
+import durations
+import report
+import results_archive
+import telemetry
 from testing_tools import command_stubber
 
 here = os.path.dirname(os.path.realpath(__file__))
@@ -34,6 +38,9 @@ class TestRun2(unittest.TestCase):
             os.path.join(mock_wptd_dir, 'run')
         ]
         self.wpt_expected_tests = ['/dummy.html']
+        # Whether the stubbed `wpt run` reads the ports of its servers from
+        # the `config.json` of its tests root
+        self.wpt_reads_config = True
 
         for tmp_dir in self.tmp_dirs:
             try:
@@ -62,6 +69,11 @@ class TestRun2(unittest.TestCase):
         for tmp_dir in reversed(self.tmp_dirs):
             shutil.rmtree(tmp_dir)
 
+        try:
+            os.remove(os.path.join(mock_wpt_dir, 'MANIFEST.json'))
+        except OSError:
+            pass
+
     def write_browsers_manifest(self, data):
         full_path = os.path.join(mock_wptd_dir, 'webapp', 'browsers.json')
 
@@ -80,21 +92,45 @@ class TestRun2(unittest.TestCase):
                                        stderr=subprocess.PIPE)
 
     def cmd_wpt(self, *args):
+        if 'manifest' in args:
+            manifest_path = os.path.join(mock_wpt_dir, 'MANIFEST.json')
+
+            if not os.path.exists(manifest_path):
+                with open(manifest_path, 'w') as handle:
+                    json.dump({'items': {}, 'version': 4}, handle)
+
         if 'run' in args:
             try:
                 index = args.index('--log-wptreport')
             except ValueError:
                 return
 
+            # Retries of tests which are missing from a chunk's report do
+            # not produce results once the configured reports are exhausted
             wptreport_path = os.path.join(log_dir, args[index + 1])
             with open(wptreport_path, 'w') as log:
-                log.write(self.wpt_log_contents.pop(0))
+                if self.wpt_log_contents:
+                    log.write(self.wpt_log_contents.pop(0))
 
             try:
                 index = args.index('--log-raw')
             except ValueError:
                 return
 
+            expected_tests = self.wpt_expected_tests
+            includes = [
+                arg[len('--include='):] for arg in args
+                if arg.startswith('--include=')
+            ]
+            for arg in args:
+                if arg.startswith('--include-file='):
+                    with open(arg[len('--include-file='):]) as handle:
+                        includes.extend(handle.read().splitlines())
+            if includes:
+                expected_tests = [
+                    test for test in expected_tests if test in includes
+                ]
+
             rawlog_path = os.path.join(log_dir, args[index + 1])
             irrelevant_data = '''
                 {}
@@ -102,12 +138,30 @@ class TestRun2(unittest.TestCase):
                 {"action": "other", "tests": {} }"
                 {"action": "other", "tests": { "default": [] }'''
 
-            raw_log_contents = '\n'.join([
+            ports = {'http': [8000, 8001], 'https': [8443], 'ws': [8888],
+                     'wss': [8889]}
+            if '--tests' in args and self.wpt_reads_config:
+                tests_root = args[args.index('--tests') + 1]
+                with open(os.path.join(tests_root, 'config.json')) as handle:
+                    ports = json.load(handle)['ports']
+            server_starts = [
+                json.dumps({
+                    'action': 'log',
+                    'level': 'INFO',
+                    'message': 'Starting %s server on web-platform.test:%s' % (
+                        scheme, port
+                    )
+                })
+                for scheme, scheme_ports in sorted(ports.items())
+                for port in scheme_ports
+            ]
+
+            raw_log_contents = '\n'.join(server_starts + [
                 irrelevant_data,
                 json.dumps({
                     'action': 'suite_start',
                     'tests': {
-                        'default': self.wpt_expected_tests
+                        'default': expected_tests
                     }
                 }),
                 irrelevant_data
@@ -338,75 +392,1142 @@ class TestRun2(unittest.TestCase):
             expected_output_dir + [platform_id, 'js', 'bitwise-and.html']
         )
 
-    def test_sauce_connect(self):
-        platform_id = 'edge-15-windows-10-sauce'
-        wpt_args = []
+    def test_telemetry(self):
+        platform_id = 'chrome-62.0-linux'
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', self.cmd_wpt)
+        self.wpt_log_file_name = 'wptd-%s-%s-report.log' % (
+            'c0ffee', platform_id
+        )
+        self.wpt_expected_tests = [
+            '/js/bitwise-or.html', '/js/bitwise-and.html'
+        ]
+        self.wpt_log_contents = [
+            json.dumps({'results': [
+                {'test': '/js/bitwise-or.html', 'status': 'OK',
+                 'message': None, 'subtests': []}
+            ]}),
+            json.dumps({'results': [
+                {'test': '/js/bitwise-and.html', 'status': 'OK',
+                 'message': None, 'subtests': []}
+            ]})
+        ]
+
+        # The first attempt omits a result, which is retried
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--sample-resources', '0.05'
+        ])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        filenames = glob.glob(os.path.join(log_dir, 'telemetry', '*.jsonl'))
+        self.assertEqual(len(filenames), 1)
+        events = list(telemetry.read_events(filenames))
+
+        self.assertEqual(events[0]['event'], 'run_start')
+        self.assertEqual(events[0]['platforms'], [platform_id])
+        self.assertEqual(events[-1]['event'], 'run_end')
+        self.assertEqual(events[-1]['failed'], [])
+
+        phases = dict(
+            ((event.get('platform'), event['phase'], event.get('chunk'),
+              event.get('attempt')), event)
+            for event in events if event['event'] == 'phase'
+        )
+
+        for phase in ('setup_wpt', 'resolve_sha', 'update_manifest'):
+            self.assertEqual(phases[(None, phase, None, None)]['status'], 'ok')
+
+        first_attempt = phases[(platform_id, 'chunk_attempt', 1, 1)]
+        self.assertEqual(first_attempt['return_code'], 0)
+        self.assertIsNone(first_attempt['retried_tests'])
+        self.assertGreaterEqual(first_attempt['resources']['samples'], 1)
+        self.assertGreater(first_attempt['resources']['peak_rss'], 0)
+        self.assertTrue(os.path.exists(os.path.join(
+            log_dir, 'telemetry', 'resources', 'c0ffee', platform_id,
+            '1-of-1-attempt-1.jsonl'
+        )))
+        self.assertEqual(
+            phases[(platform_id, 'chunk_attempt', 1, 2)]['retried_tests'], 1
+        )
+        self.assertEqual(
+            phases[(platform_id, 'load_chunk', 1, 1)]['expected_tests'], 2
+        )
+        # The results of the chunk, including those of earlier attempts
+        self.assertEqual(
+            phases[(platform_id, 'load_chunk', 1, 2)]['results'], 2
+        )
+        self.assertEqual(
+            phases[(platform_id, 'summarize', None, None)]['results'], 2
+        )
+        self.assertEqual(
+            phases[(platform_id, 'write_results', None, None)]['results'], 2
+        )
+        self.assertGreater(
+            phases[(platform_id, 'write_summary', None, None)]['bytes'], 0
+        )
+
+        for event in phases.values():
+            self.assertEqual(event['status'], 'ok')
+            self.assertGreaterEqual(event['duration'], 0)
+            if event.get('platform'):
+                self.assertEqual(event['wpt_sha'], 'c0ffee')
+
+    def test_pipeline(self):
+        platform_id = 'chrome-62.0-linux'
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', self.cmd_wpt)
+        self.wpt_log_file_name = 'wptd-%s-%s-report.log' % (
+            'c0ffee', platform_id
+        )
+        self.wpt_log_contents = [
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]}),
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-and.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': [
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'first'},
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'second'}
+                    ]
+                }
+            ]})
+        ]
+
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--total-chunks', '2', '--pipeline', '--profile'
+        ])
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertIn('Writing results of chunk 1 of %s' % platform_id, stdout)
+        self.assertIn('Writing results of chunk 2 of %s' % platform_id, stdout)
+
+        # Results are written by another thread, which is also profiled
+        self.assertEqual(
+            sorted(os.listdir(
+                os.path.join(log_dir, 'profiles', 'c0ffee', platform_id)
+            )),
+            ['each_result.pstats', 'get_expected_tests.pstats',
+             'load_chunk.pstats', 'memory.txt', 'summarize.pstats',
+             'write_gzip_json.pstats', 'write_result.pstats']
+        )
+        self.assertIn('each_result: 2 calls', stdout)
+
+        actual_output_dir = [log_dir, 'c0ffee']
+        expected_output_dir = [
+            here, 'expected_output', 'simple_report-2', 'c0ffee'
+        ]
+
+        self.assertJsonMatch(
+            actual_output_dir + ['%s-summary.json.gz' % platform_id],
+            expected_output_dir + ['%s-summary.json.gz' % platform_id]
+        )
+        self.assertJsonMatch(
+            actual_output_dir + [platform_id, 'js', 'bitwise-or.html'],
+            expected_output_dir + [platform_id, 'js', 'bitwise-or.html']
+        )
+        self.assertJsonMatch(
+            actual_output_dir + [platform_id, 'js', 'bitwise-and.html'],
+            expected_output_dir + [platform_id, 'js', 'bitwise-and.html']
+        )
+
+    def test_simple_report_2_parallel_chunks(self):
+        platform_id = 'chrome-62.0-linux'
+        server_ports = []
 
         def git(*args):
             if 'log' in args:
                 return {'stdout': 'c0ffee'}
 
         def wpt(*args):
-            wpt_args.append(args)
+            if 'run' in args:
+                # The tests root only exists while chunks are running
+                tests_root = args[args.index('--tests') + 1]
+                with open(os.path.join(tests_root, 'config.json')) as handle:
+                    server_ports.append(json.load(handle)['ports'])
+                self.assertEqual(
+                    os.path.realpath(args[args.index('--metadata') + 1]),
+                    os.path.realpath(mock_wpt_dir)
+                )
+
             return self.cmd_wpt(*args)
 
         self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
         self.write_browsers_manifest({
             platform_id: {
-                'initially_loaded': True,
-                'currently_run': True,
-                'browser_name': 'edge',
-                'browser_version': '15',
-                'os_name': 'windows',
-                'os_version': '10',
-                'sauce': True
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
             }
         })
         self.remote_control.add_handler('wpt', wpt)
         self.wpt_log_file_name = 'wptd-%s-%s-report.log' % (
             'c0ffee', platform_id
         )
-        self.wpt_log_contents = [json.dumps({
-            'results': [
+        self.wpt_log_contents = [
+            json.dumps({'results': [
                 {
                     'test': '/js/bitwise-or.html',
                     'status': 'OK',
                     'message': None,
                     'subtests': []
                 }
-            ]
-        })]
+            ]}),
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-and.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': [
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'first'},
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'second'}
+                    ]
+                }
+            ]})
+        ]
 
-        returncode, stdout, stderr = self.run_py([platform_id])
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--total-chunks', '2', '--parallel-chunks', '2'
+        ])
 
         self.assertEqual(returncode, 0, stderr)
 
-        actual_output_dir = [log_dir, 'c0ffee']
-        expected_output_dir = [
-            here, 'expected_output', 'sauce-report', 'c0ffee'
-        ]
+        # Each concurrently-running chunk serves the tests on its own ports
+        self.assertEqual(
+            len(set(json.dumps(ports, sort_keys=True)
+                    for ports in server_ports)), 2
+        )
+        self.assertEqual(
+            os.listdir(os.path.join(log_dir, 'server-slots')), []
+        )
+        # ...as reported by wptserve
+        self.assertNotIn('did not use the ports', stdout)
+
+        actual_output_dir = [log_dir, 'c0ffee']
+        expected_output_dir = [
+            here, 'expected_output', 'simple_report-2', 'c0ffee'
+        ]
+
+        self.assertJsonMatch(
+            actual_output_dir + ['%s-summary.json.gz' % platform_id],
+            expected_output_dir + ['%s-summary.json.gz' % platform_id]
+        )
+        self.assertJsonMatch(
+            actual_output_dir + [platform_id, 'js', 'bitwise-or.html'],
+            expected_output_dir + [platform_id, 'js', 'bitwise-or.html']
+        )
+        self.assertJsonMatch(
+            actual_output_dir + [platform_id, 'js', 'bitwise-and.html'],
+            expected_output_dir + [platform_id, 'js', 'bitwise-and.html']
+        )
+
+    def test_parallel_chunks_default_ports(self):
+        platform_id = 'chrome-62.0-linux'
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', self.cmd_wpt)
+        self.wpt_log_contents = []
+        # wptserve ignores the ports of the server slots
+        self.wpt_reads_config = False
+
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--total-chunks', '2', '--parallel-chunks', '2'
+        ])
+
+        self.assertIn(
+            'WARNING: wptserve did not use the ports of the server slot of '
+            'chunk 1', stdout
+        )
+        self.assertIn('http:8000', stdout)
+
+    def test_balanced_chunks(self):
+        platform_id = 'chrome-62.0-linux'
+        wpt_args = []
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        def wpt(*args):
+            wpt_args.append(args)
+            return self.cmd_wpt(*args)
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', wpt)
+
+        manifest_path = os.path.join(mock_wpt_dir, 'MANIFEST.json')
+        with open(manifest_path, 'w') as handle:
+            json.dump({'items': {'testharness': {
+                'js/bitwise-and.html': [['/js/bitwise-and.html', {}]],
+                'js/bitwise-or.html': [['/js/bitwise-or.html', {}]],
+                'js/bitwise-xor.html': [['/js/bitwise-xor.html', {}]]
+            }}}, handle)
+
+        store = durations.DurationStore(durations.get_store_path(
+            log_dir, platform_id
+        ))
+        raw_log_path = os.path.join(log_dir, 'previous-raw.log')
+        with open(raw_log_path, 'w') as handle:
+            handle.write('\n'.join(json.dumps(line) for line in [
+                {'action': 'test_start', 'test': '/js/bitwise-and.html',
+                 'time': 0},
+                {'action': 'test_end', 'test': '/js/bitwise-and.html',
+                 'time': 10000},
+                {'action': 'test_start', 'test': '/js/bitwise-or.html',
+                 'time': 10000},
+                {'action': 'test_end', 'test': '/js/bitwise-or.html',
+                 'time': 11000},
+                {'action': 'test_start', 'test': '/js/bitwise-xor.html',
+                 'time': 11000},
+                {'action': 'test_end', 'test': '/js/bitwise-xor.html',
+                 'time': 12000}
+            ]))
+        store.add_raw_log('deadbeef', raw_log_path)
+        store.close()
+
+        self.wpt_log_contents = [
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-and.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': [
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'first'},
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'second'}
+                    ]
+                }
+            ]}),
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]})
+        ]
+
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--total-chunks', '2', '--balance-chunks'
+        ])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        includes = [
+            sorted(arg for arg in args if arg.startswith('--include='))
+            for args in wpt_args if 'run' in args
+        ]
+
+        self.assertEqual(includes, [
+            ['--include=/js/bitwise-and.html'],
+            ['--include=/js/bitwise-or.html', '--include=/js/bitwise-xor.html']
+        ])
+
+        for args in wpt_args:
+            self.assertNotIn('--this-chunk', args)
+
+        store = durations.DurationStore(durations.get_store_path(
+            log_dir, platform_id
+        ))
+        self.assertEqual(store.shas(), ['c0ffee', 'deadbeef'])
+        store.close()
+
+        self.assertListEqual(os.listdir(os.path.join(
+            log_dir, 'c0ffee', '%s-raw-logs' % platform_id
+        )), [])
+
+    def test_resume(self):
+        platform_id = 'chrome-62.0-linux'
+        wpt_args = []
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        def wpt(*args):
+            wpt_args.append(args)
+            return self.cmd_wpt(*args)
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', wpt)
+
+        # Simulate an interrupted run which completed the first chunk
+        chunks_dir = os.path.join(
+            log_dir, 'c0ffee', '%s-report-chunks' % platform_id
+        )
+        os.makedirs(chunks_dir)
+        previous_report = report.Report(2, chunks_dir)
+        first_chunk_path = os.path.join(chunks_dir, 'current-1.json')
+        with open(first_chunk_path, 'w') as handle:
+            json.dump({'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]}, handle)
+        previous_report.load_chunk(1, first_chunk_path)
+        previous_report.set_expected_tests(1, ['/js/bitwise-or.html'])
+
+        self.wpt_log_contents = [
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-and.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': [
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'first'},
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'second'}
+                    ]
+                }
+            ]})
+        ]
+        self.wpt_expected_tests = ['/js/bitwise-and.html']
+
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--total-chunks', '2', '--resume'
+        ])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        run_invocations = [args for args in wpt_args if 'run' in args]
+
+        self.assertEqual(len(run_invocations), 1)
+        self.assertEqual(
+            run_invocations[0][run_invocations[0].index('--this-chunk') + 1],
+            '2'
+        )
+
+        actual_output_dir = [log_dir, 'c0ffee']
+        expected_output_dir = [
+            here, 'expected_output', 'simple_report-2', 'c0ffee'
+        ]
+
+        self.assertJsonMatch(
+            actual_output_dir + ['%s-summary.json.gz' % platform_id],
+            expected_output_dir + ['%s-summary.json.gz' % platform_id]
+        )
+        self.assertJsonMatch(
+            actual_output_dir + [platform_id, 'js', 'bitwise-or.html'],
+            expected_output_dir + [platform_id, 'js', 'bitwise-or.html']
+        )
+        self.assertJsonMatch(
+            actual_output_dir + [platform_id, 'js', 'bitwise-and.html'],
+            expected_output_dir + [platform_id, 'js', 'bitwise-and.html']
+        )
+
+    def test_incremental(self):
+        platform_id = 'chrome-62.0-linux'
+        wpt_args = []
+        git_args = []
+
+        def git(*args):
+            git_args.append(args)
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+            if 'diff' in args:
+                return {'stdout': 'js/bitwise-and.html\n'}
+
+        def wpt(*args):
+            wpt_args.append(args)
+            return self.cmd_wpt(*args)
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', wpt)
+
+        manifest_path = os.path.join(mock_wpt_dir, 'MANIFEST.json')
+        with open(manifest_path, 'w') as handle:
+            json.dump({'items': {'testharness': {
+                'js/bitwise-and.html': [['/js/bitwise-and.html', {}]],
+                'js/bitwise-not.html': [['/js/bitwise-not.html', {}]],
+                'js/bitwise-or.html': [['/js/bitwise-or.html', {}]]
+            }}}, handle)
+
+        # The baseline run has results for every test except the new
+        # `bitwise-not.html`
+        baseline_dir = os.path.join(log_dir, 'deadbeef')
+        os.makedirs(os.path.join(baseline_dir, platform_id, 'js'))
+        baseline_results = {
+            '/js/bitwise-and.html': [0, 1],
+            '/js/bitwise-or.html': [1, 1]
+        }
+        with gzip.open(os.path.join(
+                baseline_dir, '%s-summary.json.gz' % platform_id), 'wb') as f:
+            f.write(json.dumps(baseline_results))
+        for test, (passes, total) in baseline_results.items():
+            with gzip.open(os.path.join(
+                    baseline_dir, platform_id + test), 'wb') as f:
+                f.write(json.dumps({
+                    'test': test,
+                    'status': 'OK' if passes else 'ERROR',
+                    'message': None,
+                    'subtests': []
+                }))
+
+        self.wpt_log_contents = [
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-and.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': [
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'first'},
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'second'}
+                    ]
+                },
+                {
+                    'test': '/js/bitwise-not.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]})
+        ]
+        self.wpt_expected_tests = [
+            '/js/bitwise-and.html', '/js/bitwise-not.html'
+        ]
+
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--baseline-sha', 'deadbeef'
+        ])
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertIn(
+            ('diff', '--name-only', '--no-renames', 'deadbeef', 'c0ffee'),
+            git_args
+        )
+
+        includes = [
+            sorted(arg for arg in args if arg.startswith('--include='))
+            for args in wpt_args if 'run' in args
+        ]
+
+        self.assertEqual(includes, [[
+            '--include=/js/bitwise-and.html', '--include=/js/bitwise-not.html'
+        ]])
+
+        summary_path = os.path.join(
+            log_dir, 'c0ffee', '%s-summary.json.gz' % platform_id
+        )
+        with gzip.open(summary_path) as handle:
+            summary = json.loads(handle.read())
+
+        self.assertEqual(summary, {
+            '/js/bitwise-and.html': [1, 3],
+            '/js/bitwise-not.html': [1, 1],
+            '/js/bitwise-or.html': [1, 1, 1]
+        })
+
+        self.assertJsonMatch(
+            [log_dir, 'c0ffee', platform_id, 'js', 'bitwise-or.html'],
+            [baseline_dir, platform_id, 'js', 'bitwise-or.html']
+        )
+
+    def test_sauce_connect(self):
+        platform_id = 'edge-15-windows-10-sauce'
+        wpt_args = []
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        def wpt(*args):
+            wpt_args.append(args)
+            return self.cmd_wpt(*args)
+
+        self.remote_control.add_handler('git', git)
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': True,
+                'currently_run': True,
+                'browser_name': 'edge',
+                'browser_version': '15',
+                'os_name': 'windows',
+                'os_version': '10',
+                'sauce': True
+            }
+        })
+        self.remote_control.add_handler('wpt', wpt)
+        self.wpt_log_file_name = 'wptd-%s-%s-report.log' % (
+            'c0ffee', platform_id
+        )
+        self.wpt_log_contents = [json.dumps({
+            'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]
+        })]
+
+        returncode, stdout, stderr = self.run_py([platform_id])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        actual_output_dir = [log_dir, 'c0ffee']
+        expected_output_dir = [
+            here, 'expected_output', 'sauce-report', 'c0ffee'
+        ]
+
+        self.assertJsonMatch(
+            actual_output_dir + ['%s-summary.json.gz' % platform_id],
+            expected_output_dir + ['%s-summary.json.gz' % platform_id]
+        )
+        self.assertJsonMatch(
+            actual_output_dir + [platform_id, 'js', 'bitwise-or.html'],
+            expected_output_dir + [platform_id, 'js', 'bitwise-or.html']
+        )
+
+        run_invocation_count = 0
+
+        for args in wpt_args:
+            if 'run' not in args:
+                continue
+            if '--list-tests' in args:
+                continue
+            run_invocation_count += 1
+
+            self.assertIn('--sauce-platform=windows 10', args)
+
+        self.assertGreater(run_invocation_count, 0)
+
+    def test_headless(self):
+        platform_id = 'chrome-62.0-linux'
+        wpt_args = []
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        def wpt(*args):
+            wpt_args.append(args)
+            return self.cmd_wpt(*args)
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*',
+                'headless': True
+            }
+        })
+        self.remote_control.add_handler('wpt', wpt)
+        self.wpt_log_contents = [json.dumps({
+            'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]
+        })]
+
+        returncode, stdout, stderr = self.run_py([platform_id])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        run_invocations = [args for args in wpt_args if 'run' in args]
+
+        self.assertGreater(len(run_invocations), 0)
+
+        for args in run_invocations:
+            self.assertIn('--binary-arg=--headless', args)
+
+    def test_cached_manifest(self):
+        platform_id = 'chrome-62.0-linux'
+        wpt_args = []
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        def wpt(*args):
+            wpt_args.append(args)
+            return self.cmd_wpt(*args)
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', wpt)
+
+        manifest = {'items': {'testharness': {
+            'js/bitwise-or.html': [['/js/bitwise-or.html', {}]]
+        }}, 'version': 4}
+        os.mkdir(os.path.join(log_dir, 'manifests'))
+        with open(os.path.join(log_dir, 'manifests', 'c0ffee.json'), 'w') \
+                as handle:
+            json.dump(manifest, handle)
+
+        self.wpt_log_contents = [json.dumps({
+            'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]
+        })]
+
+        returncode, stdout, stderr = self.run_py([platform_id])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        for args in wpt_args:
+            self.assertNotIn('manifest', args)
+
+        run_invocations = [args for args in wpt_args if 'run' in args]
+
+        self.assertGreater(len(run_invocations), 0)
+
+        for args in run_invocations:
+            self.assertIn('--no-manifest-update', args)
+            # `wpt run` must not wait for confirmation
+            self.assertIn('--yes', args)
+
+        with open(os.path.join(mock_wpt_dir, 'MANIFEST.json')) as handle:
+            self.assertEqual(json.load(handle), manifest)
+
+    def test_worktrees(self):
+        platform_id = 'chrome-62.0-linux'
+        git_args = []
+        worktree_args = []
+
+        def git(*args):
+            git_args.append(args)
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+            if 'worktree' in args and 'add' in args:
+                worktree_args.append(args)
+                wpt_path = os.path.join(args[-2], 'wpt')
+                os.mkdir(args[-2])
+                with open(wpt_path, 'w') as handle:
+                    handle.write('#!/bin/sh\nexec %s "$@"\n' % (
+                        os.path.join(mock_wpt_dir, 'wpt')
+                    ))
+                os.chmod(wpt_path, 0o755)
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', self.cmd_wpt)
+        self.wpt_log_contents = [json.dumps({
+            'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]
+        })]
+
+        # The mock `wpt` CLI cannot generate a manifest within the worktree
+        os.mkdir(os.path.join(log_dir, 'manifests'))
+        with open(os.path.join(log_dir, 'manifests', 'c0ffee.json'), 'w') \
+                as handle:
+            json.dump({'items': {}, 'version': 4}, handle)
+
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--worktrees', '--wpt_sha', 'c0ffee'
+        ])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        worktree_path = os.path.join(log_dir, 'worktrees', 'c0ffee')
+
+        self.assertEqual(len(worktree_args), 1)
+        self.assertEqual(worktree_args[0][-1], 'c0ffee')
+        self.assertEqual(
+            os.path.realpath(worktree_args[0][-2]),
+            os.path.realpath(worktree_path)
+        )
+        self.assertIn(('fetch', 'origin'), git_args)
+
+        for args in git_args:
+            self.assertNotIn('checkout', args)
+            self.assertNotIn('pull', args)
+
+        self.assertTrue(
+            os.path.exists(os.path.join(worktree_path, 'MANIFEST.json'))
+        )
+        self.assertTrue(os.path.exists(os.path.join(
+            log_dir, 'c0ffee', '%s-summary.json.gz' % platform_id
+        )))
+
+    def test_multiple_platforms(self):
+        git_args = []
+        wpt_args = []
+
+        def git(*args):
+            git_args.append(args)
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        def wpt(*args):
+            wpt_args.append(args)
+            return self.cmd_wpt(*args)
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            'chrome-62.0-linux': {
+                'initially_loaded': False,
+                'currently_run': True,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            },
+            'chrome-62.0-linux-headless': {
+                'initially_loaded': False,
+                'currently_run': True,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*',
+                'headless': True
+            },
+            'chrome-63.0-linux': {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '63.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', wpt)
+        self.wpt_log_contents = [
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]}),
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-and.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]})
+        ]
+
+        returncode, stdout, stderr = self.run_py([
+            '--all-currently-run', '--max_attempts', '1'
+        ])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        # WPT is set up once for all platforms
+        self.assertEqual(
+            len([args for args in git_args if 'pull' in args]), 1
+        )
+        self.assertEqual(
+            len([args for args in wpt_args if 'manifest' in args]), 1
+        )
+
+        run_invocations = [args for args in wpt_args if 'run' in args]
+
+        self.assertEqual(len(run_invocations), 2)
+        self.assertNotIn('--binary-arg=--headless', run_invocations[0])
+        self.assertIn('--binary-arg=--headless', run_invocations[1])
+
+        for platform_id, test in (
+                ('chrome-62.0-linux', '/js/bitwise-or.html'),
+                ('chrome-62.0-linux-headless', '/js/bitwise-and.html')):
+            summary_path = os.path.join(
+                log_dir, 'c0ffee', '%s-summary.json.gz' % platform_id
+            )
+            with gzip.open(summary_path) as handle:
+                self.assertEqual(json.loads(handle.read()), {test: [1, 1]})
+
+        self.assertFalse(os.path.exists(os.path.join(
+            log_dir, 'c0ffee', 'chrome-63.0-linux-summary.json.gz'
+        )))
+
+    def test_results_archive(self):
+        platform_id = 'chrome-62.0-linux'
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', self.cmd_wpt)
+        self.wpt_log_contents = [json.dumps({
+            'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                },
+                {
+                    'test': '/js/bitwise-and.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': [
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'first'},
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'second'}
+                    ]
+                }
+            ]
+        })]
+
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--results-format', 'archive'
+        ])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        actual_output_dir = [log_dir, 'c0ffee']
+        expected_output_dir = [
+            here, 'expected_output', 'simple_report-2', 'c0ffee'
+        ]
+
+        self.assertJsonMatch(
+            actual_output_dir + ['%s-summary.json.gz' % platform_id],
+            expected_output_dir + ['%s-summary.json.gz' % platform_id]
+        )
+        self.assertFalse(
+            os.path.exists(os.path.join(*actual_output_dir + [platform_id]))
+        )
+
+        reader = results_archive.ArchiveReader(
+            os.path.join(*actual_output_dir + [platform_id])
+        )
+
+        self.assertEqual(
+            reader.tests(), ['/js/bitwise-and.html', '/js/bitwise-or.html']
+        )
+
+        for test in reader.tests():
+            with gzip.open(os.path.join(
+                    *expected_output_dir + [platform_id] +
+                    test.split('/')[1:])) as handle:
+                self.assertEqual(
+                    reader.get_result(test), json.loads(handle.read())
+                )
+
+    def test_result_objects(self):
+        platform_id = 'chrome-62.0-linux'
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', self.cmd_wpt)
+        results = {
+            'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                },
+                {
+                    'test': '/js/bitwise-and.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': [
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'first'},
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'second'}
+                    ]
+                }
+            ]
+        }
+        self.wpt_log_contents = [json.dumps(results)]
+
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--results-format', 'objects'
+        ])
 
-        self.assertJsonMatch(
-            actual_output_dir + ['%s-summary.json.gz' % platform_id],
-            expected_output_dir + ['%s-summary.json.gz' % platform_id]
-        )
-        self.assertJsonMatch(
-            actual_output_dir + [platform_id, 'js', 'bitwise-or.html'],
-            expected_output_dir + [platform_id, 'js', 'bitwise-or.html']
-        )
+        self.assertEqual(returncode, 0, stderr)
 
-        run_invocation_count = 0
+        results_base_path = os.path.join(log_dir, 'c0ffee', platform_id)
 
-        for args in wpt_args:
-            if 'run' not in args:
-                continue
-            if '--list-tests' in args:
-                continue
-            run_invocation_count += 1
+        self.assertFalse(os.path.exists(results_base_path))
 
-            self.assertIn('--sauce-platform=windows 10', args)
+        reader = results_archive.open_results(results_base_path)
 
-        self.assertGreater(run_invocation_count, 0)
+        self.assertEqual(
+            reader.tests(), ['/js/bitwise-and.html', '/js/bitwise-or.html']
+        )
+        for result in results['results']:
+            self.assertEqual(reader.get_result(result['test']), result)
 
     def test_repeated_results(self):
         platform_id = 'chrome-62.0-linux'
@@ -466,7 +1587,10 @@ class TestRun2(unittest.TestCase):
             0,
             '`run.py` should fail when the `wpt` CLI produces repeated results'
         )
-        self.assertListEqual(os.listdir(log_dir), ['c0ffee'])
+        self.assertListEqual(
+            sorted(os.listdir(log_dir)),
+            ['c0ffee', 'durations', 'manifests', 'telemetry']
+        )
 
     def test_no_running_manifest(self):
         platform_id = 'chrome-62.0-linux'
@@ -558,8 +1682,10 @@ class TestRun2(unittest.TestCase):
             ]})
         ]
 
+        # Each "chunk" is attempted only once so that every report is
+        # attributed to a distinct "chunk"
         returncode, stdout, stderr = self.run_py([
-            platform_id, '--total-chunks', '3'
+            platform_id, '--total-chunks', '3', '--max_attempts', '1'
         ])
 
         self.assertNotEqual(
@@ -568,7 +1694,10 @@ class TestRun2(unittest.TestCase):
             '`run.py` should fail when the `wpt` CLI produces repeated '
             'results across independent "chunks"'
         )
-        self.assertListEqual(os.listdir(log_dir), ['c0ffee'])
+        self.assertListEqual(
+            sorted(os.listdir(log_dir)),
+            ['c0ffee', 'durations', 'manifests', 'telemetry']
+        )
 
     def test_no_results(self):
         platform_id = 'chrome-62.0-linux'
@@ -604,7 +1733,10 @@ class TestRun2(unittest.TestCase):
             0,
             '`run.py` should fail when the `wpt` CLI produces zero results'
         )
-        self.assertListEqual(os.listdir(log_dir), ['c0ffee'])
+        self.assertListEqual(
+            sorted(os.listdir(log_dir)),
+            ['c0ffee', 'durations', 'manifests', 'telemetry']
+        )
 
     def test_no_results_recover(self):
         platform_id = 'chrome-62.0-linux'
@@ -675,6 +1807,335 @@ class TestRun2(unittest.TestCase):
             expected_output_dir + [platform_id, 'js', 'bitwise-and.html']
         )
 
+    def test_retry_missing_tests(self):
+        platform_id = 'chrome-62.0-linux'
+        wpt_args = []
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        def wpt(*args):
+            wpt_args.append(args)
+            return self.cmd_wpt(*args)
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', wpt)
+        self.wpt_log_contents = [
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]}),
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-and.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': [
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'first'},
+                        {'status': 'FAIL', 'message': 'bad', 'name': 'second'}
+                    ]
+                }
+            ]})
+        ]
+        self.wpt_expected_tests = [
+            '/js/bitwise-or.html', '/js/bitwise-and.html'
+        ]
+
+        returncode, stdout, stderr = self.run_py([platform_id])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        run_invocations = [args for args in wpt_args if 'run' in args]
+
+        self.assertEqual(len(run_invocations), 2)
+        self.assertIn('--this-chunk', run_invocations[0])
+        self.assertNotIn('--this-chunk', run_invocations[1])
+        self.assertIn('--include=/js/bitwise-and.html', run_invocations[1])
+        self.assertNotIn('--include=/js/bitwise-or.html', run_invocations[1])
+
+        actual_output_dir = [log_dir, 'c0ffee']
+        expected_output_dir = [
+            here, 'expected_output', 'simple_report-2', 'c0ffee'
+        ]
+
+        self.assertJsonMatch(
+            actual_output_dir + ['%s-summary.json.gz' % platform_id],
+            expected_output_dir + ['%s-summary.json.gz' % platform_id]
+        )
+        self.assertJsonMatch(
+            actual_output_dir + [platform_id, 'js', 'bitwise-or.html'],
+            expected_output_dir + [platform_id, 'js', 'bitwise-or.html']
+        )
+        self.assertJsonMatch(
+            actual_output_dir + [platform_id, 'js', 'bitwise-and.html'],
+            expected_output_dir + [platform_id, 'js', 'bitwise-and.html']
+        )
+
+    def test_retry_missing_tests_with_path(self):
+        platform_id = 'chrome-62.0-linux'
+        wpt_args = []
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        def wpt(*args):
+            wpt_args.append(args)
+            return self.cmd_wpt(*args)
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', wpt)
+        self.wpt_log_contents = [
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-or.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]}),
+            json.dumps({'results': [
+                {
+                    'test': '/js/bitwise-and.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+            ]})
+        ]
+        self.wpt_expected_tests = [
+            '/js/bitwise-or.html', '/js/bitwise-and.html'
+        ]
+
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--path', '/js'
+        ])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        run_invocations = [args for args in wpt_args if 'run' in args]
+
+        self.assertEqual(len(run_invocations), 2)
+        # The first attempt selects the tests beneath the path...
+        self.assertIn('/js', run_invocations[0])
+        self.assertIn('--this-chunk', run_invocations[0])
+        # ...and the retry selects only the missing test
+        self.assertNotIn('/js', run_invocations[1])
+        self.assertNotIn('--this-chunk', run_invocations[1])
+        self.assertEqual(
+            [arg for arg in run_invocations[1] if arg.startswith('--include')],
+            ['--include=/js/bitwise-and.html']
+        )
+
+    def test_retry_many_missing_tests(self):
+        platform_id = 'chrome-62.0-linux'
+        tests = [
+            '/js/a-test-with-a-long-name-in-a-large-directory-%s.html' % i
+            for i in range(3000)
+        ]
+        wpt_args = []
+        include_files = []
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        def wpt(*args):
+            wpt_args.append(args)
+            for arg in args:
+                if arg.startswith('--include-file='):
+                    # The file is removed once the attempt is complete
+                    with open(arg[len('--include-file='):]) as handle:
+                        include_files.append(handle.read().splitlines())
+            return self.cmd_wpt(*args)
+
+        def results(tests):
+            return json.dumps({'results': [
+                {
+                    'test': test,
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': []
+                }
+                for test in tests
+            ]})
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', wpt)
+        self.wpt_log_contents = [results(tests[:1]), results(tests[1:])]
+        self.wpt_expected_tests = tests
+
+        returncode, stdout, stderr = self.run_py([platform_id])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        run_invocations = [args for args in wpt_args if 'run' in args]
+
+        self.assertEqual(len(run_invocations), 2)
+        # The retried tests would exceed the limit on the length of a
+        # command, so they are listed in a file
+        includes = [
+            arg for arg in run_invocations[1] if arg.startswith('--include')
+        ]
+        self.assertEqual(len(includes), 1)
+        self.assertTrue(includes[0].startswith('--include-file='))
+        self.assertTrue(includes[0].endswith(os.path.join(
+            '%s-raw-logs' % platform_id, '1-of-1-attempt-2-tests.txt'
+        )))
+        self.assertEqual(include_files, [sorted(tests[1:])])
+        self.assertEqual(
+            os.listdir(os.path.join(log_dir, 'c0ffee',
+                                    '%s-raw-logs' % platform_id)),
+            []
+        )
+
+    def test_stalled_chunk(self):
+        platform_id = 'chrome-62.0-linux'
+        run_invocations = []
+
+        def git(*args):
+            if 'log' in args:
+                return {'stdout': 'c0ffee'}
+
+        def result(test, status):
+            return {
+                'test': test,
+                'status': status,
+                'message': None,
+                'subtests': [
+                    {'name': 'first', 'status': 'PASS', 'message': None}
+                ]
+            }
+
+        def wpt(*args):
+            if 'run' not in args:
+                return self.cmd_wpt(*args)
+
+            run_invocations.append(args)
+            includes = [
+                arg[len('--include='):] for arg in args
+                if arg.startswith('--include=')
+            ]
+            tests = includes or ['/js/a.html', '/js/hang.html', '/js/b.html']
+            raw_log = open(args[args.index('--log-raw') + 1], 'w')
+
+            def log(**entry):
+                entry['time'] = 1000 * len(run_invocations)
+                raw_log.write(json.dumps(entry) + '\n')
+                raw_log.flush()
+
+            log(action='suite_start', tests={'default': tests})
+
+            for test in tests:
+                log(action='test_start', test=test)
+                log(action='test_status', test=test, subtest='first',
+                    status='PASS')
+
+                if test == '/js/hang.html':
+                    # The wptreport file is only written at the end of the
+                    # run, which never comes
+                    raw_log.close()
+                    return {'sleep': 60}
+
+                log(action='test_end', test=test, status='OK')
+
+            raw_log.close()
+
+            with open(args[args.index('--log-wptreport') + 1], 'w') as f:
+                f.write(json.dumps({
+                    'results': [result(test, 'OK') for test in tests]
+                }))
+
+            return {'returncode': 0}
+
+        self.remote_control.add_handler('git', git)
+        self.remote_control.add_handler(
+            'chrome', lambda *_: {'stdout': 'Chromium 62.0.3382.22'}
+        )
+        self.write_browsers_manifest({
+            platform_id: {
+                'initially_loaded': False,
+                'currently_run': False,
+                'browser_name': 'chrome',
+                'browser_version': '62.0',
+                'os_name': platform.system().lower(),
+                'os_version': '*'
+            }
+        })
+        self.remote_control.add_handler('wpt', wpt)
+        self.wpt_log_contents = []
+
+        returncode, stdout, stderr = self.run_py([
+            platform_id, '--stall-timeout', '1'
+        ])
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertIn('Chunk 1 made no progress for 1 seconds (while running '
+                      '/js/hang.html)', stdout)
+
+        # The stalled test is not run again, but the tests after it are
+        self.assertEqual(len(run_invocations), 2)
+        self.assertEqual(
+            [arg for arg in run_invocations[1] if arg.startswith('--include')],
+            ['--include=/js/b.html']
+        )
+
+        results_dir = os.path.join(log_dir, 'c0ffee', platform_id, 'js')
+
+        # The result which ended before the stall is kept
+        with gzip.open(os.path.join(results_dir, 'a.html')) as handle:
+            self.assertEqual(json.loads(handle.read()),
+                             result('/js/a.html', 'OK'))
+        with gzip.open(os.path.join(results_dir, 'b.html')) as handle:
+            self.assertEqual(json.loads(handle.read()),
+                             result('/js/b.html', 'OK'))
+        self.assertEqual(sorted(os.listdir(results_dir)),
+                         ['a.html', 'b.html'])
+
     def test_empty_results(self):
         platform_id = 'chrome-64.0-linux'
 
@@ -944,7 +2405,10 @@ class TestRun2(unittest.TestCase):
 
         self.assertNotEquals(returncode, 0, stdout)
 
-        self.assertListEqual(os.listdir(log_dir), ['c0ffee'])
+        self.assertListEqual(
+            sorted(os.listdir(log_dir)),
+            ['c0ffee', 'durations', 'manifests', 'telemetry']
+        )
 
     def test_os_name_mismatch(self):
         platform_id = 'chrome-63.0-linux'
@@ -1003,6 +2467,19 @@ class TestRun2(unittest.TestCase):
 
         self.assertNotEqual(returncode, 0, stdout)
 
+    def test_create_testrun_results_format(self):
+        # No handler is defined for the `wpt` CLI so that this test will fail
+        # if the `run.py` script invokes it.
+
+        returncode, stdout, stderr = self.run_py([
+            'chrome-62.0-linux', '--results-format', 'objects',
+            '--create-testrun'
+        ])
+
+        self.assertEqual(returncode, 2, stdout)
+        self.assertIn('--create-testrun requires --results-format files',
+                      stderr)
+
     def test_git_update_failure(self):
         platform_id = 'chrome-64.0-linux'
         self.update_attempts = 0
@@ -1041,7 +2518,16 @@ class TestRun2(unittest.TestCase):
             '`run.py` attempted to update the WPT git repository'
         )
 
-        self.assertListEqual(os.listdir(log_dir), [])
+        # Nothing but the failure of the phase is recorded
+        self.assertListEqual(os.listdir(log_dir), ['telemetry'])
+        events = telemetry.read_events(
+            glob.glob(os.path.join(log_dir, 'telemetry', '*.jsonl'))
+        )
+        self.assertEqual(
+            [(event['event'], event.get('phase'), event.get('status'))
+             for event in events],
+            [('run_start', None, None), ('phase', 'setup_wpt', 'error')]
+        )
 
 
 if __name__ == '__main__':
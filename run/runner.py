@@ -1,10 +1,17 @@
-import gzip
 import json
 import os
 import requests
 import subprocess
 import time
 
+from headless import get_headless_arguments, get_headless_environment
+from manifest_cache import ManifestCache
+from result_writer import ResultWriter, write_gzip_json
+from telemetry import Telemetry
+from uploader import get_authorized_session, Uploader
+from watchdog import Watchdog
+from wptreport import ReportFile
+
 
 # TODO after --install-browser verify browser
 #      version or change platform ID to correct browser version
@@ -49,6 +56,7 @@ class Runner(object):
         platform_id=None,
         platform=None,
         local_log_filepath=None,
+        local_raw_log_filepath=None,
         local_report_filepath=None,
         summary_path=None,
         local_summary_gz_filepath=None,
@@ -56,6 +64,10 @@ class Runner(object):
         gs_http_results_url=None,
         summary_filename=None,
         summary_http_url=None,
+        # Seconds without a completed test after which `wpt run` is stopped
+        stall_timeout=None,
+        # Phases of the run are recorded here (see telemetry.py)
+        telemetry_filepath=None,
     ):
         self.metadata_url = metadata_url
         self.prod_host = prod_host,
@@ -80,6 +92,9 @@ class Runner(object):
         self.local_log_filepath = local_log_filepath or (
             '%s/wptd-testrun.log' % self.output_path
         )
+        self.local_raw_log_filepath = local_raw_log_filepath or (
+            '%s/wptd-testrun-raw.log' % self.output_path
+        )
         self.local_report_filepath = local_report_filepath or (
             '%s/wptd-%s-%s-report.log' % (
                 self.output_path, self.sha, self.platform_id
@@ -112,6 +127,8 @@ class Runner(object):
                 self.gs_results_bucket, self.summary_filename,
             )
         )
+        self.stall_timeout = stall_timeout
+        self.telemetry = Telemetry(telemetry_filepath)
 
     def run(self):
         self.validate()
@@ -121,27 +138,49 @@ class Runner(object):
             self.setup_remote_browser()
 
         self.patch_wpt(self.wptd_path, self.wpt_path, self.platform)
+        self.update_manifest()
 
-        if self.run_is_remote():
-            return_code = self.do_run_remote()
-        else:
-            return_code = self.do_run_local()
+        telemetry = self.telemetry.bind(platform=self.platform_id,
+                                        wpt_sha=self.sha)
+
+        with telemetry.phase('wpt_run') as details:
+            if self.run_is_remote():
+                return_code = self.do_run_remote()
+            else:
+                return_code = self.do_run_local()
+            details['return_code'] = return_code
 
         print('==================================================')
         print('Finished WPT run')
         print('Return code from wptrunner: %s' % return_code)
 
-        report = self.load_local_report()
-        summary = self.report_to_summary(report)
+        with telemetry.phase('summarize') as details:
+            report = self.load_local_report()
+            summary = self.report_to_summary(report)
+            details['results'] = len(summary)
 
         print('==================================================')
         print('Writing summary.json.gz to local filesystem')
-        self.write_gzip_json(self.local_summary_gz_filepath, summary)
+        with telemetry.phase('write_summary') as details:
+            try:
+                os.makedirs(os.path.dirname(self.local_summary_gz_filepath))
+            except OSError:
+                pass
+
+            write_gzip_json(self.local_summary_gz_filepath, summary)
+            details['bytes'] = os.path.getsize(self.local_summary_gz_filepath)
         print('Wrote file %s' % self.local_summary_gz_filepath)
 
+        # Result files are uploaded as they are written
+        uploader = None
+        if self.will_upload():
+            uploader = self.create_uploader()
+
         print('==================================================')
         print('Writing individual result files to local filesystem')
-        self.write_result_files(report)
+        with telemetry.phase('write_results') as details:
+            writer = self.write_result_files(report, uploader)
+            details['bytes'] = writer.bytes_written
 
         if not self.will_upload():
             print('==================================================')
@@ -151,13 +190,18 @@ class Runner(object):
 
         print('==================================================')
         print('Uploading results to gs://%s' % self.gs_results_bucket)
-        self.upload_results()
+        with telemetry.phase('upload') as details:
+            self.upload_results(uploader)
+            details.update(uploaded=uploader.uploaded,
+                           skipped=uploader.skipped)
         print('Successfully uploaded!')
         print('HTTP summary URL: %s' % self.gs_http_results_url)
 
         print('==================================================')
         print('Creating new TestRun in the dashboard...')
-        response = self.upload_run()
+        with telemetry.phase('create_testrun') as details:
+            response = self.upload_run()
+            details['status_code'] = response.status_code
         if response.status_code == 201:
             print('Run created!')
         else:
@@ -261,6 +305,12 @@ class Runner(object):
         )
         p.communicate(input=patch)
 
+    def update_manifest(self):
+        """Places the (cached) WPT manifest of Runner.sha in WPT so that
+        `wpt run` does not need to regenerate it."""
+        cache = ManifestCache(os.path.join(self.output_path, 'manifests'))
+        cache.update(self.wpt_path, self.sha)
+
     def do_run_remote(self):
         # Hack because Sauce expects a different name
         # Maybe just change it in browsers.json?
@@ -281,40 +331,77 @@ class Runner(object):
             '--no-restart-on-unexpected',
             '--processes=2',
             '--run-by-dir=3',
+            '--no-manifest-update',
             '--log-mach=-',
             '--log-wptreport=%s' % self.local_report_filepath,
             '--install-fonts'
         ]
         if self.run_path:
             command.insert(3, self.run_path)
-        return subprocess.call(command, cwd=self.wpt_path)
+        return self.call_wpt(command, cwd=self.wpt_path)
 
     def do_run_local(self):
+        browser_name = self.platform['browser_name']
         command = [
-            'xvfb-run', '--auto-servernum',
             './wpt', 'run',
-            self.platform['browser_name'],
+            browser_name,
             '--install-fonts',
             '--install-browser',
             '--yes',
+            '--no-manifest-update',
             '--log-mach=%s' % self.local_log_filepath,
             '--log-wptreport=%s' % self.local_report_filepath,
         ]
-        if self.platform['browser_name'] == 'firefox':
+        if browser_name == 'firefox':
             # for webrtc
             command.extend(['--setpref', 'media.navigator.streams.fake=true'])
         if self.run_path:
-            command.insert(5, self.run_path)
+            command.insert(3, self.run_path)
+
+        env = dict(os.environ)
+        if self.platform.get('headless'):
+            command.extend(get_headless_arguments(browser_name))
+            env = get_headless_environment(browser_name, env)
+        else:
+            command = ['xvfb-run', '--auto-servernum'] + command
 
-        return subprocess.call(command, cwd=self.wpt_path)
+        return self.call_wpt(command, cwd=self.wpt_path, env=env)
+
+    def call_wpt(self, command, **kwargs):
+        '''Run `wpt run`, stopping it if no test completes within
+        `stall_timeout` seconds (when specified).'''
+
+        if not self.stall_timeout:
+            return subprocess.call(command, **kwargs)
+
+        command = command + ['--log-raw=%s' % self.local_raw_log_filepath]
+
+        try:
+            os.remove(self.local_raw_log_filepath)
+        except OSError:
+            pass
+
+        watchdog = Watchdog(self.local_raw_log_filepath, self.stall_timeout)
+        return_code = watchdog.call(command, **kwargs)
+
+        if watchdog.stalled:
+            print('No test completed for %s seconds (while running %s). '
+                  'Stopped after %s tests.' % (
+                      self.stall_timeout, watchdog.stalled_test,
+                      watchdog.completed_tests
+                  ))
+
+        return return_code
 
     def load_local_report(self):
-        with open(self.local_report_filepath) as f:
-            report = json.load(f)
+        '''Open the report of the run. Its results are read from disk each
+        time they are iterated, rather than held in memory.'''
 
-        assert len(report['results']) > 0, (
+        results = ReportFile(self.local_report_filepath)
+
+        assert any(True for _ in results), (
             '0 test results, something went wrong, stopping.')
-        return report
+        return {'results': results}
 
     def report_to_summary(self, report):
         """Parses a WPT report log object into a file-wise summary."""
@@ -340,28 +427,28 @@ class Runner(object):
 
         return test_files
 
-    def write_gzip_json(self, filepath, payload):
-        try:
-            os.makedirs(os.path.dirname(filepath))
-        except OSError:
-            pass
+    def write_result_files(self, report, uploader=None):
+        writer = ResultWriter(self.gs_results_filepath_base,
+                              uploader=uploader)
+        writer.write(report['results'])
 
-        with gzip.open(filepath, 'wb') as f:
-            payload_str = json.dumps(payload)
-            f.write(payload_str)
+        return writer
 
-    def write_result_files(self, report):
-        for result in report['results']:
-            test_file = result['test']
-            filepath = '%s%s' % (self.gs_results_filepath_base, test_file)
-            self.write_gzip_json(filepath, result)
-            print('Wrote file %s' % filepath)
-
-    def upload_results(self):
-        command = ['gsutil', '-m', '-h', 'Content-Encoding:gzip',
-                   'rsync', '-r', self.sha, 'gs://wptd/%s' % self.sha]
-        return_code = subprocess.check_call(command, cwd=self.output_path)
-        assert return_code == 0, 'gsutil rsync return code was not 0!'
+    def create_uploader(self):
+        return Uploader(
+            self.output_path, 'wptd',
+            '%s/uploads/%s.log' % (self.output_path, self.sha),
+            session=get_authorized_session()
+        )
+
+    def upload_results(self, uploader):
+        '''Upload the files of the run which have not already been uploaded
+        (as they were written).'''
+
+        with uploader:
+            # The results (named after their test) and the summary
+            uploader.put_tree('%s/%s' % (self.output_path, self.sha),
+                              content_type='application/json')
 
     def upload_run(self):
         if self.prod_run:
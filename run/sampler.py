@@ -0,0 +1,197 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import os
+import threading
+import time
+
+"""
+sampler.py records the resource usage of a process and all of its
+descendants (e.g. `wpt run`, the browser and its content processes) by
+reading `/proc` at a fixed interval, so that memory growth and CPU
+saturation during a run can be attributed to the tests being run.
+
+The samples are written as JSON lines: a header followed by one array per
+sample.
+
+    {"pid": 1234, "start": 1514764800.0, "interval": 5.0,
+     "fields": ["elapsed", "cpu", "rss", "fds", "processes"]}
+    [0.0, 0.0, 104857600, 40, 3]
+    [5.0, 1.85, 838860800, 212, 11]
+
+`cpu` is the number of CPUs used since the previous sample (e.g. 1.5 for
+one and a half CPUs) and `rss` is the total resident memory in bytes.
+"""
+
+FIELDS = ['elapsed', 'cpu', 'rss', 'fds', 'processes']
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def read_processes():
+    '''Read the parent ID, CPU time (in clock ticks) and resident memory (in
+    pages) of every process. Returns a dictionary keyed by process ID.'''
+
+    processes = {}
+
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+
+        try:
+            with open('/proc/%s/stat' % name) as handle:
+                stat = handle.read()
+        except IOError:
+            # The process has exited
+            continue
+
+        # The command name (in parentheses) may contain spaces
+        fields = stat[stat.rindex(')') + 2:].split()
+        processes[int(name)] = {
+            'ppid': int(fields[1]),
+            'ticks': int(fields[11]) + int(fields[12]),
+            'rss': int(fields[21])
+        }
+
+    return processes
+
+
+def get_descendants(processes, pid):
+    '''The IDs of a process and of all of its descendants.'''
+
+    children = {}
+    for child, process in processes.items():
+        children.setdefault(process['ppid'], []).append(child)
+
+    tree = []
+    pending = [pid] if pid in processes else []
+
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+
+    return tree
+
+
+def count_fds(pid):
+    try:
+        return len(os.listdir('/proc/%s/fd' % pid))
+    except OSError:
+        return 0
+
+
+def summarize_samples(samples):
+    '''The peak and mean of each measurement of a list of samples.'''
+
+    summary = {'samples': len(samples)}
+
+    for index, field in enumerate(FIELDS[1:], 1):
+        values = [sample[index] for sample in samples]
+        summary['peak_%s' % field] = max(values) if values else None
+        summary['mean_%s' % field] = (
+            sum(values) / float(len(values)) if values else None
+        )
+
+    return summary
+
+
+class ProcessSampler(object):
+    '''Samples the resource usage of the process `pid` and its descendants
+    every `interval` seconds from a background thread, appending the
+    samples to `filename` (if given).
+
+    `stop` returns a summary of the samples (see `summarize_samples`).'''
+
+    def __init__(self, pid, interval=5.0, filename=None):
+        self.pid = pid
+        self.interval = interval
+        self.filename = filename
+        self.samples = []
+
+        self._ticks = {}
+        self._start = None
+        self._last = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._work)
+        self._thread.daemon = True
+        self._handle = None
+
+    def sample(self):
+        '''Measure the process tree. Returns `None` once the process has
+        exited.'''
+
+        now = time.time()
+        processes = read_processes()
+        tree = get_descendants(processes, self.pid)
+
+        if not tree:
+            return None
+
+        ticks = dict((pid, processes[pid]['ticks']) for pid in tree)
+        # Processes which exited since the previous sample are not counted
+        used_ticks = sum(
+            max(count - self._ticks.get(pid, 0), 0)
+            for pid, count in ticks.items()
+        )
+        elapsed = now - self._last if self._last is not None else None
+        self._ticks = ticks
+        self._last = now
+
+        return [
+            round(now - self._start, 1),
+            round(used_ticks / float(CLOCK_TICKS) / elapsed, 2)
+            if elapsed else 0.0,
+            sum(processes[pid]['rss'] for pid in tree) * PAGE_SIZE,
+            sum(count_fds(pid) for pid in tree),
+            len(tree)
+        ]
+
+    def _record(self, sample):
+        self.samples.append(sample)
+
+        if self._handle is not None:
+            self._handle.write(json.dumps(sample) + '\n')
+            self._handle.flush()
+
+    def _work(self):
+        while True:
+            sample = self.sample()
+
+            if sample is None:
+                return
+
+            self._record(sample)
+
+            if self._stopped.wait(self.interval):
+                return
+
+    def start(self):
+        self._start = time.time()
+
+        if self.filename is not None:
+            directory = os.path.dirname(self.filename)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            self._handle = open(self.filename, 'w')
+            self._handle.write(json.dumps({
+                'pid': self.pid,
+                'start': self._start,
+                'interval': self.interval,
+                'fields': FIELDS
+            }, sort_keys=True) + '\n')
+
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+        if self._handle is not None:
+            self._handle.close()
+
+        return summarize_samples(self.samples)
@@ -0,0 +1,117 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from sampler import (FIELDS, get_descendants, ProcessSampler,
+                     summarize_samples)
+
+# Allocates about 64 MB, opens a number of files and starts a child process,
+# then waits for its standard input to be closed
+BUSY_PROCESS = '''
+import subprocess, sys
+data = 'x' * (64 * 1024 * 1024)
+files = [open(sys.executable) for _ in range(20)]
+child = subprocess.Popen(
+    [sys.executable, '-c', 'import sys; sys.stdin.read()'],
+    stdin=subprocess.PIPE
+)
+sys.stdout.write('ready\\n')
+sys.stdout.flush()
+sys.stdin.read()
+child.stdin.close()
+child.wait()
+'''
+
+
+class TestProcessSampler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_descendants(self):
+        processes = {
+            1: {'ppid': 0},
+            10: {'ppid': 1},
+            11: {'ppid': 10},
+            12: {'ppid': 11},
+            13: {'ppid': 10},
+            20: {'ppid': 1}
+        }
+
+        self.assertEqual(sorted(get_descendants(processes, 10)),
+                         [10, 11, 12, 13])
+        self.assertEqual(get_descendants(processes, 20), [20])
+        self.assertEqual(get_descendants(processes, 30), [])
+
+    def test_summarize_samples(self):
+        summary = summarize_samples([
+            [0.0, 0.0, 100, 10, 1],
+            [1.0, 1.5, 300, 30, 3],
+            [2.0, 0.5, 200, 20, 2]
+        ])
+
+        self.assertEqual(summary, {
+            'samples': 3,
+            'peak_cpu': 1.5, 'mean_cpu': 2.0 / 3,
+            'peak_rss': 300, 'mean_rss': 200.0,
+            'peak_fds': 30, 'mean_fds': 20.0,
+            'peak_processes': 3, 'mean_processes': 2.0
+        })
+        self.assertEqual(summarize_samples([])['peak_rss'], None)
+
+    def test_process_tree(self):
+        process = subprocess.Popen(
+            [sys.executable, '-c', BUSY_PROCESS],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self.assertEqual(process.stdout.readline(), 'ready\n')
+
+        filename = os.path.join(self.tmp_dir, 'resources', '1-of-1.jsonl')
+        sampler = ProcessSampler(process.pid, 0.05, filename)
+
+        try:
+            sampler.start()
+            # Sample at least twice before stopping
+            while len(sampler.samples) < 2:
+                time.sleep(0.01)
+        finally:
+            summary = sampler.stop()
+            process.stdin.close()
+            process.wait()
+
+        self.assertGreaterEqual(summary['samples'], 2)
+        self.assertEqual(summary['peak_processes'], 2)
+        self.assertGreater(summary['peak_rss'], 64 * 1024 * 1024)
+        self.assertGreater(summary['peak_fds'], 20)
+        self.assertGreaterEqual(summary['peak_cpu'], 0)
+
+        with open(filename) as handle:
+            lines = [json.loads(line) for line in handle]
+
+        self.assertEqual(lines[0]['pid'], process.pid)
+        self.assertEqual(lines[0]['fields'], FIELDS)
+        self.assertEqual(lines[1:], sampler.samples)
+
+    def test_exited(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+
+        sampler = ProcessSampler(process.pid, 0.05)
+        sampler.start()
+
+        self.assertEqual(sampler.stop()['samples'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import errno
+import json
+import os
+import Queue
+import re
+import shutil
+import tempfile
+
+"""
+server_slots.py gives each concurrently-running chunk its own wptserve
+ports, so that chunks run in parallel do not all try to serve the tests on
+the same (fixed) ports.
+
+The `wpt` CLI reads overrides of its server configuration (including the
+ports) from `config.json` in the root of the tests. Each slot is therefore
+a directory which mirrors the WPT checkout, with a symbolic link to each of
+its top-level entries, and which adds its own `config.json`. A chunk is run
+with the tests root of its slot (`--tests`), and with the metadata (i.e.
+the manifest) of the checkout itself (`--metadata`).
+
+Versions of the `wpt` CLI which ignore `config.json` would serve every
+chunk on the default ports, so the ports on which wptserve reports starting
+its servers (in the raw log) are checked against those of the slot.
+"""
+
+CONFIG_NAME = 'config.json'
+
+# The message logged by wptserve as it starts each server
+SERVER_START = re.compile(
+    r'Starting (\S+) server on (?:\S+://)?[^\s:]+:(\d+)'
+)
+
+
+def get_ports(slot, base_port=10000, spacing=10):
+    '''Determine the ports of the servers of the given slot.'''
+
+    port = base_port + slot * spacing
+
+    return {
+        'http': [port, port + 1],
+        'https': [port + 2],
+        'ws': [port + 3],
+        'wss': [port + 4]
+    }
+
+
+def read_server_ports(raw_log_filename):
+    '''Read the ports of the servers started by `wpt run` from its raw log.
+    Returns a list of `(scheme, port)`.'''
+
+    ports = []
+
+    try:
+        handle = open(raw_log_filename)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return ports
+
+    with handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+
+            if not isinstance(entry, dict) or entry.get('action') != 'log':
+                continue
+
+            match = SERVER_START.search(entry.get('message') or '')
+            if match:
+                ports.append((match.group(1), int(match.group(2))))
+
+    return ports
+
+
+class ServerSlots(object):
+    '''Assigns a tests root with its own server ports to each of `size`
+    concurrently-running chunks of a WPT checkout. The tests roots are
+    created in a new directory in `directory` by `start` and removed by
+    `close`.
+
+    A single `None` slot (i.e. "the checkout and its default ports") is used
+    when chunks are run serially.'''
+
+    def __init__(self, wpt_path, directory, size, base_port=10000,
+                 spacing=10):
+        self.wpt_path = wpt_path
+        self.directory = directory
+        self.size = size
+        self.base_port = base_port
+        self.spacing = spacing
+
+        self.path = None
+        self._slots = Queue.Queue()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def tests_root(self, slot):
+        return os.path.join(self.path, str(slot))
+
+    def _read_config(self):
+        '''Read the overrides of the checkout's own `config.json` (if any),
+        which apply to every slot.'''
+
+        try:
+            with open(os.path.join(self.wpt_path, CONFIG_NAME)) as handle:
+                return json.load(handle)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return {}
+
+    def start(self):
+        if self.size < 2:
+            self._slots.put(None)
+            return
+
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        # Other runs on the same host may use the same directory
+        self.path = tempfile.mkdtemp(dir=self.directory)
+
+        for slot in range(self.size):
+            tests_root = self.tests_root(slot)
+            os.mkdir(tests_root)
+
+            for name in os.listdir(self.wpt_path):
+                if name == CONFIG_NAME:
+                    continue
+
+                os.symlink(os.path.join(self.wpt_path, name),
+                           os.path.join(tests_root, name))
+
+            config = self._read_config()
+            config['ports'] = get_ports(slot, self.base_port, self.spacing)
+
+            with open(os.path.join(tests_root, CONFIG_NAME), 'w') as handle:
+                json.dump(config, handle, indent=2, sort_keys=True)
+
+            self._slots.put(slot)
+
+    def acquire(self):
+        return self._slots.get()
+
+    def release(self, slot):
+        self._slots.put(slot)
+
+    def prepare(self, slot, command):
+        '''Return the `wpt run` command which serves the tests of the given
+        slot.'''
+
+        if slot is None:
+            return command
+
+        return command + [
+            '--tests', self.tests_root(slot),
+            '--metadata', self.wpt_path
+        ]
+
+    def unexpected_ports(self, slot, raw_log_filename):
+        '''Check the ports of the servers started by a `wpt run` of the given
+        slot. Returns a list of the `(scheme, port)` of the servers which
+        were not started on the ports of the slot.'''
+
+        if slot is None:
+            return []
+
+        ports = get_ports(slot, self.base_port, self.spacing)
+
+        return [
+            (scheme, port)
+            for scheme, port in read_server_ports(raw_log_filename)
+            if scheme in ports and port not in ports[scheme]
+        ]
+
+    def close(self):
+        '''Remove the tests roots (but not the files they link to).'''
+
+        if self.path is not None:
+            shutil.rmtree(self.path)
+            self.path = None
@@ -0,0 +1,146 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from server_slots import get_ports, read_server_ports, ServerSlots
+
+
+def server_start(scheme, port):
+    return json.dumps({
+        'action': 'log',
+        'level': 'INFO',
+        'message': 'Starting %s server on web-platform.test:%s' % (scheme,
+                                                                   port)
+    })
+
+
+class TestServerSlots(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.wpt_path = os.path.join(self.tmp_dir, 'wpt')
+        self.directory = os.path.join(self.tmp_dir, 'build', 'server-slots')
+
+        os.makedirs(os.path.join(self.wpt_path, 'dom'))
+        for name in ('MANIFEST.json', 'wpt', os.path.join('dom', 'a.html')):
+            with open(os.path.join(self.wpt_path, name), 'w') as handle:
+                handle.write(name)
+        with open(os.path.join(self.wpt_path, 'config.json'), 'w') as handle:
+            json.dump({'browser_host': 'web-platform.test',
+                       'ports': {'http': [8000, 8001]}}, handle)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_config(self, tests_root):
+        with open(os.path.join(tests_root, 'config.json')) as handle:
+            return json.load(handle)
+
+    def test_serial(self):
+        with ServerSlots(self.wpt_path, self.directory, 1) as slots:
+            slot = slots.acquire()
+
+            self.assertIsNone(slot)
+            self.assertEqual(slots.prepare(slot, ['./wpt', 'run']),
+                             ['./wpt', 'run'])
+
+        self.assertFalse(os.path.exists(self.directory))
+
+    def test_parallel(self):
+        with ServerSlots(self.wpt_path, self.directory, 2,
+                         base_port=9100) as slots:
+            first = slots.acquire()
+            second = slots.acquire()
+
+            self.assertEqual((first, second), (0, 1))
+
+            roots = [slots.tests_root(first), slots.tests_root(second)]
+            configs = [self.read_config(root) for root in roots]
+
+            # Each chunk has its own ports, and keeps the other settings of
+            # the checkout
+            self.assertEqual(configs[0], {
+                'browser_host': 'web-platform.test',
+                'ports': {'http': [9100, 9101], 'https': [9102],
+                          'ws': [9103], 'wss': [9104]}
+            })
+            self.assertEqual(configs[1]['ports'],
+                             get_ports(1, base_port=9100))
+            self.assertEqual(configs[1]['browser_host'], 'web-platform.test')
+
+            ports = [
+                port for config in configs
+                for scheme_ports in config['ports'].values()
+                for port in scheme_ports
+            ]
+            self.assertEqual(len(ports), len(set(ports)))
+
+            # The tests are those of the checkout
+            for root in roots:
+                self.assertEqual(
+                    sorted(os.listdir(root)),
+                    ['MANIFEST.json', 'config.json', 'dom', 'wpt']
+                )
+                with open(os.path.join(root, 'dom', 'a.html')) as handle:
+                    self.assertEqual(handle.read(),
+                                     os.path.join('dom', 'a.html'))
+
+            self.assertEqual(
+                slots.prepare(second, ['./wpt', 'run', 'chrome']),
+                ['./wpt', 'run', 'chrome', '--tests', roots[1],
+                 '--metadata', self.wpt_path]
+            )
+
+            slots.release(first)
+            self.assertEqual(slots.acquire(), first)
+
+        # Only the links are removed
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertTrue(
+            os.path.exists(os.path.join(self.wpt_path, 'dom', 'a.html'))
+        )
+
+    def test_unexpected_ports(self):
+        raw_log_filename = os.path.join(self.tmp_dir, 'raw.log')
+
+        with open(raw_log_filename, 'w') as handle:
+            handle.write('\n'.join([
+                json.dumps({'action': 'suite_start'}),
+                server_start('http', 9110),
+                server_start('http', 8001),
+                server_start('https', 9112),
+                server_start('h2', 9000),
+                '[]'
+            ]))
+
+        self.assertEqual(read_server_ports(raw_log_filename), [
+            ('http', 9110), ('http', 8001), ('https', 9112), ('h2', 9000)
+        ])
+        self.assertEqual(read_server_ports(raw_log_filename + '.missing'),
+                         [])
+
+        with ServerSlots(self.wpt_path, self.directory, 2,
+                         base_port=9100) as slots:
+            self.assertEqual(slots.unexpected_ports(1, raw_log_filename),
+                             [('http', 8001)])
+            self.assertEqual(
+                slots.unexpected_ports(0, raw_log_filename),
+                [('http', 9110), ('http', 8001), ('https', 9112)]
+            )
+
+        # Serial runs use the default ports
+        self.assertEqual(
+            ServerSlots(self.wpt_path, self.directory, 1).unexpected_ports(
+                None, raw_log_filename
+            ),
+            []
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,10 +26,11 @@ class SHAFinder(object):
         self.logger = logger
         self.date = date
 
-    def get_todays_sha(self, path):  # type: (str) -> str
+    def get_todays_sha(self, path, ref=None):  # type: (str, str) -> str
         """
         Gets the first SHA for the current date of the git repo in the given
-        path.
+        path, optionally searching the history of the given ref instead of
+        the checked-out branch.
         """
         today = self.date
         tomorrow = self.date + timedelta(days=1)
@@ -42,6 +43,8 @@ class SHAFinder(object):
             '--before="%s T00:00:00Z"' % tomorrow.isoformat(),
             '--reverse'
         ]
+        if ref:
+            command.append(ref)
         abspath = os.path.abspath(path)
         self.logger.debug('Using dir ' + abspath)
         self.logger.debug('Executing ' + ' '.join(command))
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+
+"""
+telemetry.py records the phases of a run (e.g. setting up WPT, each attempt
+to run a chunk, summarizing, writing and uploading results), together with
+counts, sizes and return codes, as JSON lines in
+`{build_path}/telemetry/{start time}-{pid}.jsonl`:
+
+    {"event": "phase", "phase": "summarize", "platform": "chrome-63.0-linux",
+     "start": 1514764800.0, "end": 1514764860.5, "duration": 60.5,
+     "status": "ok", "results": 30000, ...}
+
+To report the median and 95th percentile duration of each phase (per
+platform) across every recorded run:
+
+    ./run/telemetry.py $BUILD_PATH/telemetry
+"""
+
+
+def get_telemetry_path(build_path):
+    return os.path.join(build_path, 'telemetry', '%s-%s.jsonl' % (
+        time.strftime('%Y%m%d-%H%M%S', time.gmtime()), os.getpid()
+    ))
+
+
+class Telemetry(object):
+    '''Appends events to a JSON lines file (or discards them if `filename`
+    is `None`). Every event includes the properties of `context`.
+
+    Events may be recorded from any thread.'''
+
+    def __init__(self, filename=None, context=None, lock=None):
+        self.filename = filename
+        self.context = context or {}
+
+        self._lock = lock or threading.Lock()
+
+        if filename is not None and not os.path.isdir(
+                os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+
+    def bind(self, **context):
+        '''Create a `Telemetry` writing to the same file whose events also
+        include the given properties (e.g. the platform).'''
+
+        return Telemetry(self.filename, dict(self.context, **context),
+                         self._lock)
+
+    def event(self, event, **properties):
+        if self.filename is None:
+            return
+
+        entry = dict(self.context, event=event, time=time.time())
+        entry.update(properties)
+        line = json.dumps(entry, sort_keys=True)
+
+        # The file is opened for each event so that it remains complete if
+        # the run is killed
+        with self._lock:
+            with open(self.filename, 'a') as handle:
+                handle.write(line + '\n')
+
+    @contextlib.contextmanager
+    def phase(self, name, **properties):
+        '''Record the duration of the enclosed block as a `phase` event.
+        Yields a dictionary to which the block may add properties of the
+        event (e.g. the number of results produced). A phase which raises an
+        exception has the status "error".'''
+
+        details = dict(properties)
+        start = time.time()
+        status = 'error'
+
+        try:
+            yield details
+            status = 'ok'
+        finally:
+            end = time.time()
+            details.update(phase=name, start=start, end=end,
+                           duration=end - start, status=status)
+            self.event('phase', **details)
+
+
+def read_events(filenames):
+    for filename in filenames:
+        with open(filename) as handle:
+            for line in handle:
+                # A line may be incomplete if the run was killed
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def percentile(values, percent):
+    '''The nearest-rank percentile of a non-empty list of numbers.'''
+
+    values = sorted(values)
+    rank = int(-(-len(values) * percent // 100))
+
+    return values[max(rank, 1) - 1]
+
+
+def aggregate(events):
+    '''Group the durations of `phase` events by platform and phase.
+
+    Returns a list of `(platform, phase, count, p50, p95, max)` tuples.
+    Phases shared by every platform of a run have the platform `None`.'''
+
+    durations = {}
+
+    for event in events:
+        if event.get('event') != 'phase':
+            continue
+
+        key = (event.get('platform'), event['phase'])
+        durations.setdefault(key, []).append(event['duration'])
+
+    return [
+        (platform, phase, len(values), percentile(values, 50),
+         percentile(values, 95), max(values))
+        for (platform, phase), values in sorted(durations.items())
+    ]
+
+
+def main(args):
+    filenames = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            filenames.extend(sorted(glob.glob(os.path.join(path, '*.jsonl'))))
+        else:
+            filenames.append(path)
+
+    rows = aggregate(read_events(filenames))
+
+    if not rows:
+        print('No phases recorded in %s' % ', '.join(args.paths))
+        return
+
+    print('%-36s  %-20s  %5s  %10s  %10s  %10s' % (
+        'platform', 'phase', 'count', 'p50 (s)', 'p95 (s)', 'max (s)'
+    ))
+    for platform, phase, count, p50, p95, maximum in rows:
+        print('%-36s  %-20s  %5d  %10.1f  %10.1f  %10.1f' % (
+            platform or '(all)', phase, count, p50, p95, maximum
+        ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Report the duration of the phases of recorded runs.'
+    )
+    parser.add_argument(
+        'paths',
+        nargs='+',
+        help='Telemetry files, or directories containing them.'
+    )
+    main(parser.parse_args())
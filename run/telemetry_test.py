@@ -0,0 +1,96 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from telemetry import aggregate, percentile, read_events, Telemetry
+
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'telemetry', 'run.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_phase(self):
+        telemetry = Telemetry(self.filename).bind(platform='chrome')
+
+        with telemetry.phase('summarize', chunks=2) as details:
+            details['results'] = 10
+
+        with self.assertRaises(ValueError):
+            with telemetry.bind(chunk=1).phase('load_chunk'):
+                raise ValueError()
+
+        telemetry.event('run_end', failed=[])
+
+        events = list(read_events([self.filename]))
+
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[0]['event'], 'phase')
+        self.assertEqual(events[0]['phase'], 'summarize')
+        self.assertEqual(events[0]['platform'], 'chrome')
+        self.assertEqual(events[0]['status'], 'ok')
+        self.assertEqual(events[0]['chunks'], 2)
+        self.assertEqual(events[0]['results'], 10)
+        self.assertAlmostEqual(events[0]['duration'],
+                               events[0]['end'] - events[0]['start'])
+        self.assertEqual(events[1]['phase'], 'load_chunk')
+        self.assertEqual(events[1]['status'], 'error')
+        self.assertEqual(events[1]['chunk'], 1)
+        self.assertEqual(events[2]['event'], 'run_end')
+        self.assertNotIn('chunk', events[2])
+
+    def test_disabled(self):
+        telemetry = Telemetry()
+
+        with telemetry.phase('summarize') as details:
+            details['results'] = 10
+
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_incomplete_line(self):
+        Telemetry(self.filename).event('run_start')
+        with open(self.filename, 'a') as handle:
+            handle.write('{"event": "ph')
+
+        self.assertEqual(len(list(read_events([self.filename]))), 1)
+
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+
+        self.assertEqual(percentile(values, 50), 3)
+        self.assertEqual(percentile(values, 95), 5)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertEqual(percentile(range(1, 101), 95), 95)
+
+    def test_aggregate(self):
+        events = [
+            {'event': 'run_start'},
+            {'event': 'phase', 'phase': 'setup_wpt', 'duration': 2.0},
+            {'event': 'phase', 'phase': 'setup_wpt', 'duration': 4.0},
+        ] + [
+            {'event': 'phase', 'phase': 'chunk_attempt', 'duration': d,
+             'platform': 'chrome'}
+            for d in range(1, 21)
+        ] + [
+            {'event': 'phase', 'phase': 'chunk_attempt', 'duration': 100.0,
+             'platform': 'firefox'}
+        ]
+
+        self.assertEqual(aggregate(events), [
+            (None, 'setup_wpt', 2, 2.0, 4.0, 4.0),
+            ('chrome', 'chunk_attempt', 20, 10, 19, 20),
+            ('firefox', 'chunk_attempt', 1, 100.0, 100.0, 100.0),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,7 @@ import os
 import subprocess
 import sys
 import threading
+import time
 import urllib2
 
 import http_stubber
@@ -50,6 +51,11 @@ def request_and_execute(name, args):
     if stderr is not None:
         sys.stderr.write(stderr)
 
+    # Simulates a command which stops responding
+    sleep = instructions.get('sleep')
+    if sleep is not None:
+        time.sleep(sleep)
+
     returncode = instructions.get('returncode')
     if returncode is not None:
         sys.exit(returncode)
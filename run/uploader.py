@@ -0,0 +1,284 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import errno
+import json
+import mimetypes
+import os
+import Queue
+import random
+import requests
+import threading
+import time
+import urllib
+
+from requests.adapters import HTTPAdapter
+
+"""
+uploader.py uploads files to Google Cloud Storage (using its XML API) from a
+pool of threads, as they are produced, instead of syncing a directory once
+every file has been written.
+
+Each completed upload is appended to a journal, so that an interrupted
+upload resumes without transferring (or listing and checksumming) files
+again. Failed requests are retried with exponential backoff.
+
+`endpoint` may point at any server accepting `PUT /{bucket}/{name}`, which
+allows uploads to be tested against a local stand-in.
+"""
+
+DEFAULT_ENDPOINT = 'https://storage.googleapis.com'
+STORAGE_SCOPE = 'https://www.googleapis.com/auth/devstorage.read_write'
+
+# Responses which indicate that a request may succeed if repeated
+RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# Seconds to wait for a connection, and between bytes of the response, before
+# retrying a request
+DEFAULT_TIMEOUT = (10, 120)
+
+# The type of files (e.g. results) whose name does not reveal their type
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+
+def get_authorized_session():
+    '''Create a session whose requests carry the application default
+    credentials (e.g. those of `gcloud auth application-default login` or of
+    the GCE service account), refreshing them as they expire.'''
+
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+
+    credentials, _ = google.auth.default(scopes=[STORAGE_SCOPE])
+
+    return AuthorizedSession(credentials)
+
+
+class UploadError(Exception):
+    pass
+
+
+class Uploader(object):
+    '''Uploads files below `root` to `{bucket}/{path relative to root}`.
+
+    Files are queued with `put` and uploaded by `workers` threads sharing a
+    pool of connections. `flush` waits for queued uploads to complete, and
+    `close` also stops the threads. The first failed upload is raised by
+    `put`, `flush` or `close`.
+
+    Completed uploads are recorded in `journal_path`, together with the size
+    and modification time of the file, so that an unchanged file is not
+    uploaded again.
+
+    `timeout` is the `(connect, read)` timeout of each request; requests
+    which time out are retried.'''
+
+    def __init__(self, root, bucket, journal_path, workers=8, session=None,
+                 endpoint=DEFAULT_ENDPOINT, max_attempts=5, backoff=1.0,
+                 queue_size=None, timeout=DEFAULT_TIMEOUT):
+        self.root = root
+        self.bucket = bucket
+        self.journal_path = journal_path
+        self.workers = workers
+        self.endpoint = endpoint
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.uploaded = 0
+        self.skipped = 0
+
+        self._lock = threading.Lock()
+        self._error = None
+        self._done = self._read_journal()
+        self._queue = Queue.Queue(queue_size or workers * 16)
+        self._threads = [
+            threading.Thread(target=self._work) for _ in range(workers)
+        ]
+
+        try:
+            os.makedirs(os.path.dirname(journal_path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self._journal = open(journal_path, 'a')
+
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_journal(self):
+        done = {}
+
+        try:
+            with open(self.journal_path) as handle:
+                for line in handle:
+                    # A line may be incomplete if the process was killed
+                    try:
+                        name, size, mtime = json.loads(line)
+                    except ValueError:
+                        continue
+
+                    done[name] = (size, mtime)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+        return done
+
+    def _check_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def url(self, name):
+        return '%s/%s/%s' % (self.endpoint, self.bucket,
+                             urllib.quote(name, safe='/'))
+
+    def put(self, filepath, name=None, content_encoding='gzip',
+            content_type=None):
+        '''Queue a file for upload as `name` (by default, its path relative
+        to `root`), unless an identical file was uploaded as `name` before.
+
+        The `Content-Type` of the object is guessed from the extension of
+        `name` unless `content_type` is given (results, for instance, are
+        JSON named after their test).'''
+
+        self._check_error()
+
+        if name is None:
+            name = os.path.relpath(filepath, self.root)
+
+        if content_type is None:
+            content_type = (mimetypes.guess_type(name)[0] or
+                            DEFAULT_CONTENT_TYPE)
+
+        stat = os.stat(filepath)
+        version = (stat.st_size, stat.st_mtime)
+
+        with self._lock:
+            if self._done.get(name) == version:
+                self.skipped += 1
+                return
+
+        self._queue.put((filepath, name, version, content_encoding,
+                         content_type))
+
+    def put_tree(self, directory, exclude=None, content_encoding='gzip',
+                 content_type=None):
+        '''Queue every file in a directory (recursively) whose path does not
+        match the regular expression `exclude`, as `content_type` (or the
+        type guessed from the name of each file).'''
+
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+
+                if exclude is not None and exclude.search(filepath):
+                    continue
+
+                self.put(filepath, content_encoding=content_encoding,
+                         content_type=content_type)
+
+    def _upload(self, filepath, name, content_encoding, content_type):
+        headers = {'Content-Type': content_type}
+        if content_encoding:
+            headers['Content-Encoding'] = content_encoding
+
+        attempt = 1
+        while True:
+            try:
+                with open(filepath, 'rb') as handle:
+                    response = self.session.put(
+                        self.url(name), data=handle, headers=headers,
+                        timeout=self.timeout
+                    )
+
+                if response.status_code not in RETRY_STATUS_CODES:
+                    break
+
+                error = UploadError('%s returned %s' % (
+                    self.url(name), response.status_code
+                ))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+
+            if attempt >= self.max_attempts:
+                raise error
+
+            # Exponential backoff, with jitter
+            delay = (self.backoff * 2 ** (attempt - 1) *
+                     (1 + random.random()) / 2)
+            print('Retrying upload of %s in %.1fs (%s)' % (name, delay, error))
+            time.sleep(delay)
+            attempt += 1
+
+        if response.status_code != 200:
+            raise UploadError('%s returned %s: %s' % (
+                self.url(name), response.status_code, response.text
+            ))
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+
+            try:
+                if item is None:
+                    return
+
+                # Drain the queue without uploading once an upload has failed
+                if self._error is not None:
+                    continue
+
+                filepath, name, version, content_encoding, content_type = item
+
+                try:
+                    self._upload(filepath, name, content_encoding,
+                                 content_type)
+                except Exception as e:
+                    self._error = e
+                    continue
+
+                with self._lock:
+                    self._done[name] = version
+                    self._journal.write(json.dumps([name] + list(version)))
+                    self._journal.write('\n')
+                    self._journal.flush()
+                    self.uploaded += 1
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        '''Wait for every queued file to be uploaded.'''
+
+        self._queue.join()
+        self._check_error()
+
+    def close(self):
+        if self._journal.closed:
+            return
+
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+        self._journal.close()
+
+        self._check_error()
+
+        print('Uploaded %s files to %s (%s already uploaded)' % (
+            self.uploaded, self.bucket, self.skipped
+        ))
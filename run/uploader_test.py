@@ -0,0 +1,252 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import BaseHTTPServer
+import os
+import SocketServer
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import urllib
+
+from result_writer import ResultWriter
+from uploader import Uploader, UploadError
+
+
+class StorageRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''A stand-in for the object store, which records uploaded objects in
+    `server.objects` (and their types in `server.content_types`), responds
+    to the first `server.failures[name]` uploads of an object with
+    `server.failure_status` and delays the first `server.stalls[name]` by
+    `server.stall_duration`.'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        name = urllib.unquote(self.path)
+
+        with self.server.lock:
+            self.server.requests.append(name)
+            stall = self.server.stalls.get(name)
+            if stall:
+                self.server.stalls[name] -= 1
+
+        if stall:
+            time.sleep(self.server.stall_duration)
+
+        with self.server.lock:
+            if self.server.failures.get(name):
+                self.server.failures[name] -= 1
+                status = self.server.failure_status
+            else:
+                self.server.objects[name] = (
+                    data, self.headers.get('Content-Encoding')
+                )
+                self.server.content_types[name] = self.headers.get(
+                    'Content-Type'
+                )
+                status = 200
+
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StorageServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class TestUploader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, 'build')
+        self.journal_path = os.path.join(self.tmp_dir, 'uploads', 'abc.log')
+
+        self.server = StorageServer(('127.0.0.1', 0), StorageRequestHandler)
+        self.server.lock = threading.Lock()
+        self.server.objects = {}
+        self.server.content_types = {}
+        self.server.stalls = {}
+        self.server.stall_duration = 1
+        self.server.requests = []
+        self.server.failures = {}
+        self.server.failure_status = 503
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def write_file(self, name, contents):
+        filepath = os.path.join(self.root, name)
+
+        if not os.path.isdir(os.path.dirname(filepath)):
+            os.makedirs(os.path.dirname(filepath))
+
+        with open(filepath, 'wb') as handle:
+            handle.write(contents)
+
+        return filepath
+
+    def uploader(self, **kwargs):
+        return Uploader(
+            self.root, 'wptd', self.journal_path, workers=2, backoff=0,
+            endpoint='http://127.0.0.1:%s' % self.server.server_port,
+            **kwargs
+        )
+
+    def test_put(self):
+        first = self.write_file('abc/chrome/a.html', 'first')
+        self.write_file('abc/chrome/b.html?query', 'second')
+        self.write_file('abc/chrome.archive', 'archive')
+
+        with self.uploader() as uploader:
+            uploader.put(first)
+            uploader.put(first, 'objects/1234')
+            uploader.put(os.path.join(self.root, 'abc/chrome.archive'),
+                         content_encoding=None)
+
+        self.assertEqual(self.server.objects, {
+            '/wptd/abc/chrome/a.html': ('first', 'gzip'),
+            '/wptd/objects/1234': ('first', 'gzip'),
+            '/wptd/abc/chrome.archive': ('archive', None)
+        })
+        self.assertEqual(self.server.content_types, {
+            '/wptd/abc/chrome/a.html': 'text/html',
+            '/wptd/objects/1234': 'application/octet-stream',
+            '/wptd/abc/chrome.archive': 'application/octet-stream'
+        })
+
+    def test_content_type(self):
+        self.write_file('abc/chrome/dom/a.html', 'result')
+        self.write_file('abc/chrome-summary.json.gz', 'summary')
+        self.write_file('abc/chrome-report-chunks/1-of-1.json', '[]')
+
+        with self.uploader() as uploader:
+            uploader.put_tree(os.path.join(self.root, 'abc', 'chrome'),
+                              content_type='application/json')
+            uploader.put(
+                os.path.join(self.root, 'abc', 'chrome-summary.json.gz')
+            )
+            uploader.put_tree(
+                os.path.join(self.root, 'abc', 'chrome-report-chunks'),
+                content_encoding=None
+            )
+
+        self.assertEqual(self.server.content_types, {
+            '/wptd/abc/chrome/dom/a.html': 'application/json',
+            '/wptd/abc/chrome-summary.json.gz': 'application/json',
+            '/wptd/abc/chrome-report-chunks/1-of-1.json': 'application/json'
+        })
+        self.assertEqual(
+            self.server.objects['/wptd/abc/chrome-report-chunks/1-of-1.json'],
+            ('[]', None)
+        )
+
+    def test_resume(self):
+        first = self.write_file('abc/chrome/a.html', 'first')
+        self.write_file('abc/chrome/b.html', 'second')
+
+        with self.uploader() as uploader:
+            uploader.put(first)
+
+        self.write_file('abc/chrome/c.html', 'third')
+        # A file which is written again is uploaded again
+        self.write_file('abc/chrome/a.html', 'changed')
+
+        with self.uploader() as uploader:
+            uploader.put_tree(os.path.join(self.root, 'abc'))
+
+        self.assertEqual(uploader.skipped, 0)
+        self.assertEqual(self.server.objects['/wptd/abc/chrome/a.html'],
+                         ('changed', 'gzip'))
+
+        del self.server.requests[:]
+
+        with self.uploader() as uploader:
+            uploader.put_tree(os.path.join(self.root, 'abc'))
+
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(uploader.skipped, 3)
+        self.assertEqual(len(self.server.objects), 3)
+
+    def test_retry(self):
+        filepath = self.write_file('abc/a.html', 'first')
+        self.server.failures['/wptd/abc/a.html'] = 2
+
+        with self.uploader() as uploader:
+            uploader.put(filepath)
+
+        self.assertEqual(self.server.requests, ['/wptd/abc/a.html'] * 3)
+        self.assertIn('/wptd/abc/a.html', self.server.objects)
+
+    def test_retry_timeout(self):
+        filepath = self.write_file('abc/a.html', 'first')
+        self.server.stalls['/wptd/abc/a.html'] = 1
+
+        with self.uploader(timeout=(1, 0.1)) as uploader:
+            uploader.put(filepath)
+
+        self.assertEqual(self.server.requests, ['/wptd/abc/a.html'] * 2)
+        self.assertIn('/wptd/abc/a.html', self.server.objects)
+
+    def test_retries_exhausted(self):
+        filepath = self.write_file('abc/a.html', 'first')
+        self.server.failures['/wptd/abc/a.html'] = 3
+
+        uploader = self.uploader(max_attempts=3)
+        uploader.put(filepath)
+
+        with self.assertRaises(UploadError):
+            uploader.close()
+
+        # Failed uploads are not recorded
+        with self.uploader() as uploader:
+            uploader.put(filepath)
+
+        self.assertEqual(uploader.uploaded, 1)
+
+    def test_no_retry(self):
+        filepath = self.write_file('abc/a.html', 'first')
+        self.server.failures['/wptd/abc/a.html'] = 1
+        self.server.failure_status = 403
+
+        uploader = self.uploader()
+        uploader.put(filepath)
+
+        with self.assertRaises(UploadError):
+            uploader.flush()
+
+        self.assertEqual(len(self.server.requests), 1)
+
+        with self.assertRaises(UploadError):
+            uploader.close()
+
+    def test_result_writer(self):
+        results = [
+            {'test': '/dom/%s.html' % i, 'status': 'OK', 'message': None,
+             'subtests': []}
+            for i in range(20)
+        ]
+
+        with self.uploader() as uploader:
+            ResultWriter(os.path.join(self.root, 'abc', 'chrome'),
+                         uploader=uploader).write(results)
+
+        self.assertEqual(sorted(self.server.objects.keys()), sorted(
+            '/wptd/abc/chrome/dom/%s.html' % i for i in range(20)
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import errno
+import json
+import os
+import signal
+import subprocess
+import time
+
+"""
+watchdog.py runs the WPT CLI and stops it if it stops making progress (e.g.
+because of a wedged browser or Sauce Connect tunnel), so that a run is
+bounded by the progress of the tests rather than by the next scheduled run.
+
+Progress is read from the raw log (`--log-raw`) written by the WPT CLI: if
+no test ends within the "stall timeout", the command and every process it
+started are killed.
+"""
+
+
+def start_process(command, **kwargs):
+    '''Start a command (with the arguments of `subprocess.Popen`) in a new
+    process group, so that the browser and any other processes it starts can
+    be stopped with it.'''
+
+    return subprocess.Popen(command, preexec_fn=os.setsid, **kwargs)
+
+
+class Watchdog(object):
+    '''Runs a command which writes a raw log to `raw_log_filename`, killing
+    its process group if no `test_end` entry is written for
+    `stall_timeout` seconds (counted from the start of the command before
+    the first test ends).
+
+    After `call` returns, `stalled` indicates whether the command was
+    killed, and `stalled_test` names the test which was running at the
+    time (if any).'''
+
+    def __init__(self, raw_log_filename, stall_timeout, poll_interval=1.0,
+                 kill_timeout=10):
+        self.raw_log_filename = raw_log_filename
+        self.stall_timeout = stall_timeout
+        self.poll_interval = poll_interval
+        self.kill_timeout = kill_timeout
+
+        self.stalled = False
+        self.stalled_test = None
+        self.completed_tests = 0
+
+        self._position = 0
+        self._remainder = ''
+        self._current_tests = []
+
+    def _read_log(self):
+        '''Read the entries which have been added to the raw log since it was
+        last read. Returns `True` if any test has ended.'''
+
+        try:
+            with open(self.raw_log_filename) as handle:
+                handle.seek(self._position)
+                data = handle.read()
+                self._position = handle.tell()
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+
+        lines = (self._remainder + data).split('\n')
+        # The last line may be incomplete
+        self._remainder = lines.pop()
+        progressed = False
+
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+
+            action = entry.get('action')
+
+            if action == 'test_start':
+                self._current_tests.append(entry.get('test'))
+            elif action == 'test_end':
+                if entry.get('test') in self._current_tests:
+                    self._current_tests.remove(entry.get('test'))
+                self.completed_tests += 1
+                progressed = True
+
+        return progressed
+
+    def _kill(self, process):
+        '''Terminate the process group of the command, resorting to `SIGKILL`
+        if it does not exit within `kill_timeout` seconds.'''
+
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except OSError:
+            return
+
+        deadline = time.time() + self.kill_timeout
+        while process.poll() is None and time.time() < deadline:
+            time.sleep(0.1)
+
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def call(self, command, **kwargs):
+        '''Run a command (with the arguments of `subprocess.Popen`) until it
+        exits or stalls. Returns its return code.'''
+
+        return self.wait(start_process(command, **kwargs))
+
+    def wait(self, process):
+        '''Wait for a process started by `start_process` to exit, or stop it
+        if it stalls. Returns its return code.'''
+
+        last_progress = time.time()
+
+        try:
+            while process.poll() is None:
+                time.sleep(self.poll_interval)
+
+                if self._read_log():
+                    last_progress = time.time()
+                elif time.time() - last_progress > self.stall_timeout:
+                    self.stalled = True
+                    if self._current_tests:
+                        self.stalled_test = self._current_tests[0]
+                    self._kill(process)
+                    break
+        except BaseException:
+            self._kill(process)
+            raise
+
+        return process.wait()
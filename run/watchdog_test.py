@@ -0,0 +1,114 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from watchdog import Watchdog
+
+# Writes the raw log entries of the tests named in its arguments, one each
+# `DELAY` seconds, except that a test named "hang" never ends. A process
+# started by the script records its ID in `pid_filename`, so that the test
+# can check that it is stopped along with the script.
+FAKE_WPT = '''
+import json, os, subprocess, sys, time
+
+raw_log_filename, pid_filename, delay = sys.argv[1:4]
+child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+with open(pid_filename, 'w') as handle:
+    handle.write(str(child.pid))
+
+with open(raw_log_filename, 'w') as handle:
+    def log(**entry):
+        handle.write(json.dumps(entry) + '\\n')
+        handle.flush()
+
+    log(action='suite_start', tests={'default': sys.argv[4:]})
+    for test in sys.argv[4:]:
+        log(action='test_start', test=test)
+        time.sleep(float(delay))
+        if test == 'hang':
+            time.sleep(60)
+        log(action='test_end', test=test, status='OK')
+    log(action='suite_end')
+
+child.kill()
+'''
+
+
+class TestWatchdog(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.raw_log_filename = os.path.join(self.tmp_dir, 'raw.log')
+        self.pid_filename = os.path.join(self.tmp_dir, 'child.pid')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def call(self, watchdog, delay, tests):
+        return watchdog.call([
+            sys.executable, '-c', FAKE_WPT, self.raw_log_filename,
+            self.pid_filename, str(delay)
+        ] + tests)
+
+    def assert_stopped(self, pid):
+        # The process may take a moment to stop, and is not necessarily
+        # reaped (leaving a "zombie" entry)
+        for _ in range(50):
+            try:
+                with open('/proc/%s/stat' % pid) as handle:
+                    if handle.read().rsplit(')', 1)[1].split()[0] == 'Z':
+                        return
+            except IOError:
+                return
+            time.sleep(0.1)
+
+        self.fail('Process %s is still running' % pid)
+
+    def test_progress(self):
+        watchdog = Watchdog(self.raw_log_filename, 1, poll_interval=0.1)
+
+        # The run takes longer than the stall timeout, but each test ends
+        # within it
+        return_code = self.call(watchdog, 0.3, ['/a.html', '/b.html',
+                                                '/c.html', '/d.html'])
+
+        self.assertEqual(return_code, 0)
+        self.assertFalse(watchdog.stalled)
+        self.assertIsNone(watchdog.stalled_test)
+        self.assertEqual(watchdog.completed_tests, 4)
+
+    def test_stall(self):
+        watchdog = Watchdog(self.raw_log_filename, 1, poll_interval=0.1,
+                            kill_timeout=1)
+
+        start = time.time()
+        return_code = self.call(watchdog, 0.1, ['/a.html', 'hang', '/c.html'])
+
+        self.assertLess(time.time() - start, 30)
+        self.assertNotEqual(return_code, 0)
+        self.assertTrue(watchdog.stalled)
+        self.assertEqual(watchdog.stalled_test, 'hang')
+        self.assertEqual(watchdog.completed_tests, 1)
+
+        with open(self.pid_filename) as handle:
+            self.assert_stopped(int(handle.read()))
+
+    def test_no_log(self):
+        watchdog = Watchdog(self.raw_log_filename, 1, poll_interval=0.1)
+
+        return_code = watchdog.call([sys.executable, '-c',
+                                     'import time; time.sleep(60)'])
+
+        self.assertNotEqual(return_code, 0)
+        self.assertTrue(watchdog.stalled)
+        self.assertIsNone(watchdog.stalled_test)
+
+
+if __name__ == '__main__':
+    unittest.main()
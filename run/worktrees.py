@@ -0,0 +1,124 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import errno
+import fcntl
+import logging
+import os
+import shutil
+import subprocess
+
+from contextlib import contextmanager
+from lock_files import open_locked, try_open_locked
+
+"""
+worktrees.py maintains a set of git worktrees of WPT, one per WPT revision,
+which share the object store of a single WPT clone. Runs of different
+platforms on the same host each use the worktree of their revision instead
+of checking out revisions in the shared clone, so they do not interfere with
+one another.
+"""
+
+
+class WorktreePool(object):
+    '''A directory of WPT worktrees, keyed by (abbreviated) revision.
+
+    Worktrees are reused by runs of the same revision and removed on a least
+    recently used basis once there are more than `size` of them. A worktree
+    is never removed while a run (in any process) is using it.'''
+
+    def __init__(self, wpt_path, directory, size=4):
+        self.wpt_path = wpt_path
+        self.directory = directory
+        self.size = size
+
+        self._logger = logging.getLogger()
+        self._handles = {}
+
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _path(self, sha):
+        return os.path.join(self.directory, sha[:10])
+
+    def _lock_path(self, sha):
+        return os.path.join(self.directory, '%s.lock' % sha[:10])
+
+    @contextmanager
+    def _pool_lock(self):
+        '''Serialize the creation and removal of worktrees.'''
+
+        with open(os.path.join(self.directory, '.lock'), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _git(self, *args):
+        return subprocess.check_call(['git'] + list(args), cwd=self.wpt_path)
+
+    def shas(self):
+        '''List the (abbreviated) revisions which have a worktree, most
+        recently used first.'''
+
+        names = [
+            name for name in os.listdir(self.directory)
+            if os.path.isdir(os.path.join(self.directory, name))
+        ]
+
+        return sorted(
+            names,
+            key=lambda name: os.path.getmtime(self._lock_path(name))
+            if os.path.exists(self._lock_path(name)) else 0,
+            reverse=True
+        )
+
+    def acquire(self, sha):
+        '''Retrieve the path to a worktree of the given revision, creating it
+        if necessary. The worktree is reserved until it is released.'''
+
+        path = self._path(sha)
+
+        with self._pool_lock():
+            handle = open_locked(self._lock_path(sha), fcntl.LOCK_SH)
+            self._handles[path] = handle
+
+            if os.path.isdir(path):
+                self._logger.info('Reusing WPT worktree %s', path)
+            else:
+                self._logger.info('Creating WPT worktree %s', path)
+                self._git('worktree', 'add', '--detach', path, sha)
+
+            # Record the use of the worktree for `prune`
+            os.utime(self._lock_path(sha), None)
+
+        return path
+
+    def release(self, path):
+        handle = self._handles.pop(path)
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+    def prune(self):
+        '''Remove the least recently used worktrees in excess of the size of
+        the pool, skipping those which are in use.'''
+
+        with self._pool_lock():
+            for name in self.shas()[self.size:]:
+                handle = try_open_locked(self._lock_path(name))
+
+                if handle is None:
+                    continue
+
+                # The lock file is only removed while it is locked
+                with handle:
+                    self._logger.info('Removing WPT worktree %s', name)
+                    shutil.rmtree(self._path(name))
+                    os.remove(self._lock_path(name))
+
+            self._git('worktree', 'prune')
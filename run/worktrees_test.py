@@ -0,0 +1,106 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from worktrees import WorktreePool
+
+
+class TestWorktreePool(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.wpt_path = os.path.join(self.tmp_dir, 'wpt')
+        self.pool = WorktreePool(
+            self.wpt_path, os.path.join(self.tmp_dir, 'worktrees'), size=2
+        )
+        self.shas = []
+
+        os.mkdir(self.wpt_path)
+        self.git('init', '-q')
+        self.git('config', 'user.email', 'wpt@example.com')
+        self.git('config', 'user.name', 'wpt')
+
+        for revision in range(4):
+            with open(os.path.join(self.wpt_path, 'rev'), 'w') as handle:
+                handle.write(str(revision))
+            self.git('add', 'rev')
+            self.git('commit', '-q', '-m', 'commit %s' % revision)
+            self.shas.append(self.git('rev-parse', 'HEAD'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def git(self, *args):
+        return subprocess.check_output(
+            ['git'] + list(args), cwd=self.wpt_path
+        ).strip()
+
+    def read_revision(self, path):
+        with open(os.path.join(path, 'rev')) as handle:
+            return handle.read()
+
+    def test_acquire(self):
+        path = self.pool.acquire(self.shas[1])
+
+        self.assertEqual(
+            path, os.path.join(self.tmp_dir, 'worktrees', self.shas[1][:10])
+        )
+        self.assertEqual(self.read_revision(path), '1')
+        # The shared clone is not modified
+        self.assertEqual(self.read_revision(self.wpt_path), '3')
+
+    def test_acquire_reuse(self):
+        path = self.pool.acquire(self.shas[1])
+        self.pool.release(path)
+        with open(os.path.join(path, 'marker'), 'w'):
+            pass
+
+        self.assertEqual(self.pool.acquire(self.shas[1]), path)
+        self.assertTrue(os.path.exists(os.path.join(path, 'marker')))
+
+    def test_prune(self):
+        for sha in self.shas[:3]:
+            self.pool.release(self.pool.acquire(sha))
+            os.utime(
+                os.path.join(self.tmp_dir, 'worktrees', '%s.lock' % sha[:10]),
+                (len(self.pool.shas()), len(self.pool.shas()))
+            )
+
+        self.pool.prune()
+
+        self.assertEqual(
+            self.pool.shas(), [self.shas[2][:10], self.shas[1][:10]]
+        )
+        self.assertNotIn(self.shas[0][:10], self.git('worktree', 'list'))
+
+    def test_prune_in_use(self):
+        in_use = self.pool.acquire(self.shas[0])
+        lock_path = os.path.join(self.tmp_dir, 'worktrees',
+                                 '%s.lock' % self.shas[0][:10])
+        os.utime(lock_path, (1, 1))
+
+        for sha in self.shas[1:]:
+            self.pool.release(self.pool.acquire(sha))
+
+        self.pool.prune()
+
+        self.assertEqual(len(self.pool.shas()), 3)
+        self.assertEqual(self.pool.shas()[-1], self.shas[0][:10])
+        self.assertTrue(os.path.isdir(in_use))
+        # Checking whether a worktree is in use does not record a use of it
+        self.assertEqual(os.path.getmtime(lock_path), 1)
+
+        self.pool.release(in_use)
+        self.pool.prune()
+
+        self.assertNotIn(self.shas[0][:10], self.pool.shas())
+        self.assertFalse(os.path.exists(lock_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,257 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import re
+
+"""
+wptreport.py reads and writes wptreport files (as produced by `wpt run
+--log-wptreport`) one result at a time, so that memory consumption does not
+depend on the size of the file. The results of a full run (with their
+subtest messages) may take gigabytes once parsed.
+
+    {"results": [{"test": "/a.html", ...}, ...], "time_start": ..., ...}
+"""
+
+# Number of bytes read from a file at once
+READ_SIZE = 64 * 1024
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# The characters which may continue a number (e.g. the fraction of `1.5`,
+# split across reads as `1` and `.5`), up to the end of the buffer
+NUMBER_TAIL = re.compile(r'[0-9.eE+-]*$')
+
+_decoder = json.JSONDecoder()
+
+
+class ReportReader(object):
+    '''Reads a wptreport document from a file object incrementally.
+
+    Iterating yields each element of the `results` array in turn; the other
+    top-level properties of the document are available in `properties` once
+    iteration is complete. Only one result (and the unparsed input
+    surrounding it) is held in memory.
+
+    Raises a `ValueError` if the document is not valid JSON.'''
+
+    def __init__(self, handle, read_size=READ_SIZE):
+        self.properties = {}
+
+        self._handle = handle
+        self._read_size = read_size
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        # Number of bytes discarded from the start of the buffer
+        self._consumed = 0
+        # Location in the file of the most recently parsed value
+        self._span = None
+
+    def _fill(self, size=None):
+        '''Read more of the file. Returns `False` at the end of the file.'''
+
+        data = self._handle.read(size or self._read_size)
+
+        if not data:
+            self._eof = True
+            return False
+
+        # Discard the input which has already been parsed
+        self._consumed += self._pos
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+
+            if self._pos < len(self._buffer) or not self._fill():
+                return
+
+    def _expect(self, chars):
+        '''Consume the next (non-whitespace) character, which must be one of
+        the given characters, and return it.'''
+
+        self._skip_whitespace()
+
+        if self._pos >= len(self._buffer):
+            raise ValueError('Unexpected end of report')
+
+        char = self._buffer[self._pos]
+
+        if char not in chars:
+            raise ValueError('Expected one of "%s" but found "%s"' % (
+                chars, char
+            ))
+
+        self._pos += 1
+
+        return char
+
+    def _value(self):
+        '''Parse the next complete JSON value.'''
+
+        self._skip_whitespace()
+
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if self._eof:
+                    raise
+                value, end = None, None
+
+            # A number at the end of the buffer may be incomplete
+            if end is not None and (self._eof or not (
+                    isinstance(value, (int, long, float)) and
+                    not isinstance(value, bool) and
+                    NUMBER_TAIL.match(self._buffer, end))):
+                self._span = (self._consumed + self._pos, end - self._pos)
+                self._pos = end
+                return value
+
+            # Grow the buffer geometrically so that a large value is not
+            # re-parsed for every read
+            self._fill(max(self._read_size, len(self._buffer) - self._pos))
+
+    def _array(self):
+        self._expect('[')
+        self._skip_whitespace()
+
+        if self._buffer[self._pos:self._pos + 1] == ']':
+            self._pos += 1
+            return
+
+        while True:
+            yield self._value()
+
+            if self._expect(',]') == ']':
+                return
+
+    def __iter__(self):
+        self._expect('{')
+        self._skip_whitespace()
+
+        if self._buffer[self._pos:self._pos + 1] == '}':
+            self._pos += 1
+        else:
+            while True:
+                key = self._value()
+
+                if not isinstance(key, basestring):
+                    raise ValueError('Expected a property name')
+
+                self._expect(':')
+
+                if key == 'results':
+                    for result in self._array():
+                        yield result
+                else:
+                    self.properties[key] = self._value()
+
+                if self._expect(',}') == '}':
+                    break
+
+        self._skip_whitespace()
+
+        if self._pos < len(self._buffer):
+            raise ValueError('Extra data after report')
+
+    def with_spans(self):
+        '''Iterate over the results together with the `(offset, length)` of
+        each in the file.'''
+
+        for result in self:
+            yield result, self._span
+
+
+class ReportFile(object):
+    '''The results of a wptreport file, which are read from the file each
+    time they are iterated.'''
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def __iter__(self):
+        with open(self.file_name, 'rb') as handle:
+            for result in ReportReader(handle):
+                yield result
+
+
+def results_from_raw_log(handle):
+    '''Reconstruct the results of the tests which ended in a raw log (as
+    produced by `wpt run --log-raw`) in the format of the results of a
+    wptreport document. A run which is stopped before it ends writes no
+    wptreport file, but its raw log is written as each test runs.'''
+
+    subtests = {}
+
+    for line in handle:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+
+        if not isinstance(entry, dict):
+            continue
+
+        action = entry.get('action')
+        test = entry.get('test')
+
+        if action == 'test_start':
+            subtests[test] = []
+        elif action == 'test_status':
+            subtests.setdefault(test, []).append({
+                'name': entry.get('subtest'),
+                'status': entry.get('status'),
+                'message': entry.get('message')
+            })
+        elif action == 'test_end':
+            yield {
+                'test': test,
+                'status': entry.get('status'),
+                'message': entry.get('message'),
+                'subtests': subtests.pop(test, [])
+            }
+
+
+def write_report(handle, results, properties=None, spans=None):
+    '''Write a wptreport document whose results are taken from the given
+    iterable one at a time. `properties` (the other top-level properties of
+    the document) is read once every result has been written. The `(offset,
+    length)` of each result in the document is appended to the list `spans`
+    (if given).
+
+    Returns the number of results written.'''
+
+    count = 0
+    offset = len('{"results": [')
+
+    handle.write('{"results": [')
+
+    for result in results:
+        if count:
+            handle.write(', ')
+            offset += len(', ')
+
+        data = json.dumps(result)
+        handle.write(data)
+
+        if spans is not None:
+            spans.append((offset, len(data)))
+
+        offset += len(data)
+        count += 1
+
+    handle.write(']')
+
+    for key, value in sorted((properties or {}).items()):
+        handle.write(', %s: %s' % (json.dumps(key), json.dumps(value)))
+
+    handle.write('}')
+
+    return count
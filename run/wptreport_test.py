@@ -0,0 +1,166 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import io
+import json
+import unittest
+
+from wptreport import ReportReader, results_from_raw_log, write_report
+
+
+def result(test, message=None):
+    return {
+        'test': test,
+        'status': 'OK',
+        'message': message,
+        'subtests': [{'status': 'PASS', 'message': None, 'name': 'first'}]
+    }
+
+
+class TestReportReader(unittest.TestCase):
+    def read(self, contents, read_size=7):
+        reader = ReportReader(io.BytesIO(contents), read_size)
+
+        return list(reader), reader.properties
+
+    def test_read(self):
+        results = [result('/a.html'), result('/b.html', 'x' * 100),
+                   result(u'/\u00e9.html')]
+        document = {
+            'time_start': 1516146880000,
+            'results': results,
+            'run_info': {'os': 'linux', 'debug': False},
+            'time_end': 1516146890123
+        }
+
+        for read_size in (1, 7, 1024):
+            actual, properties = self.read(json.dumps(document), read_size)
+
+            self.assertEqual(actual, results)
+            self.assertEqual(properties, {
+                'time_start': 1516146880000,
+                'run_info': {'os': 'linux', 'debug': False},
+                'time_end': 1516146890123
+            })
+
+    def test_split_numbers(self):
+        document = {
+            'time_start': 58009.123,
+            'results': [result('/a.html')],
+            'duration': -1.5e-3,
+            'time_end': 1516146890123E+2
+        }
+        contents = json.dumps(document)
+
+        # A number split across reads (e.g. `58009.` and `123`) is read whole
+        for read_size in range(1, 12):
+            actual, properties = self.read(contents, read_size)
+
+            self.assertEqual(actual, [result('/a.html')])
+            self.assertEqual(properties, {
+                'time_start': 58009.123,
+                'duration': -1.5e-3,
+                'time_end': 1516146890123E+2
+            })
+
+        self.assertEqual(self.read('{"results": [], "time": 1.25}', 29),
+                         ([], {'time': 1.25}))
+
+    def test_spans(self):
+        contents = json.dumps({
+            'run_info': {},
+            'results': [result('/a.html'), result('/b.html')]
+        }, indent=2)
+        reader = ReportReader(io.BytesIO(contents), 5)
+
+        for actual, (offset, length) in reader.with_spans():
+            self.assertEqual(
+                json.loads(contents[offset:offset + length]), actual
+            )
+
+    def test_whitespace(self):
+        contents = json.dumps(
+            {'results': [result('/a.html'), result('/b.html')]}, indent=4
+        )
+
+        self.assertEqual(
+            self.read(contents + '\n')[0],
+            [result('/a.html'), result('/b.html')]
+        )
+
+    def test_empty(self):
+        self.assertEqual(self.read('{}'), ([], {}))
+        self.assertEqual(self.read('{"results": [ ]}'), ([], {}))
+
+    def test_invalid(self):
+        contents = json.dumps({'results': [result('/a.html')] * 3})
+
+        for invalid in ('', '[]', contents[:-10], contents + '{}'):
+            with self.assertRaises(ValueError):
+                self.read(invalid)
+
+    def test_write(self):
+        stream = io.BytesIO()
+        results = [result('/a.html'), result('/b.html')]
+
+        spans = []
+        count = write_report(stream, iter(results), {'time_start': 1}, spans)
+
+        self.assertEqual(count, 2)
+        reader = ReportReader(io.BytesIO(stream.getvalue()))
+        self.assertEqual(spans, [span for _, span in reader.with_spans()])
+        self.assertEqual(json.loads(stream.getvalue()), {
+            'results': results, 'time_start': 1
+        })
+        self.assertEqual(self.read(stream.getvalue()), (
+            results, {'time_start': 1}
+        ))
+
+
+class TestResultsFromRawLog(unittest.TestCase):
+    def test_read(self):
+        entries = [
+            {'action': 'suite_start', 'tests': {'default': ['/a.html']}},
+            {'action': 'test_start', 'test': '/a.html'},
+            {'action': 'test_status', 'test': '/a.html', 'subtest': 'first',
+             'status': 'PASS'},
+            {'action': 'test_status', 'test': '/a.html', 'subtest': 'second',
+             'status': 'FAIL', 'message': 'bad'},
+            {'action': 'test_end', 'test': '/a.html', 'status': 'OK'},
+            {'action': 'test_start', 'test': '/b.html'},
+            {'action': 'test_end', 'test': '/b.html', 'status': 'TIMEOUT',
+             'message': 'slow'},
+            # The run was stopped while this test was running
+            {'action': 'test_start', 'test': '/c.html'},
+            {'action': 'test_status', 'test': '/c.html', 'subtest': 'first',
+             'status': 'PASS'}
+        ]
+        lines = [json.dumps(entry) for entry in entries]
+        # Lines which are not log entries are ignored
+        lines.insert(1, '[]')
+        lines.append('{"action": "test_end", "te')
+
+        results = list(results_from_raw_log(io.BytesIO('\n'.join(lines))))
+
+        self.assertEqual(results, [
+            {
+                'test': '/a.html',
+                'status': 'OK',
+                'message': None,
+                'subtests': [
+                    {'name': 'first', 'status': 'PASS', 'message': None},
+                    {'name': 'second', 'status': 'FAIL', 'message': 'bad'}
+                ]
+            },
+            {
+                'test': '/b.html',
+                'status': 'TIMEOUT',
+                'message': 'slow',
+                'subtests': []
+            }
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
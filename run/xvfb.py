@@ -0,0 +1,257 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import errno
+import logging
+import os
+import Queue
+import subprocess
+import threading
+import time
+
+
+class DisplayError(Exception):
+    pass
+
+
+class XvfbRunDisplays(object):
+    '''Assigns X server numbers to chunks which start their own (short-lived)
+    X server via `xvfb-run`.
+
+    `xvfb-run --auto-servernum` searches for a free display starting from the
+    given server number, so spacing the starting points apart avoids races
+    between chunks that start at the same moment. A single `None` entry
+    (i.e. "any free display") is used when chunks are run serially.'''
+
+    def __init__(self, size, base=100, spacing=10):
+        self._displays = Queue.Queue()
+
+        if size < 2:
+            self._displays.put(None)
+        else:
+            for slot in range(size):
+                self._displays.put(base + slot * spacing)
+
+    def acquire(self):
+        return self._displays.get()
+
+    def release(self, display):
+        self._displays.put(display)
+
+    def prepare(self, display, command, env):
+        '''Return the command and environment which run `command` on the given
+        display.'''
+
+        xvfb_command = ['xvfb-run', '--auto-servernum']
+
+        if display is not None:
+            xvfb_command.append('--server-num=%s' % display)
+
+        return xvfb_command + command, env
+
+    def close(self):
+        pass
+
+
+class XvfbPool(object):
+    '''A pool of long-lived Xvfb servers which are shared by chunks (and by
+    retried attempts of the same chunk).
+
+    Servers are started once, checked for health each time they are handed
+    out, and shut down by `close`, which also removes any lock files and
+    sockets they leave behind. A display on which a server fails to start
+    (e.g. because another process took it) is skipped, up to
+    `max_start_failures` times.'''
+
+    def __init__(self, size, base=100, screen='1280x1024x24',
+                 xvfb_binary='Xvfb', tmp_dir='/tmp', startup_timeout=10,
+                 max_start_failures=3):
+        self.size = size
+        self.base = base
+        self.screen = screen
+        self.xvfb_binary = xvfb_binary
+        self.tmp_dir = tmp_dir
+        self.startup_timeout = startup_timeout
+        self.max_start_failures = max_start_failures
+
+        self._logger = logging.getLogger()
+        self._lock = threading.Lock()
+        self._servers = {}
+        self._available = Queue.Queue()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _lock_path(self, display):
+        return os.path.join(self.tmp_dir, '.X%s-lock' % display)
+
+    def _socket_path(self, display):
+        return os.path.join(self.tmp_dir, '.X11-unix', 'X%s' % display)
+
+    def _lock_owner(self, display):
+        '''Return the process ID recorded in the lock file of the given
+        display, or `None` if the display is not locked.'''
+
+        try:
+            with open(self._lock_path(display)) as handle:
+                return int(handle.read().strip())
+        except (IOError, ValueError):
+            return None
+
+    def _is_free(self, display):
+        '''Determine whether the given display number may be used, removing
+        lock files and sockets abandoned by X servers that are no longer
+        running.'''
+
+        pid = self._lock_owner(display)
+
+        if pid is None:
+            if os.path.exists(self._lock_path(display)):
+                return False
+        elif process_exists(pid):
+            return False
+
+        self._remove_files(display)
+
+        return True
+
+    def _remove_files(self, display):
+        for name in (self._lock_path(display), self._socket_path(display)):
+            try:
+                os.remove(name)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def _start_server(self, display):
+        command = [
+            self.xvfb_binary, ':%s' % display,
+            '-screen', '0', self.screen,
+            '-nolisten', 'tcp',
+        ]
+        self._logger.info('Starting X server: %s', ' '.join(command))
+
+        with open(os.devnull, 'w') as devnull:
+            process = subprocess.Popen(command, stdout=devnull, stderr=devnull)
+
+        self._servers[display] = process
+
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if self.is_healthy(display):
+                return
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+
+        self._stop_server(display)
+
+        raise DisplayError('X server :%s failed to start' % display)
+
+    def _stop_server(self, display):
+        process = self._servers.pop(display, None)
+
+        if process is None:
+            return
+
+        if process.poll() is None:
+            process.terminate()
+            process.wait()
+
+        # The files may belong to another X server which took the display
+        # before this one could
+        if self._lock_owner(display) == process.pid:
+            self._remove_files(display)
+
+    def _start_free_server(self, display):
+        '''Start an X server on the first free display number from `display`
+        onwards which is not used by the pool. Returns the display.'''
+
+        failures = 0
+
+        while True:
+            if display not in self._servers and self._is_free(display):
+                try:
+                    self._start_server(display)
+                except DisplayError as e:
+                    # Another process may have taken the display since it
+                    # was found to be free
+                    failures += 1
+                    if failures >= self.max_start_failures:
+                        raise
+                    self._logger.warning('%s. Trying :%s.', e, display + 1)
+                else:
+                    return display
+            display += 1
+
+    def start(self):
+        '''Start `size` X servers on free display numbers.'''
+
+        display = self.base
+
+        with self._lock:
+            while len(self._servers) < self.size:
+                display = self._start_free_server(display)
+                self._available.put(display)
+                display += 1
+
+    def is_healthy(self, display):
+        process = self._servers.get(display)
+
+        # The display may have been taken by another X server
+        return (process is not None and
+                process.poll() is None and
+                self._lock_owner(display) == process.pid and
+                os.path.exists(self._socket_path(display)))
+
+    def acquire(self):
+        '''Reserve a display, restarting its X server if it has died since it
+        was last used. The server is restarted on the next free display if
+        another process has taken the display in the meantime.'''
+
+        display = self._available.get()
+
+        with self._lock:
+            if not self.is_healthy(display):
+                self._logger.warning(
+                    'X server :%s is unhealthy. Restarting.', display
+                )
+                self._stop_server(display)
+                try:
+                    display = self._start_free_server(display)
+                except DisplayError:
+                    # A later acquisition will try to start a server again
+                    self._available.put(display)
+                    raise
+
+        return display
+
+    def release(self, display):
+        self._available.put(display)
+
+    def prepare(self, display, command, env):
+        env = dict(env)
+        env['DISPLAY'] = ':%s' % display
+
+        return command, env
+
+    def close(self):
+        '''Stop all X servers and remove their lock files.'''
+
+        with self._lock:
+            for display in list(self._servers.keys()):
+                self._stop_server(display)
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+
+    return True
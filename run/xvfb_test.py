@@ -0,0 +1,220 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import mock
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import xvfb
+
+here = os.path.dirname(os.path.realpath(__file__))
+xvfb_stub = os.path.join(here, 'testing_tools', 'bin', 'Xvfb')
+
+# Starts a pool of X servers the way `run.py` does, then waits to be
+# terminated
+POOL_PROCESS = '''
+import sys, time
+import run, xvfb
+import signal
+signal.signal(signal.SIGTERM, run.exit_on_signal)
+pool = xvfb.XvfbPool(2, base=50, xvfb_binary=sys.argv[1],
+                     tmp_dir=sys.argv[2])
+try:
+    pool.start()
+    sys.stdout.write('ready\\n')
+    sys.stdout.flush()
+    time.sleep(60)
+finally:
+    pool.close()
+'''
+
+
+class TestXvfbRunDisplays(unittest.TestCase):
+    def test_serial(self):
+        displays = xvfb.XvfbRunDisplays(1)
+        display = displays.acquire()
+
+        command, env = displays.prepare(display, ['./wpt', 'run'], {})
+
+        self.assertEqual(
+            command, ['xvfb-run', '--auto-servernum', './wpt', 'run']
+        )
+        self.assertEqual(env, {})
+
+    def test_parallel(self):
+        displays = xvfb.XvfbRunDisplays(2, base=100, spacing=10)
+
+        first = displays.acquire()
+        second = displays.acquire()
+
+        self.assertEqual((first, second), (100, 110))
+
+        command, _ = displays.prepare(second, ['./wpt'], {})
+
+        self.assertEqual(
+            command,
+            ['xvfb-run', '--auto-servernum', '--server-num=110', './wpt']
+        )
+
+        displays.release(first)
+
+        self.assertEqual(displays.acquire(), 100)
+
+
+class TestXvfbPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.env = mock.patch.dict(
+            os.environ, {'XVFB_STUB_TMP_DIR': self.tmp_dir}
+        )
+        self.env.start()
+        self.pool = xvfb.XvfbPool(
+            2, base=50, xvfb_binary=xvfb_stub, tmp_dir=self.tmp_dir
+        )
+
+    def tearDown(self):
+        self.pool.close()
+        self.env.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def lock_path(self, display):
+        return os.path.join(self.tmp_dir, '.X%s-lock' % display)
+
+    def write_lock(self, display, pid):
+        with open(self.lock_path(display), 'w') as handle:
+            handle.write('%10d\n' % pid)
+
+    def test_start_and_acquire(self):
+        self.pool.start()
+
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+
+        self.assertEqual(sorted([first, second]), [50, 51])
+        self.assertTrue(self.pool.is_healthy(first))
+        self.assertTrue(self.pool.is_healthy(second))
+
+        command, env = self.pool.prepare(first, ['./wpt'], {'A': 'b'})
+
+        self.assertEqual(command, ['./wpt'])
+        self.assertEqual(env, {'A': 'b', 'DISPLAY': ':%s' % first})
+
+    def test_skips_locked_displays(self):
+        self.write_lock(50, os.getpid())
+
+        self.pool.start()
+
+        displays = sorted([self.pool.acquire(), self.pool.acquire()])
+
+        self.assertEqual(displays, [51, 52])
+        self.assertTrue(os.path.exists(self.lock_path(50)))
+
+    def test_removes_stale_locks(self):
+        # Process IDs are bounded by /proc/sys/kernel/pid_max, so this one
+        # cannot belong to a running process.
+        self.write_lock(50, 2 ** 23)
+
+        self.pool.start()
+
+        displays = sorted([self.pool.acquire(), self.pool.acquire()])
+
+        self.assertEqual(displays, [50, 51])
+
+    def test_restarts_unhealthy_server(self):
+        self.pool.start()
+
+        for process in self.pool._servers.values():
+            os.kill(process.pid, signal.SIGKILL)
+            process.wait()
+
+        display = self.pool.acquire()
+
+        self.assertTrue(self.pool.is_healthy(display))
+
+    def test_restarts_on_free_display(self):
+        self.pool.start()
+
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.pool.release(second)
+
+        # The server dies and another X server takes its display
+        process = self.pool._servers[first]
+        os.kill(process.pid, signal.SIGKILL)
+        process.wait()
+        self.write_lock(first, os.getpid())
+        self.pool.release(first)
+
+        self.assertEqual(self.pool.acquire(), second)
+        replacement = self.pool.acquire()
+
+        self.assertEqual(replacement, 52)
+        self.assertTrue(self.pool.is_healthy(replacement))
+        # The other server's lock file is left in place
+        with open(self.lock_path(first)) as handle:
+            self.assertEqual(int(handle.read()), os.getpid())
+
+    def test_close_removes_locks(self):
+        self.pool.start()
+
+        for process in self.pool._servers.values():
+            os.kill(process.pid, signal.SIGKILL)
+            process.wait()
+
+        self.pool.close()
+
+        self.assertFalse(os.path.exists(self.lock_path(50)))
+        self.assertFalse(os.path.exists(self.lock_path(51)))
+
+    def test_display_taken(self):
+        # Another X server takes the display between the check and the start
+        # of the pool's server
+        self.write_lock(50, os.getpid())
+        socket_path = os.path.join(self.tmp_dir, '.X11-unix', 'X50')
+        os.makedirs(os.path.dirname(socket_path))
+        open(socket_path, 'w').close()
+
+        with mock.patch.object(self.pool, '_is_free', return_value=True):
+            self.pool.start()
+
+        displays = sorted([self.pool.acquire(), self.pool.acquire()])
+
+        self.assertEqual(displays, [51, 52])
+        # The other server's files are left in place
+        self.assertTrue(os.path.exists(self.lock_path(50)))
+        self.assertTrue(os.path.exists(socket_path))
+
+    def test_terminated(self):
+        process = subprocess.Popen(
+            [sys.executable, '-c', POOL_PROCESS, xvfb_stub, self.tmp_dir],
+            cwd=here, stdout=subprocess.PIPE
+        )
+        self.assertEqual(process.stdout.readline(), 'ready\n')
+        self.assertTrue(os.path.exists(self.lock_path(50)))
+
+        start = time.time()
+        process.send_signal(signal.SIGTERM)
+
+        self.assertEqual(process.wait(), 128 + signal.SIGTERM)
+        self.assertLess(time.time() - start, 30)
+        self.assertFalse(os.path.exists(self.lock_path(50)))
+        self.assertFalse(os.path.exists(self.lock_path(51)))
+
+    def test_failed_start(self):
+        pool = xvfb.XvfbPool(
+            1, base=50, xvfb_binary='false', tmp_dir=self.tmp_dir
+        )
+
+        with self.assertRaises(xvfb.DisplayError):
+            pool.start()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,6 +34,7 @@ type Browser struct {
 	OSName          string `json:"os_name"`
 	OSVersion       string `json:"os_version"`
 	Sauce           bool   `json:"sauce"`
+	Headless        bool   `json:"headless"`
 }
 
 // Token is used for test result uploads.